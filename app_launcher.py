@@ -6,8 +6,11 @@ This script starts the Streamlit app in a way suitable for packaging
 
 import sys
 import os
+import multiprocessing
 import threading
 import time
+import urllib.error
+import urllib.request
 import webbrowser
 import subprocess
 import socket
@@ -22,6 +25,19 @@ else:
     app_dir = Path(__file__).parent
 sys.path.insert(0, str(app_dir))
 
+# Seconds to wait for the server's health endpoint before giving up on the browser
+STARTUP_TIMEOUT = 60
+# Launches to try if another process takes the chosen port before Streamlit binds it
+PORT_ATTEMPTS = 3
+# Ports already lost to another process, passed on when the launcher restarts itself
+TRIED_PORTS_ENV = 'PDF_PREFLIGHT_TRIED_PORTS'
+
+LAUNCH_TIME = time.monotonic()
+
+def log_phase(phase):
+    """Print how long after launch a startup phase completed"""
+    print(f"[startup] {phase} after {time.monotonic() - LAUNCH_TIME:.2f}s")
+
 def find_free_port():
     """Find a free port to run Streamlit on"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -30,27 +46,84 @@ def find_free_port():
         port = s.getsockname()[1]
     return port
 
+def choose_port(exclude):
+    """Try default port first, then find free port"""
+    preferred_ports = [8501, 8502, 8503]
+    for p in preferred_ports:
+        if p in exclude:
+            continue
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.bind(('localhost', p))
+                return p
+        except OSError:
+            continue
+    return find_free_port()
+
+def wait_until_ready(port, timeout=STARTUP_TIMEOUT):
+    """Poll Streamlit's health endpoint until it answers or time runs out"""
+    url = f"http://localhost:{port}/_stcore/health"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.1)
+    return False
+
+def open_browser_when_ready(port, ready):
+    """Open the browser as soon as the server is serving"""
+    if wait_until_ready(port):
+        ready.set()
+        log_phase("Server ready")
+        webbrowser.open(f'http://localhost:{port}')
+        log_phase("Browser opened")
+    else:
+        print(f"Server did not become ready within {STARTUP_TIMEOUT}s, open http://localhost:{port} manually")
+
+def restart_on_new_port(tried_ports):
+    """Start the launcher again in a fresh process, skipping ports already lost
+    
+    Streamlit cannot be started twice in one process, so a lost port means a restart.
+    """
+    os.environ[TRIED_PORTS_ENV] = ','.join(str(p) for p in sorted(tried_ports))
+    sys.stdout.flush()
+    if getattr(sys, 'frozen', False):
+        os.execv(sys.executable, [sys.executable])
+    os.execv(sys.executable, [sys.executable, str(Path(__file__).resolve())])
+
+def prewarm_analyzer():
+    """Start and warm the app's analyzer worker pool while the server starts
+    
+    The pool is looked up by its options in the process-wide registry, so the app's
+    first analysis finds the workers already running with everything imported.
+    """
+    try:
+        import main as app
+        from worker_pool import get_shared_pool
+        
+        app.IMAGE_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        pool = get_shared_pool(**app.analyzer_pool_options(app.DEFAULT_MEMORY_BUDGET_MB))
+        log_phase("Analyzer workers started")
+        pool.warm_up()
+        log_phase("Analyzer workers pre-warmed")
+    except Exception as e:
+        print(f"Analyzer pre-warm failed: {e}")
+
 def start_streamlit():
     """Start the Streamlit server"""
     try:
-        # Try default port first, then find free port
-        preferred_ports = [8501, 8502, 8503]
-        port = None
-        
-        for p in preferred_ports:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.bind(('localhost', p))
-                    port = p
-                    break
-            except OSError:
-                continue
-        
-        if port is None:
-            port = find_free_port()
+        threading.Thread(target=prewarm_analyzer, daemon=True).start()
         
         # Import after path is set
         import streamlit.web.cli as stcli
+        log_phase("Streamlit imported")
+        
+        tried_ports = {int(p) for p in os.environ.get(TRIED_PORTS_ENV, '').split(',') if p}
+        port = choose_port(tried_ports)
         
         # Streamlit arguments
         sys.argv = [
@@ -65,15 +138,20 @@ def start_streamlit():
             "--server.enableXsrfProtection=false"
         ]
         
-        # Start browser opening in background
-        browser_thread = threading.Thread(
-            target=lambda: (time.sleep(3), webbrowser.open(f'http://localhost:{port}')), 
-            daemon=True
-        )
+        # Open the browser once the server answers its health check
+        ready = threading.Event()
+        browser_thread = threading.Thread(target=open_browser_when_ready, args=(port, ready), daemon=True)
         browser_thread.start()
         
         print(f"Starting PDF Preflight Tool on port {port}...")
-        stcli.main()
+        try:
+            stcli.main()
+        except SystemExit as e:
+            # The port can be taken between choosing it and Streamlit binding it
+            if e.code and not ready.is_set() and len(tried_ports) + 1 < PORT_ATTEMPTS:
+                print(f"Could not start on port {port}, retrying on another port")
+                restart_on_new_port(tried_ports | {port})
+            raise
         
     except Exception as e:
         print(f"Error starting Streamlit: {e}")
@@ -82,6 +160,8 @@ def start_streamlit():
 
 def main():
     """Main application entry point"""
+    # Analyzer worker processes re-enter the frozen app executable
+    multiprocessing.freeze_support()
     start_streamlit()
 
 if __name__ == "__main__":
@@ -0,0 +1,400 @@
+import hashlib
+import logging
+import math
+import re
+
+import fitz
+
+logger = logging.getLogger(__name__)
+
+# One token, after optional whitespace; numbers must end at a delimiter to not swallow keywords
+_TOKEN = re.compile(rb"""
+    [\x00\t\n\x0c\r ]*
+    (?:
+        (?P<num>[+-]?(?:\d+\.?\d*|\.\d+))(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])
+      | (?P<name>/[^\x00\t\n\x0c\r ()<>\[\]{}/%]*)
+      | (?P<kw>[^\x00\t\n\x0c\r ()<>\[\]{}/%]+)
+      | (?P<str>\()
+      | (?P<dict><<|>>)
+      | (?P<hex><[^>]*>)
+      | (?P<array>[\[\]{}])
+      | (?P<comment>%[^\r\n]*)
+    )
+""", re.X)
+_STRING_DELIMITER = re.compile(rb'[()\\]')
+# End of inline image data: EI between whitespace and a delimiter or the end of the stream
+_INLINE_END = re.compile(rb'[\x00\t\n\x0c\r ]EI(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+
+# Inline image abbreviations (PDF 32000-1, tables 93 and 94)
+_INLINE_KEYS = {
+    'BPC': 'BitsPerComponent',
+    'CS': 'ColorSpace',
+    'D': 'Decode',
+    'DP': 'DecodeParms',
+    'F': 'Filter',
+    'H': 'Height',
+    'W': 'Width',
+    'IM': 'ImageMask',
+    'I': 'Interpolate',
+    'L': 'Length'
+}
+_INLINE_NAMES = {
+    'G': 'DeviceGray',
+    'RGB': 'DeviceRGB',
+    'CMYK': 'DeviceCMYK',
+    'I': 'Indexed',
+    'AHx': 'ASCIIHexDecode',
+    'A85': 'ASCII85Decode',
+    'LZW': 'LZWDecode',
+    'Fl': 'FlateDecode',
+    'RL': 'RunLengthDecode',
+    'CCF': 'CCITTFaxDecode',
+    'DCT': 'DCTDecode'
+}
+_DEVICE_CHANNELS = {'DeviceGray': 1, 'DeviceRGB': 3, 'DeviceCMYK': 4}
+
+_PATH_OPERATORS = {b'm': 2, b'l': 2, b'c': 6, b'v': 4, b'y': 4}
+_PAINT_OPERATORS = {b'n', b'f', b'F', b'f*', b'S', b's', b'B', b'B*', b'b', b'b*'}
+
+# Forms nested deeper than this are not followed (guards against reference cycles)
+MAX_FORM_DEPTH = 12
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+def _concat(first, second):
+    """Matrix applying ``first`` and then ``second`` (PDF row-vector convention)"""
+    a, b, c, d, e, f = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (
+        a * a2 + b * c2, a * b2 + b * d2,
+        c * a2 + d * c2, c * b2 + d * d2,
+        e * a2 + f * c2 + e2, e * b2 + f * d2 + f2
+    )
+
+def _transform_bbox(points, matrix):
+    """Bounding box of ``(x, y)`` points mapped through ``matrix``"""
+    a, b, c, d, e, f = matrix
+    xs = [x * a + y * c + e for x, y in points]
+    ys = [x * b + y * d + f for x, y in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def _intersect(first, second):
+    if first is None:
+        return second
+    return (max(first[0], second[0]), max(first[1], second[1]), min(first[2], second[2]), min(first[3], second[3]))
+
+def _operand_numbers(operands, count):
+    """The last ``count`` operands if they are all numbers, else None"""
+    values = operands[-count:]
+    if len(values) == count and all(type(value) is float for value in values):
+        return tuple(values)
+    return None
+
+def _numbers(value, count):
+    """Parse an array value from ``xref_get_key`` into ``count`` floats, or None"""
+    numbers = re.findall(r'[+-]?(?:\d+\.?\d*|\.\d+)', value)
+    return tuple(float(number) for number in numbers[:count]) if len(numbers) >= count else None
+
+class ImageDraw:
+    """One image painted on a page, as found by :func:`walk_image_draws`
+    
+    ``matrix`` maps the image's unit square to page coordinates (the same space as
+    ``fitz.Page.rect``) and ``rect`` is that square's bounding box. ``clip`` is the
+    clipping area in force when the image was drawn, or None if nothing clips it.
+    XObject images have an ``xref``; inline images have ``xref`` None and carry
+    their ``inline_dict`` (keys spelled out in full) and ``inline_data``.
+    """
+    
+    __slots__ = ('xref', 'name', 'matrix', 'rect', 'clip', 'inline_dict', 'inline_data', 'referencer')
+    
+    def __init__(self, xref, name, matrix, clip, referencer, inline_dict=None, inline_data=None):
+        self.xref = xref
+        self.name = name
+        self.matrix = fitz.Matrix(matrix)
+        self.rect = fitz.Rect(_transform_bbox(((0, 0), (1, 0), (0, 1), (1, 1)), matrix))
+        self.clip = fitz.Rect(clip) if clip is not None else None
+        self.referencer = referencer
+        self.inline_dict = inline_dict
+        self.inline_data = inline_data
+    
+    @property
+    def placed_size(self):
+        """Placed width and height in points along the image's own axes (rotation and skew aware)"""
+        a, b, c, d, _, _ = self.matrix
+        return math.hypot(a, b), math.hypot(c, d)
+    
+    @property
+    def visible_rect(self):
+        """The part of ``rect`` inside the clip, or None when the clip does not cut it"""
+        if self.clip is None or self.clip.contains(self.rect):
+            return None
+        visible = self.rect & self.clip
+        return visible if visible.is_valid and not visible.is_empty else fitz.Rect()
+    
+    @property
+    def inline_key(self):
+        """Identity of an inline image by its dictionary and data, for per-image caches"""
+        digest = hashlib.blake2b(repr(sorted(self.inline_dict.items())).encode(), digest_size=16)
+        digest.update(self.inline_data)
+        return f"inline:{digest.hexdigest()}"
+    
+    def inline_header(self):
+        """Width, height, bits per component, filters and colorspace of an inline image"""
+        info = self.inline_dict
+        filters = info.get('Filter') or []
+        colorspace = info.get('ColorSpace')
+        if info.get('ImageMask'):
+            colorspace = 'ImageMask'
+        return {
+            'width': int(info.get('Width', 0)),
+            'height': int(info.get('Height', 0)),
+            'bit_depth': int(info.get('BitsPerComponent', 1 if info.get('ImageMask') else 8)),
+            'filters': filters if isinstance(filters, list) else [filters],
+            'colorspace': colorspace
+        }
+
+class _Walker:
+    """Interpret the graphics-state operators of a page's content, recording image draws"""
+    
+    def __init__(self, doc, page):
+        self.doc = doc
+        self.page = page
+        # Image and form names by the xref of the object whose resources define them (0: the page)
+        self.images = {}
+        for img in page.get_images(full=True):
+            self.images.setdefault(img[9], {})[img[7]] = img[0]
+        self.forms = {}
+        for xobject in page.get_xobjects():
+            self.forms.setdefault(xobject[2], {})[xobject[1]] = xobject[0]
+        self.draws = []
+        self.active_forms = set()
+        
+        self.ctm = tuple(page.transformation_matrix)
+        self.clip = None
+        self.stack = []
+        self.path = []
+        self.clip_pending = False
+    
+    def walk(self, content, referencer=0, depth=0):
+        data = content
+        pos = 0
+        end = len(data)
+        operands = []
+        stack_depth = len(self.stack)
+        
+        while pos < end:
+            match = _TOKEN.match(data, pos)
+            if match is None:
+                # Stray delimiter or trailing whitespace
+                pos += 1
+                continue
+            pos = match.end()
+            kind = match.lastgroup
+            
+            if kind == 'num':
+                operands.append(float(match.group('num')))
+            elif kind == 'name':
+                operands.append(match.group('name'))
+            elif kind == 'str':
+                pos = self._skip_string(data, pos)
+                operands.append(None)
+            elif kind == 'kw':
+                operator = match.group('kw')
+                if operator == b'BI':
+                    pos = self._inline_image(data, pos, referencer)
+                else:
+                    self._operator(operator, operands, referencer, depth)
+                operands = []
+            elif kind in ('dict', 'hex', 'array'):
+                operands.append(None)
+        
+        # Unbalanced q inside a form must not leak into its caller
+        del self.stack[stack_depth:]
+    
+    def _skip_string(self, data, pos):
+        """Skip a literal string body, honoring nesting and escapes"""
+        depth = 1
+        while depth:
+            match = _STRING_DELIMITER.search(data, pos)
+            if match is None:
+                return len(data)
+            char = match.group()
+            pos = match.end()
+            if char == b'\\':
+                pos += 1
+            elif char == b'(':
+                depth += 1
+            else:
+                depth -= 1
+        return pos
+    
+    def _operator(self, operator, operands, referencer, depth):
+        if operator == b'q':
+            self.stack.append((self.ctm, self.clip))
+        elif operator == b'Q':
+            if self.stack:
+                self.ctm, self.clip = self.stack.pop()
+        elif operator == b'cm':
+            values = _operand_numbers(operands, 6)
+            if values:
+                self.ctm = _concat(values, self.ctm)
+        elif operator in _PATH_OPERATORS:
+            values = _operand_numbers(operands, _PATH_OPERATORS[operator])
+            if values:
+                self.path.extend(zip(values[::2], values[1::2]))
+        elif operator == b're':
+            values = _operand_numbers(operands, 4)
+            if values:
+                x, y, w, h = values
+                self.path.extend(((x, y), (x + w, y), (x, y + h), (x + w, y + h)))
+        elif operator in (b'W', b'W*'):
+            self.clip_pending = True
+        elif operator in _PAINT_OPERATORS:
+            if self.clip_pending and self.path:
+                self.clip = _intersect(self.clip, _transform_bbox(self.path, self.ctm))
+            self.path = []
+            self.clip_pending = False
+        elif operator == b'Do':
+            if operands and isinstance(operands[-1], bytes):
+                self._do(operands[-1][1:].decode('latin-1'), referencer, depth)
+    
+    def _do(self, name, referencer, depth):
+        xref = self.images.get(referencer, {}).get(name)
+        if xref:
+            self.draws.append(ImageDraw(xref, name, self.ctm, self.clip, referencer))
+            return
+        
+        form = self.forms.get(referencer, {}).get(name)
+        if not form or form in self.active_forms or depth >= MAX_FORM_DEPTH:
+            return
+        content = self.doc.xref_stream(form) or b''
+        # A form without its own resources uses those of the content that paints it
+        resources = form if self.doc.xref_get_key(form, "Resources")[0] != 'null' else referencer
+        if resources not in self.images and resources not in self.forms and b'BI' not in content:
+            # Nothing in this form can paint an image
+            return
+        
+        saved = (self.ctm, self.clip)
+        matrix = _numbers(self.doc.xref_get_key(form, "Matrix")[1], 6) or _IDENTITY
+        self.ctm = _concat(matrix, self.ctm)
+        bbox = _numbers(self.doc.xref_get_key(form, "BBox")[1], 4)
+        if bbox:
+            corners = ((bbox[0], bbox[1]), (bbox[2], bbox[1]), (bbox[0], bbox[3]), (bbox[2], bbox[3]))
+            self.clip = _intersect(self.clip, _transform_bbox(corners, self.ctm))
+        
+        self.active_forms.add(form)
+        try:
+            self.walk(content, resources, depth + 1)
+        finally:
+            self.active_forms.discard(form)
+            self.ctm, self.clip = saved
+            self.path = []
+            self.clip_pending = False
+    
+    def _read_object(self, data, pos):
+        """Parse one object of an inline image dictionary; returns ``(value, pos)``"""
+        match = _TOKEN.match(data, pos)
+        if match is None:
+            return None, len(data)
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'num':
+            text = match.group('num')
+            return (float(text) if b'.' in text else int(text)), pos
+        if kind == 'name':
+            return match.group('name')[1:].decode('latin-1'), pos
+        if kind == 'kw':
+            word = match.group('kw')
+            return {b'true': True, b'false': False}.get(word, word.decode('latin-1')), pos
+        if kind == 'str':
+            start = pos
+            pos = self._skip_string(data, pos)
+            return data[start:pos - 1], pos
+        if kind == 'hex':
+            return bytes.fromhex(re.sub(rb'[^0-9A-Fa-f]', b'', match.group('hex')[1:-1]).decode()), pos
+        if kind == 'array' and match.group('array') == b'[':
+            values = []
+            while True:
+                closing = _TOKEN.match(data, pos)
+                if closing is None or closing.group('array') == b']':
+                    return values, closing.end() if closing else len(data)
+                value, pos = self._read_object(data, pos)
+                values.append(value)
+        if kind == 'dict' and match.group('dict') == b'<<':
+            values = {}
+            while True:
+                closing = _TOKEN.match(data, pos)
+                if closing is None or closing.group('dict') == b'>>':
+                    return values, closing.end() if closing else len(data)
+                key, pos = self._read_object(data, pos)
+                values[key], pos = self._read_object(data, pos)
+        return None, pos
+    
+    def _inline_image(self, data, pos, referencer):
+        """Record a BI ... ID ... EI inline image; returns the position after EI"""
+        info = {}
+        while True:
+            match = _TOKEN.match(data, pos)
+            if match is None:
+                return len(data)
+            if match.group('kw') == b'ID':
+                pos = match.end() + 1  # A single whitespace byte separates ID from the data
+                break
+            key, pos = self._read_object(data, pos)
+            value, pos = self._read_object(data, pos)
+            key = _INLINE_KEYS.get(key, key)
+            info[key] = value
+        
+        # Abbreviated names only stand for colorspaces and filters, alone or in arrays;
+        # elsewhere they mean something else (/I is also the Interpolate key)
+        for key in ('ColorSpace', 'Filter'):
+            if isinstance(info.get(key), str):
+                info[key] = _INLINE_NAMES.get(info[key], info[key])
+            elif isinstance(info.get(key), list):
+                info[key] = [_INLINE_NAMES.get(value, value) if isinstance(value, str) else value for value in info[key]]
+        
+        end = self._inline_data_end(data, pos, info)
+        draw = ImageDraw(
+            None, None, self.ctm, self.clip, referencer,
+            inline_dict=info, inline_data=bytes(data[pos:end])
+        )
+        self.draws.append(draw)
+        
+        after = _INLINE_END.search(data, end)
+        return after.end() if after else len(data)
+    
+    def _inline_data_end(self, data, pos, info):
+        """Where inline image data ends: from its declared or computable length, else before EI"""
+        length = info.get('Length')
+        if length is None and not info.get('Filter'):
+            colorspace = info.get('ColorSpace')
+            if info.get('ImageMask') or (isinstance(colorspace, list) and colorspace[:1] == ['Indexed']):
+                channels = 1
+            else:
+                channels = _DEVICE_CHANNELS.get(colorspace) if isinstance(colorspace, str) else None
+            if channels:
+                row = (int(info.get('Width', 0)) * channels * int(info.get('BitsPerComponent', 8)) + 7) // 8
+                length = row * int(info.get('Height', 0))
+        
+        if isinstance(length, int) and _INLINE_END.match(data, pos + length) is not None:
+            return pos + length
+        found = _INLINE_END.search(data, pos)
+        return found.start() if found else len(data)
+
+def walk_image_draws(doc, page):
+    """List every image painted on ``page`` in drawing order, in one pass over its content
+    
+    Covers image XObjects, images painted by (nested) Form XObjects and inline images,
+    each with the transformation and clip in force when it was drawn. Images inside
+    patterns, Type 3 glyphs and annotations are not included.
+    """
+    walker = _Walker(doc, page)
+    content = page.read_contents()
+    if not walker.images and b'BI' not in content and not walker.forms:
+        return []
+    
+    try:
+        walker.walk(content)
+    except Exception as e:
+        logger.warning(f"Could not interpret content of page {page.number + 1}: {str(e)}")
+    return walker.draws
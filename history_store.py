@@ -0,0 +1,232 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from utils import placement_passes
+
+def _timestamp(value):
+    """Accept datetimes or Unix timestamps for date filters"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+class AnalysisHistory:
+    """Persistent history of analyzed documents and their placements
+    
+    Results are queued by :meth:`record` and written by a background thread in
+    batched transactions, so recording costs the analysis almost nothing. Placements
+    are indexed for the usual preflight questions: by status and date, by color mode
+    and visible DPI, and by file hash. Queries see a recorded result once it has
+    been written, at most ``flush_interval`` seconds later (see :meth:`flush`).
+    """
+    
+    def __init__(self, path, batch_size=5000, flush_interval=2.0):
+        self.logger = logging.getLogger(__name__)
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                file_hash TEXT,
+                filename TEXT NOT NULL,
+                analyzed_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                total_pages INTEGER,
+                total_placements INTEGER,
+                failing_placements INTEGER,
+                min_dpi REAL,
+                preferred_modes TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_file_hash ON documents (file_hash);
+            CREATE INDEX IF NOT EXISTS documents_analyzed_at ON documents (analyzed_at);
+            CREATE INDEX IF NOT EXISTS documents_status ON documents (status, analyzed_at);
+            
+            CREATE TABLE IF NOT EXISTS placements (
+                document_id INTEGER NOT NULL REFERENCES documents (id),
+                file_hash TEXT,
+                analyzed_at REAL NOT NULL,
+                page INTEGER,
+                image_number INTEGER,
+                xref INTEGER,
+                width INTEGER,
+                height INTEGER,
+                placed_width_in REAL,
+                placed_height_in REAL,
+                visible_dpi REAL,
+                metadata_dpi REAL,
+                color_mode TEXT,
+                format TEXT,
+                file_size INTEGER,
+                status TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS placements_document ON placements (document_id);
+            CREATE INDEX IF NOT EXISTS placements_file_hash ON placements (file_hash);
+            CREATE INDEX IF NOT EXISTS placements_status_date ON placements (status, analyzed_at);
+            CREATE INDEX IF NOT EXISTS placements_mode_dpi ON placements (color_mode, visible_dpi);
+        """)
+        self._conn.commit()
+        
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+    
+    def record(self, result, filename, min_dpi, preferred_modes, analyzed_at=None, ink_limit=None):
+        """Queue an analysis result for writing; returns immediately"""
+        analyzed_at = _timestamp(analyzed_at) or time.time()
+        images = result.get('images', [])
+        
+        placements = []
+        for img in images:
+            passes = placement_passes(img, min_dpi, preferred_modes, ink_limit)
+            placements.append((
+                result.get('file_hash'), analyzed_at, img.get('page'), img.get('image_number'),
+                img.get('xref'), img.get('width'), img.get('height'),
+                img.get('placed_width_in'), img.get('placed_height_in'),
+                img.get('visible_dpi'), img.get('metadata_dpi'), img.get('color_mode'),
+                img.get('format'), img.get('file_size'), 'pass' if passes else 'fail'
+            ))
+        
+        failing = sum(1 for placement in placements if placement[-1] == 'fail')
+        if result.get('partial'):
+            status = 'partial'
+        elif result.get('error'):
+            status = 'error'
+        else:
+            status = 'fail' if failing else 'pass'
+        
+        document = (
+            result.get('file_hash'), filename, analyzed_at, status, result.get('total_pages'),
+            len(placements), failing, min_dpi, json.dumps(list(preferred_modes)), result.get('error')
+        )
+        self._queue.put((document, placements))
+    
+    def flush(self):
+        """Wait until everything recorded so far has been written"""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+    
+    def _write_loop(self):
+        """Background writer: commit queued documents in batches"""
+        pending = []
+        pending_rows = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            
+            if isinstance(item, tuple):
+                pending.append(item)
+                pending_rows += 1 + len(item[1])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if pending_rows < self.batch_size:
+                    continue
+            
+            if pending:
+                self._write_batch(pending)
+                pending = []
+                pending_rows = 0
+            deadline = None
+            
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item == 'stop':
+                return
+    
+    def _write_batch(self, batch):
+        """Insert a batch of documents and their placements in one transaction"""
+        try:
+            with self._lock, self._conn:
+                for document, placements in batch:
+                    cursor = self._conn.execute(
+                        "INSERT INTO documents (file_hash, filename, analyzed_at, status, total_pages, "
+                        "total_placements, failing_placements, min_dpi, preferred_modes, error) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        document
+                    )
+                    document_id = cursor.lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO placements (document_id, file_hash, analyzed_at, page, image_number, "
+                        "xref, width, height, placed_width_in, placed_height_in, visible_dpi, metadata_dpi, "
+                        "color_mode, format, file_size, status) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(document_id,) + placement for placement in placements]
+                    )
+        except Exception as e:
+            self.logger.error(f"Could not write {len(batch)} documents to history: {str(e)}")
+    
+    def query_placements(self, status=None, color_mode=None, min_dpi=None, max_dpi=None,
+                         since=None, until=None, file_hash=None, limit=1000):
+        """Placements matching all given filters, newest first, joined with their document
+        
+        ``max_dpi`` is exclusive (visible DPI under the value); ``since`` and ``until``
+        accept datetimes or Unix timestamps.
+        """
+        conditions = []
+        params = []
+        for clause, value in (
+            ("p.status = ?", status),
+            ("p.color_mode = ?", color_mode),
+            ("p.visible_dpi >= ?", min_dpi),
+            ("p.visible_dpi < ?", max_dpi),
+            ("p.analyzed_at >= ?", _timestamp(since)),
+            ("p.analyzed_at < ?", _timestamp(until)),
+            ("p.file_hash = ?", file_hash)
+        ):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query(
+            f"SELECT d.filename, p.* FROM placements p JOIN documents d ON d.id = p.document_id "
+            f"{where} ORDER BY p.analyzed_at DESC LIMIT ?",
+            params + [limit]
+        )
+    
+    def query_documents(self, status=None, since=None, until=None, file_hash=None, limit=100):
+        """Recorded documents matching all given filters, newest first"""
+        conditions = []
+        params = []
+        for clause, value in (
+            ("status = ?", status),
+            ("analyzed_at >= ?", _timestamp(since)),
+            ("analyzed_at < ?", _timestamp(until)),
+            ("file_hash = ?", file_hash)
+        ):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query(f"SELECT * FROM documents {where} ORDER BY analyzed_at DESC LIMIT ?", params + [limit])
+    
+    def _query(self, sql, params):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    def close(self):
+        """Write anything still queued and close the database"""
+        self._queue.put('stop')
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Hot folder watcher for PDF Preflight Tool
+Picks up PDFs dropped into a folder once they have finished copying, analyzes them
+on the worker pool and writes a JSON report next to each file, or moves file and
+report into pass/ and fail/ subfolders.
+
+    python hot_folder.py /Volumes/Prepress/Incoming
+    python hot_folder.py Incoming --sort --min-dpi 300 --modes CMYK Grayscale
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import signal
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from utils import exceeds_ink_limit, placement_passes
+
+logger = logging.getLogger(__name__)
+
+# Seconds a file's size and modification time must stay unchanged before it is analyzed
+SETTLE_SECONDS = 5
+
+# Seconds between folder scans when polling
+POLL_INTERVAL = 2.0
+
+# Seconds between safety rescans with inotify, which misses writes from other hosts on shared mounts
+RESCAN_INTERVAL = 30.0
+
+# A file is given up on after this many interrupted analyses or failed reads (e.g. the watcher was killed)
+MAX_ATTEMPTS = 3
+
+# Seconds before a file that could not be read is tried again
+READ_RETRY_SECONDS = 30.0
+
+PASS_DIR = 'pass'
+FAIL_DIR = 'fail'
+REPORT_SUFFIX = '.preflight.json'
+LEDGER_NAME = '.preflight_ledger.sqlite'
+
+# Shared with the Streamlit app
+DATA_DIR = Path.home() / ".pdf_preflight"
+
+class _InotifyWatch:
+    """Wake up on new or rewritten files in one folder through inotify (Linux)
+    
+    Events are only used as a hint to rescan early, so nothing is lost when the
+    kernel queue overflows.
+    """
+    
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    
+    method = 'inotify'
+    idle_interval = RESCAN_INTERVAL
+    
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # AttributeError where the C library has no inotify
+        init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        
+        self._fd = init(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if add_watch(self._fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"Cannot watch {folder}")
+    
+    def wait(self, timeout):
+        """Block until a file event or ``timeout`` seconds"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self._fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+    
+    def close(self):
+        os.close(self._fd)
+
+class _PollingWatch:
+    """Fallback that simply sleeps between scans"""
+    
+    method = 'polling'
+    
+    def __init__(self, interval=POLL_INTERVAL):
+        self.idle_interval = interval
+    
+    def wait(self, timeout):
+        time.sleep(timeout)
+    
+    def close(self):
+        pass
+
+def open_watch(folder, use_inotify=True, poll_interval=POLL_INTERVAL):
+    """inotify where the platform has it, polling otherwise"""
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return _InotifyWatch(folder)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable, polling {folder} instead: {str(e)}")
+    return _PollingWatch(poll_interval)
+
+class ProcessedLedger:
+    """SQLite record of the files a watcher has handled, so a restart skips them
+    
+    Files are identified by path, size and modification time, so a file dropped
+    again under the same name with new content is analyzed again. Rows left in the
+    'processing' state by an interrupted run are retried up to ``MAX_ATTEMPTS`` times.
+    """
+    
+    def __init__(self, path):
+        self.path = str(path)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                report TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (path, size, mtime_ns)
+            );
+        """)
+        self._conn.commit()
+    
+    def handled(self, path, signature):
+        """Whether the file with this ``(size, mtime_ns)`` signature needs no further work"""
+        row = self._conn.execute(
+            "SELECT status FROM files WHERE path = ? AND size = ? AND mtime_ns = ?", (path, *signature)
+        ).fetchone()
+        return row is not None and row[0] != 'processing'
+    
+    def start(self, path, signature):
+        """Mark a file as being analyzed; returns how many attempts this makes"""
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO files (path, size, mtime_ns, status, attempts, updated_at) "
+                "VALUES (?, ?, ?, 'processing', 1, ?) "
+                "ON CONFLICT (path, size, mtime_ns) DO UPDATE SET "
+                "status = 'processing', attempts = attempts + 1, updated_at = excluded.updated_at",
+                (path, *signature, time.time())
+            )
+        return self._conn.execute(
+            "SELECT attempts FROM files WHERE path = ? AND size = ? AND mtime_ns = ?", (path, *signature)
+        ).fetchone()[0]
+    
+    def finish(self, path, signature, status, report=None):
+        """Record the outcome of a file"""
+        with self._conn:
+            self._conn.execute(
+                "UPDATE files SET status = ?, report = ?, updated_at = ? "
+                "WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (status, report, time.time(), path, *signature)
+            )
+    
+    def close(self):
+        self._conn.close()
+
+def build_report(result, filename, min_dpi, preferred_modes, ink_limit):
+    """Summarize an analysis result as a JSON-serializable preflight report"""
+    failing = []
+    for img in result.get('images', []):
+        if placement_passes(img, min_dpi, preferred_modes, ink_limit):
+            continue
+        reasons = []
+        if not img.get('visible_dpi') or img['visible_dpi'] < min_dpi:
+            reasons.append('resolution')
+        if img.get('color_mode') not in preferred_modes:
+            reasons.append('color_space')
+        if exceeds_ink_limit(img, ink_limit):
+            reasons.append('ink_limit')
+        failing.append({
+            'page': img.get('page'),
+            'image_number': img.get('image_number'),
+            'xref': img.get('xref'),
+            'visible_dpi': img.get('visible_dpi'),
+            'color_mode': img.get('color_mode'),
+            'tac_p99': img.get('tac_p99'),
+            'reasons': reasons,
+            'error': img.get('error')
+        })
+    
+    if result.get('partial'):
+        status = 'partial'
+    elif result.get('error'):
+        status = 'error'
+    else:
+        status = 'fail' if failing else 'pass'
+    
+    return {
+        'filename': filename,
+        'file_hash': result.get('file_hash'),
+        'status': status,
+        'analyzed_at': datetime.now(timezone.utc).isoformat(),
+        'error': result.get('error'),
+        'total_pages': result.get('total_pages'),
+        'analyzed_pages': len(result.get('analyzed_pages', [])),
+        'total_placements': len(result.get('images', [])),
+        'failing_placements': failing,
+        'criteria': {
+            'min_dpi': min_dpi,
+            'preferred_modes': list(preferred_modes),
+            'ink_limit': ink_limit
+        }
+    }
+
+def _free_path(path):
+    """``path``, or the first ``name (n).ext`` next to it that does not exist yet"""
+    candidate = path
+    number = 2
+    while candidate.exists():
+        candidate = path.with_name(f"{path.stem} ({number}){path.suffix}")
+        number += 1
+    return candidate
+
+class HotFolderWatcher:
+    """Analyze PDFs dropped into ``folder`` once their size has settled
+    
+    Ready files are analyzed on an ``AnalyzerPool``, at most ``max_concurrent`` at a
+    time, so only that many documents are held in memory at once. Each
+    gets a JSON report next to it, or with ``sort_results`` file and report are moved
+    into the pass/ or fail/ subfolder (failed, partial and unreadable files go to
+    fail/). Handled files are kept in a :class:`ProcessedLedger`; to re-run a file
+    that is still in the folder, touch it.
+    """
+    
+    def __init__(self, folder, pool, min_dpi=300, preferred_modes=('CMYK',), ink_limit=300,
+                 sort_results=False, settle_seconds=SETTLE_SECONDS, max_concurrent=None,
+                 wall_timeout=None, ledger_path=None, history=None):
+        self.logger = logging.getLogger(__name__)
+        self.folder = Path(folder).resolve()
+        self.pool = pool
+        self.min_dpi = min_dpi
+        self.preferred_modes = list(preferred_modes)
+        self.ink_limit = ink_limit
+        self.sort_results = sort_results
+        self.settle_seconds = settle_seconds
+        self.max_concurrent = max_concurrent or pool.worker_count
+        self.wall_timeout = wall_timeout
+        # Optional history_store.AnalysisHistory that also records every report
+        self.history = history
+        self.ledger = ProcessedLedger(ledger_path or self.folder / LEDGER_NAME)
+        # Files still settling: path -> (size, mtime_ns) and when that signature was first seen
+        self._settling = {}
+        
+        if sort_results:
+            for name in (PASS_DIR, FAIL_DIR):
+                (self.folder / name).mkdir(exist_ok=True)
+    
+    def scan(self):
+        """Return ``(path, signature)`` of files ready for analysis, oldest signature first"""
+        now = time.monotonic()
+        seen = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(('.', '~')) or not entry.name.lower().endswith('.pdf'):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed while scanning
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if not self.ledger.handled(entry.path, signature):
+                    seen[entry.path] = signature
+        
+        ready = []
+        for path, signature in seen.items():
+            previous = self._settling.get(path)
+            if previous is None or previous[0] != signature:
+                self._settling[path] = (signature, now)
+            elif signature[0] > 0 and now - previous[1] >= self.settle_seconds:
+                ready.append((previous[1], path, signature))
+        self._settling = {path: value for path, value in self._settling.items() if path in seen}
+        return [(path, signature) for _, path, signature in sorted(ready)]
+    
+    def next_wakeup(self, idle_interval):
+        """Seconds until the next scan could find a file settled"""
+        if not self._settling:
+            return idle_interval
+        now = time.monotonic()
+        settles_in = min(first_seen + self.settle_seconds - now for _, first_seen in self._settling.values())
+        return min(idle_interval, max(0.1, settles_in))
+    
+    def process(self, ready):
+        """Analyze ready files, and those that become ready meanwhile; returns their reports
+        
+        At most ``max_concurrent`` files are read and in progress at a time. Whenever
+        one finishes, the folder is scanned again and the pool is given the next
+        ready file, so the workers stay busy rather than waiting for the slowest
+        file of a batch.
+        """
+        signatures = {}
+        reports = []
+        
+        def more_jobs():
+            waiting = [(path, signature) for path, signature in self.scan() if path not in signatures]
+            return self._read_jobs(waiting, self.max_concurrent - len(signatures), signatures, reports)
+        
+        jobs = self._read_jobs(ready, self.max_concurrent, signatures, reports)
+        if not jobs:
+            return reports
+        
+        self.logger.info(f"Analyzing {len(jobs)} file(s)")
+        for path, result in self.pool.analyze(jobs, wall_timeout=self.wall_timeout, more_jobs=more_jobs):
+            reports.append(self._finish(path, signatures.pop(path), result))
+        return reports
+    
+    def _read_jobs(self, ready, limit, signatures, reports):
+        """Read up to ``limit`` ready files into pool jobs, recording their signatures
+        
+        Files that cannot be read or have given up add their report to ``reports``.
+        """
+        jobs = []
+        for path, signature in ready:
+            if len(jobs) >= limit:
+                break
+            try:
+                pdf_data = Path(path).read_bytes()
+                current = os.stat(path)
+            except OSError as e:
+                # Counted as an attempt, and not offered again until the retry delay has passed
+                attempts = self.ledger.start(path, signature)
+                if attempts >= MAX_ATTEMPTS:
+                    error = f"Could not read file after {attempts} attempts: {str(e)}"
+                    self.logger.error(f"{path}: {error}")
+                    reports.append(self._finish(path, signature, {'error': error, 'images': []}))
+                else:
+                    self.logger.warning(f"Could not read {path}, retrying in {READ_RETRY_SECONDS:.0f} s: {str(e)}")
+                    self._settling[path] = (signature, time.monotonic() + READ_RETRY_SECONDS)
+                continue
+            if (current.st_size, current.st_mtime_ns) != signature:
+                continue  # Written to again, it settles anew on the next scan
+            
+            attempts = self.ledger.start(path, signature)
+            if attempts > MAX_ATTEMPTS:
+                error = f"Gave up after {MAX_ATTEMPTS} interrupted analyses"
+                self.logger.error(f"{path}: {error}")
+                reports.append(self._finish(path, signature, {'error': error, 'images': []}))
+                continue
+            jobs.append((path, pdf_data, {}))
+            signatures[path] = signature
+        return jobs
+    
+    def _finish(self, path, signature, result):
+        """Write the report, sort the file and record it in the ledger"""
+        source = Path(path)
+        report = build_report(result, source.name, self.min_dpi, self.preferred_modes, self.ink_limit)
+        
+        target = source
+        if self.sort_results:
+            destination = self.folder / (PASS_DIR if report['status'] == 'pass' else FAIL_DIR)
+            try:
+                target = _free_path(destination / source.name)
+                os.replace(source, target)
+            except OSError as e:
+                self.logger.warning(f"Could not move {source.name} to {destination.name}/: {str(e)}")
+                target = source
+        
+        report_path = target.with_name(target.stem + REPORT_SUFFIX)
+        try:
+            partial_path = report_path.with_name(report_path.name + '.tmp')
+            partial_path.write_text(json.dumps(report, indent=2), encoding='utf-8')
+            os.replace(partial_path, report_path)
+        except OSError as e:
+            self.logger.error(f"Could not write report for {source.name}: {str(e)}")
+            report_path = None
+        
+        if self.history is not None:
+            self.history.record(result, source.name, self.min_dpi, self.preferred_modes, ink_limit=self.ink_limit)
+        
+        self.ledger.finish(path, signature, report['status'], str(report_path) if report_path else None)
+        self._settling.pop(path, None)
+        self.logger.info(f"{source.name}: {report['status'].upper()}")
+        return report
+    
+    def run(self, use_inotify=True, poll_interval=POLL_INTERVAL):
+        """Watch the folder until interrupted"""
+        watch = open_watch(self.folder, use_inotify, poll_interval)
+        self.logger.info(f"Watching {self.folder} ({watch.method})")
+        try:
+            while True:
+                ready = self.scan()
+                if ready and self.process(ready):
+                    continue
+                # Ready files that could not be handled (unreadable, still changing) wait a poll interval
+                watch.wait(poll_interval if ready else self.next_wakeup(watch.idle_interval))
+        finally:
+            watch.close()
+    
+    def close(self):
+        self.ledger.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Preflight PDFs dropped into a hot folder")
+    parser.add_argument('folder', help="Folder to watch")
+    parser.add_argument('--min-dpi', type=float, default=300, help="Minimum visible DPI")
+    parser.add_argument('--modes', nargs='+', default=['CMYK'], help="Accepted color modes")
+    parser.add_argument('--ink-limit', type=float, default=300, help="Total ink limit in %% for CMYK images")
+    parser.add_argument('--sort', action='store_true', help="Move files and reports into pass/ and fail/")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is analyzed")
+    parser.add_argument('--poll', action='store_true', help="Poll instead of using inotify")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help="Seconds between polls")
+    parser.add_argument('--workers', type=int, help="Analyzer worker processes (default: sized to the machine)")
+    parser.add_argument('--max-concurrent', type=int, help="Files analyzed at once (default: one per worker)")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds allowed per file, 0 for none")
+    parser.add_argument('--memory-budget-mb', type=int, default=0, help="Per-image decode budget, 0 for none")
+    parser.add_argument('--history', action='store_true', help="Also record results in the app's analysis history")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Stop on SIGTERM as on Ctrl-C, so busy workers are killed and the ledger is closed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    
+    # PyMuPDF and the workers load only once the arguments are known to be valid
+    from worker_pool import AnalyzerPool
+    
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    memory_budget_bytes = args.memory_budget_mb * 1024 * 1024 if args.memory_budget_mb else None
+    history = None
+    if args.history:
+        from history_store import AnalysisHistory
+        history = AnalysisHistory(DATA_DIR / "history.sqlite")
+    
+    with AnalyzerPool(
+        workers=args.workers,
+        wall_timeout=args.timeout or None,
+        analyzer_options={
+            'image_index_path': str(DATA_DIR / "image_index.sqlite"),
+            'memory_budget_bytes': memory_budget_bytes
+        },
+        max_jobs_per_worker=50
+    ) as pool:
+        watcher = HotFolderWatcher(
+            args.folder, pool,
+            min_dpi=args.min_dpi,
+            preferred_modes=args.modes,
+            ink_limit=args.ink_limit,
+            sort_results=args.sort,
+            settle_seconds=args.settle,
+            max_concurrent=args.max_concurrent,
+            wall_timeout=args.timeout,
+            history=history
+        )
+        try:
+            watcher.run(use_inotify=not args.poll, poll_interval=args.poll_interval)
+        except KeyboardInterrupt:
+            logger.info("Stopped")
+        finally:
+            watcher.close()
+            if history is not None:
+                history.flush()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
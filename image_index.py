@@ -0,0 +1,198 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+# Most stores between eviction checks; each check counts the whole table
+EVICT_CHECK_INTERVAL = 100
+# Lookups between writes of the hit counters and last-used times, and the longest they wait
+LOOKUP_FLUSH_INTERVAL = 100
+LOOKUP_FLUSH_SECONDS = 5
+# Seconds stats() reuses the index size it last counted
+STATS_SIZE_MAX_AGE = 30
+
+class ImageFactIndex:
+    """Persistent cross-document index of decoded image facts
+    
+    Entries are keyed by a hash of an image's raw stream and dictionary, so any
+    document that embeds the same image gets its facts and preview without decoding
+    it again. The index is a SQLite file bounded by entry count and stored bytes;
+    the least recently used entries are evicted first. Several processes (the app
+    and its analyzer workers) can share one index file.
+    """
+    
+    def __init__(self, path, max_entries=100000, max_bytes=512 * 1024 * 1024):
+        self.logger = logging.getLogger(__name__)
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Small indexes are checked more often, within the 10% the eviction frees
+        self._check_interval = max(1, min(EVICT_CHECK_INTERVAL, max_entries // 10))
+        self._stores_since_check = 0
+        self._bytes_since_check = 0
+        # Counts and last-used times not yet written, so lookups stay read-only
+        self._pending = dict.fromkeys(('hits', 'misses', 'stores', 'evictions'), 0)
+        self._touched = {}
+        self._lookups_since_flush = 0
+        self._last_flush = time.monotonic()
+        self._size = None
+        
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                key TEXT PRIMARY KEY,
+                facts TEXT NOT NULL,
+                preview BLOB,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS images_last_used ON images (last_used)")
+        # Counters are kept in the file so that stats() covers every process using it
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        self._baseline = self._read_counters()
+    
+    def get(self, key):
+        """Return the stored facts for ``key``, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT facts FROM images WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._pending['misses'] += 1
+            else:
+                self._pending['hits'] += 1
+                self._touched[key] = time.time()
+            
+            self._lookups_since_flush += 1
+            if (self._lookups_since_flush >= LOOKUP_FLUSH_INTERVAL
+                    or time.monotonic() - self._last_flush >= LOOKUP_FLUSH_SECONDS):
+                self._flush()
+                self._conn.commit()
+            return json.loads(row[0]) if row else None
+    
+    def get_preview(self, handle):
+        """Return the preview bytes stored under a facts' ``preview_handle``"""
+        with self._lock:
+            row = self._conn.execute("SELECT preview FROM images WHERE key = ?", (handle,)).fetchone()
+        return row[0] if row else None
+    
+    def put(self, key, facts, preview=None):
+        """Store facts (JSON-serializable) and optional preview bytes under ``key``"""
+        facts_json = json.dumps(facts)
+        size = len(facts_json) + (len(preview) if preview else 0)
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (key, facts, preview, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, facts_json, preview, size, time.time())
+            )
+            self._pending['stores'] += 1
+            self._stores_since_check += 1
+            self._bytes_since_check += size
+            # Other processes write to the file too, so the size is counted rather than tracked
+            if (self._stores_since_check >= self._check_interval
+                    or self._bytes_since_check >= self.max_bytes // EVICT_CHECK_INTERVAL):
+                self._evict()
+                self._stores_since_check = 0
+                self._bytes_since_check = 0
+            # The store commits anyway, so pending lookups go with it
+            self._flush()
+            self._conn.commit()
+    
+    def _flush(self):
+        """Write pending counts and last-used times; the caller commits
+        
+        Between flushes another process may evict an entry this one has just used,
+        which only costs a decode.
+        """
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE images SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched = {}
+        for name, amount in self._pending.items():
+            if amount:
+                self._conn.execute(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                    (name, amount)
+                )
+                self._pending[name] = 0
+        self._lookups_since_flush = 0
+        self._last_flush = time.monotonic()
+    
+    def _read_counters(self):
+        counters = dict.fromkeys(('hits', 'misses', 'stores', 'evictions'), 0)
+        counters.update(self._conn.execute("SELECT name, value FROM counters").fetchall())
+        return counters
+    
+    def _evict(self):
+        """Drop least recently used entries once the index exceeds its bounds
+        
+        Checked every ``EVICT_CHECK_INTERVAL`` stores at most (or 1% of ``max_bytes``),
+        so the index can briefly overshoot its bounds. Eviction goes down to 90% of the
+        bounds so that it runs rarely rather than on every check of a full index.
+        """
+        # Pending last-used times first, so recently hit entries are kept
+        self._flush()
+        count, total_size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images").fetchone()
+        self._size = (count, total_size, time.monotonic())
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        
+        target_entries = int(self.max_entries * 0.9)
+        target_bytes = int(self.max_bytes * 0.9)
+        evicted = 0
+        while count > target_entries or total_size > target_bytes:
+            rows = self._conn.execute("SELECT key, size FROM images ORDER BY last_used LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if count <= target_entries and total_size <= target_bytes:
+                    break
+                self._conn.execute("DELETE FROM images WHERE key = ?", (key,))
+                count -= 1
+                total_size -= size
+                evicted += 1
+        
+        self._pending['evictions'] += evicted
+        self._size = (count, total_size, time.monotonic())
+        self.logger.debug(f"Evicted {evicted} entries from image index")
+    
+    def stats(self):
+        """Lookup statistics since this index was opened plus the index size
+        
+        The statistics include every process using the index file, such as the
+        analyzer workers of a pool, up to the lookups each has not yet written (at
+        most ``LOOKUP_FLUSH_INTERVAL`` or ``LOOKUP_FLUSH_SECONDS`` worth). The size is
+        recounted at most every ``STATS_SIZE_MAX_AGE`` seconds.
+        """
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+            if self._size is None or time.monotonic() - self._size[2] >= STATS_SIZE_MAX_AGE:
+                count, total_size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images"
+                ).fetchone()
+                self._size = (count, total_size, time.monotonic())
+            count, total_size, _ = self._size
+            counters = self._read_counters()
+        
+        stats = {name: value - self._baseline[name] for name, value in counters.items()}
+        stats['lookups'] = stats['hits'] + stats['misses']
+        stats['entries'] = count
+        stats['bytes'] = total_size
+        stats['hit_rate'] = (stats['hits'] / stats['lookups'] * 100) if stats['lookups'] else 0
+        return stats
+    
+    def close(self):
+        """Write pending counts and close the underlying database connection"""
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+            self._conn.close()
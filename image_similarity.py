@@ -0,0 +1,182 @@
+from functools import lru_cache
+from itertools import combinations
+
+# Hamming distance (of 64 bits) up to which two images count as near-duplicates
+DEFAULT_MAX_DISTANCE = 10
+
+# A variant is flagged when a near-duplicate has at least this many times its pixels
+DEFAULT_MIN_PIXEL_RATIO = 1.5
+
+@lru_cache(maxsize=None)
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis, so a 2-D transform is two matrix products"""
+    import numpy as np
+    
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    basis = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+def _to_hex(bits):
+    """Pack 64 booleans into a 16 digit hex string"""
+    import numpy as np
+    
+    return np.packbits(bits.ravel()).tobytes().hex()
+
+def perceptual_hashes(img):
+    """pHash and dHash of a PIL image, such as a preview thumbnail, as 16 digit hex strings
+    
+    pHash keeps the signs of the lowest 8x8 DCT frequencies of a 32x32 grayscale copy
+    against their median; dHash keeps the signs of horizontal gradients of a 9x8 copy.
+    Both survive resaving, rescaling and small edits, which change only a few bits.
+    """
+    import numpy as np
+    from PIL import Image
+    
+    gray = img.convert('L')
+    
+    pixels = np.asarray(gray.resize((32, 32), Image.Resampling.BILINEAR), dtype=np.float32)
+    dct = _dct_matrix(32)
+    low = (dct @ pixels @ dct.T)[:8, :8].ravel()
+    # The DC term is excluded from the median so flat images do not set every bit
+    phash_bits = low > np.median(low[1:])
+    
+    columns = np.asarray(gray.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    dhash_bits = columns[:, 1:] > columns[:, :-1]
+    
+    return {'phash': _to_hex(phash_bits), 'dhash': _to_hex(dhash_bits)}
+
+def hash_distance(a, b):
+    """Number of differing bits between two hashes given as ints"""
+    return (a ^ b).bit_count()
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits, max_flips):
+    """XOR masks of ``bits`` bits with at most ``max_flips`` bits set"""
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        masks.extend(sum(1 << bit for bit in chosen) for chosen in combinations(range(bits), flips))
+    return tuple(masks)
+
+class MultiIndexHash:
+    """Multi-index hashing of 64-bit hashes for Hamming radius searches
+    
+    Hashes are split into four 16-bit chunks, each indexed in its own table. Two hashes
+    within ``radius`` bits differ by at most ``radius // 4`` bits on at least one chunk
+    (pigeonhole), so a search looks up only the chunk values that close to the query's
+    in each table and checks the full distance of those candidates. With near-duplicate
+    radii that touches a few hundred buckets instead of every hash.
+    """
+    
+    CHUNKS = 4
+    CHUNK_BITS = 16
+    
+    def __init__(self):
+        self._keys = []
+        self._items = []
+        self._tables = [{} for _ in range(self.CHUNKS)]
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def _chunks(self, key):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(key >> (chunk * self.CHUNK_BITS)) & mask for chunk in range(self.CHUNKS)]
+    
+    def add(self, key, item):
+        """Add ``item`` under the integer hash ``key``"""
+        position = len(self._keys)
+        self._keys.append(key)
+        self._items.append(item)
+        for table, value in zip(self._tables, self._chunks(key)):
+            table.setdefault(value, []).append(position)
+    
+    def search(self, key, radius):
+        """Return ``(distance, item)`` for every item within ``radius`` bits of ``key``"""
+        masks = _flip_masks(self.CHUNK_BITS, radius // self.CHUNKS)
+        candidates = set()
+        for table, value in zip(self._tables, self._chunks(key)):
+            for mask in masks:
+                positions = table.get(value ^ mask)
+                if positions:
+                    candidates.update(positions)
+        
+        found = []
+        for position in candidates:
+            distance = hash_distance(self._keys[position], key)
+            if distance <= radius:
+                found.append((distance, self._items[position]))
+        return found
+
+def _distinct_images(results):
+    """One entry per distinct hashed image of each result, with the pages it is placed on"""
+    images = {}
+    for result in results:
+        filename = result.get('filename', '')
+        for img in result.get('images', []):
+            if not img.get('phash') or not img.get('dhash') or img.get('error'):
+                continue
+            key = (filename, img.get('preview_handle') or img.get('xref'))
+            entry = images.get(key)
+            if entry is None:
+                entry = images[key] = {
+                    'filename': filename,
+                    'xref': img.get('xref'),
+                    'width': img.get('width', 0),
+                    'height': img.get('height', 0),
+                    'phash': int(img['phash'], 16),
+                    'dhash': int(img['dhash'], 16),
+                    'pages': [],
+                    'min_visible_dpi': None
+                }
+            if img.get('page') not in entry['pages']:
+                entry['pages'].append(img.get('page'))
+            visible_dpi = img.get('visible_dpi')
+            if visible_dpi and (entry['min_visible_dpi'] is None or visible_dpi < entry['min_visible_dpi']):
+                entry['min_visible_dpi'] = visible_dpi
+    return list(images.values())
+
+def find_lower_resolution_variants(results, max_distance=DEFAULT_MAX_DISTANCE, min_pixel_ratio=DEFAULT_MIN_PIXEL_RATIO):
+    """Find images in a batch that have a higher-resolution near-duplicate elsewhere in it
+    
+    ``results`` are analysis results, named by their 'filename' key. Images are compared
+    once per distinct image, not per placement. Candidates come from a multi-index search
+    on pHash and are confirmed by dHash, both within ``max_distance`` bits. Returns one dict
+    per lower-resolution image, naming the largest near-duplicate with at least
+    ``min_pixel_ratio`` times its pixels, sorted by file and first page.
+    """
+    images = _distinct_images(results)
+    index = MultiIndexHash()
+    for entry in images:
+        index.add(entry['phash'], entry)
+    
+    variants = []
+    for entry in images:
+        pixels = entry['width'] * entry['height']
+        best = None
+        for distance, other in index.search(entry['phash'], max_distance):
+            if other is entry or hash_distance(other['dhash'], entry['dhash']) > max_distance:
+                continue
+            other_pixels = other['width'] * other['height']
+            if other_pixels >= pixels * min_pixel_ratio and (best is None or other_pixels > best[1]):
+                best = (other, other_pixels, distance)
+        
+        if best is not None:
+            other, _, distance = best
+            variants.append({
+                'filename': entry['filename'],
+                'xref': entry['xref'],
+                'pages': sorted(entry['pages'], key=lambda page: page or 0),
+                'width': entry['width'],
+                'height': entry['height'],
+                'min_visible_dpi': entry['min_visible_dpi'],
+                'better_filename': other['filename'],
+                'better_pages': sorted(other['pages'], key=lambda page: page or 0),
+                'better_width': other['width'],
+                'better_height': other['height'],
+                'distance': distance
+            })
+    
+    variants.sort(key=lambda variant: (variant['filename'], variant['pages'][0] or 0))
+    return variants
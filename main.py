@@ -1,9 +1,127 @@
 import streamlit as st
-import pandas as pd
-import io
-import base64
-from pdf_analyzer import PDFAnalyzer
-from utils import format_file_size, create_results_dataframe
+import hashlib
+import math
+import shutil
+import tempfile
+from contextlib import closing
+from datetime import datetime, timedelta
+from pathlib import Path
+from image_index import ImageFactIndex
+from result_export import EXPORT_FORMATS, arrow_available, open_export_writer
+from history_store import AnalysisHistory
+from image_similarity import find_lower_resolution_variants
+from page_overview import OverviewCache, draw_placements, overview_key
+from utils import (
+    format_file_size, create_results_dataframe, estimate_quality_from_scan, exceeds_ink_limit, looks_upsampled,
+    placement_passes, compare_documents
+)
+
+# Files above this size get the selective analysis options expanded by default
+LARGE_FILE_MB = 20
+
+# Documents with more pages than this are split across workers
+SHARD_PAGES = 50
+
+# Analyzer worker processes are replaced after this many jobs to contain memory growth
+WORKER_MAX_JOBS = 50
+
+# Sidebar default for the largest image decoded in full
+DEFAULT_MEMORY_BUDGET_MB = 1024
+
+# Page overviews shown at a time, in rows of OVERVIEW_COLUMNS
+OVERVIEW_PAGES_PER_VIEW = 12
+OVERVIEW_COLUMNS = 4
+
+# Decoded image facts are shared across documents and sessions through this index
+IMAGE_INDEX_PATH = Path.home() / ".pdf_preflight" / "image_index.sqlite"
+
+# Every analyzed document and its placements are kept here across sessions
+HISTORY_PATH = Path.home() / ".pdf_preflight" / "history.sqlite"
+
+@st.cache_resource
+def get_image_index():
+    """Open the persistent image index once per server process"""
+    IMAGE_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    return ImageFactIndex(IMAGE_INDEX_PATH)
+
+@st.cache_resource
+def get_history():
+    """Open the persistent analysis history once per server process"""
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    return AnalysisHistory(HISTORY_PATH)
+
+def create_analyzer():
+    """Create an analyzer with the shared image index and the sidebar memory budget"""
+    # PyMuPDF and the worker modules load on first use, not on the first page render
+    from pdf_analyzer import PDFAnalyzer
+    
+    memory_budget_mb = st.session_state.get('memory_budget_mb', 0)
+    return PDFAnalyzer(
+        image_index=get_image_index(),
+        memory_budget_bytes=memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+    )
+
+def analyzer_pool_options(memory_budget_mb):
+    """AnalyzerPool options for a memory budget; shared with the launcher's pre-warm"""
+    return {
+        'analyzer_options': {
+            'image_index_path': str(IMAGE_INDEX_PATH),
+            'memory_budget_bytes': memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        },
+        'shard_pages': SHARD_PAGES,
+        'max_jobs_per_worker': WORKER_MAX_JOBS
+    }
+
+def get_analyzer_pool(memory_budget_mb):
+    """The server's one worker pool, sized to the machine, for a memory budget
+    
+    The pool outlives reruns and sessions, so workers keep PyMuPDF and the analyzer
+    loaded between batches instead of paying process start and imports each time.
+    The launcher starts the pool for the default budget while the server starts;
+    choosing another budget replaces the pool rather than adding a second one.
+    """
+    from worker_pool import get_shared_pool
+    
+    IMAGE_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    return get_shared_pool(**analyzer_pool_options(memory_budget_mb))
+
+@st.cache_resource
+def get_overview_cache():
+    """Page overview renders shared by every session, keyed by document hash and page"""
+    return OverviewCache()
+
+def open_batch_exports():
+    """Open export writers for this run in a fresh directory, removing the previous run's"""
+    previous_dir = st.session_state.pop('export_dir', None)
+    if previous_dir:
+        shutil.rmtree(previous_dir, ignore_errors=True)
+    
+    export_dir = tempfile.mkdtemp(prefix="pdf_preflight_export_")
+    st.session_state['export_dir'] = export_dir
+    formats = [fmt for fmt in EXPORT_FORMATS if arrow_available() or fmt not in ('parquet', 'arrow')]
+    return {fmt: open_export_writer(Path(export_dir) / f"placements.{fmt}") for fmt in formats}
+
+def display_export_downloads(export_writers):
+    """Offer the raw placement table of this run for download
+    
+    Exports stay on disk until a button is clicked; only the clicked file is read.
+    """
+    st.markdown("### 📥 Export Placement Data")
+    st.caption("Raw, unformatted values for every placement, one row per placement")
+    
+    columns = st.columns(len(export_writers))
+    for column, (fmt, writer) in zip(columns, export_writers.items()):
+        with column:
+            st.download_button(
+                f"{fmt.upper()}",
+                data=Path(writer.path).read_bytes,
+                file_name=f"preflight_placements.{fmt}",
+                on_click="ignore",
+                key=f"export_{fmt}"
+            )
+    
+    if not arrow_available():
+        st.caption("Install pyarrow for Parquet and Arrow export")
 
 def main():
     st.set_page_config(
@@ -180,6 +298,50 @@ def main():
                 help="Choose which color spaces are acceptable for your print workflow"
             )
             st.markdown('<p class="help-text">CMYK recommended for print, RGB for digital</p>', unsafe_allow_html=True)
+            
+            st.number_input(
+                "Total Ink Limit (%)",
+                min_value=200,
+                max_value=400,
+                value=300,
+                step=10,
+                key="ink_limit",
+                help="Maximum total area coverage (C+M+Y+K) your printer accepts. CMYK images fail when "
+                     "more than 1% of their area is above it"
+            )
+        
+        # Resource limits
+        with st.container():
+            st.markdown("""
+            <div class="sidebar-section">
+                <h3 style="margin-top: 0; color: #495057;">🧠 Resource Limits</h3>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            st.number_input(
+                "Max Decoded Image Size (MB)",
+                min_value=0,
+                max_value=16384,
+                value=DEFAULT_MEMORY_BUDGET_MB,
+                key="memory_budget_mb",
+                help="Images that would decode to more than this are analyzed from their metadata only (0 = no limit)"
+            )
+            
+            st.number_input(
+                "Per-File Timeout (s)",
+                min_value=0,
+                max_value=3600,
+                value=300,
+                key="file_timeout_s",
+                help="Files that take longer are stopped and reported with the pages analyzed so far (0 = no limit)"
+            )
+        
+        # Image index statistics
+        index_stats = get_image_index().stats()
+        st.caption(
+            f"🗂️ Image cache: {index_stats['entries']} images, "
+            f"{index_stats['hit_rate']:.0f}% hit rate since start-up (all workers)"
+        )
         
         # Quick reference
         with st.container():
@@ -255,9 +417,54 @@ def main():
                     file_size = len(file.getvalue())
                     st.text(f"{i}. {file.name} ({format_file_size(file_size)})")
             
+            # Selective analysis re-checks part of a large file without a full pass
+            has_large_file = any(len(file.getvalue()) > LARGE_FILE_MB * 1024 * 1024 for file in uploaded_files)
+            with st.expander("🎯 Selective Analysis", expanded=has_large_file):
+                page_selection = st.text_input(
+                    "Pages",
+                    placeholder="All pages, e.g. 1-3, 10",
+                    help="Only load and analyze these pages"
+                )
+                min_megapixels = st.number_input(
+                    "Only images above (MP)",
+                    min_value=0.0,
+                    value=0.0,
+                    step=0.5,
+                    help="Skip images with fewer megapixels than this"
+                )
+                xref_selection = st.text_input(
+                    "Only image xrefs",
+                    placeholder="All images, e.g. 12, 15",
+                    help="Restrict the analysis to these PDF image object numbers"
+                )
+            
+            try:
+                xrefs = [int(x) for x in xref_selection.split(',') if x.strip()] or None
+            except ValueError:
+                st.error(f"❌ Invalid xref list: {xref_selection}")
+                return
+            
+            image_filter = None
+            if min_megapixels or xrefs:
+                from pdf_analyzer import make_image_filter
+                image_filter = make_image_filter(min_megapixels=min_megapixels or None, xrefs=xrefs)
+            page_selection = page_selection.strip() or None
+            
+            # Quick scan gives a sampled estimate first; a later full analysis reuses it
+            if st.button("⚡ Quick Scan", use_container_width=True,
+                         help="Analyze a sample of pages for a fast estimate with confidence bounds"):
+                quick_scan_pdfs(uploaded_files, min_dpi, preferred_modes, col2)
+            
+            # Two files are compared as versions of one document, from hashes and metadata only
+            if len(uploaded_files) == 2 and st.button(
+                    "🔀 Compare Versions", use_container_width=True,
+                    help=f"Report image changes from {uploaded_files[0].name} to {uploaded_files[1].name}"):
+                compare_pdfs(uploaded_files[0], uploaded_files[1], min_dpi, preferred_modes, col2)
+            
             # Analyze button with better styling
             if st.button("🔍 Analyze PDFs", type="primary", use_container_width=True):
-                analyze_multiple_pdfs(uploaded_files, min_dpi, preferred_modes, col2)
+                analyze_multiple_pdfs(uploaded_files, min_dpi, preferred_modes, col2,
+                                      pages=page_selection, image_filter=image_filter)
         else:
             st.markdown("""
             <div class="metric-card">
@@ -271,8 +478,39 @@ def main():
             </div>
             """, unsafe_allow_html=True)
         
+        display_history_search()
+        
 
 
+def display_history_search():
+    """Search placements recorded by earlier analyses"""
+    import pandas as pd
+    
+    with st.expander("📜 Analysis History", expanded=False):
+        days = st.number_input("Analyzed in the last (days)", min_value=1, max_value=3650, value=7)
+        status = st.selectbox("Status", ["Failing", "Passing", "Any"])
+        color_mode = st.selectbox("Color space", ["Any", "CMYK", "RGB", "Grayscale", "RGBA", "Grayscale + Alpha"])
+        max_dpi = st.number_input("Visible DPI under (0 = any)", min_value=0, max_value=2400, value=0)
+        
+        if st.button("🔎 Search History", use_container_width=True):
+            placements = get_history().query_placements(
+                status={'Failing': 'fail', 'Passing': 'pass'}.get(status),
+                color_mode=None if color_mode == "Any" else color_mode,
+                max_dpi=max_dpi or None,
+                since=datetime.now() - timedelta(days=days)
+            )
+            if not placements:
+                st.info("No recorded placements match")
+                return
+            st.caption(f"{len(placements)} most recent matching placements")
+            history_df = pd.DataFrame(placements)
+            history_df['analyzed_at'] = pd.to_datetime(history_df['analyzed_at'], unit='s')
+            st.dataframe(
+                history_df[['analyzed_at', 'filename', 'page', 'xref', 'visible_dpi', 'color_mode', 'status']],
+                use_container_width=True,
+                hide_index=True
+            )
+
 def analyze_pdf(uploaded_file, min_dpi, preferred_modes, display_column):
     """Analyze the uploaded PDF file"""
     with display_column:
@@ -287,7 +525,7 @@ def analyze_pdf(uploaded_file, min_dpi, preferred_modes, display_column):
             status_text.text("Initializing PDF analyzer...")
             progress_bar.progress(10)
             
-            analyzer = PDFAnalyzer()
+            analyzer = create_analyzer()
             
             # Load PDF
             status_text.text("Loading PDF file...")
@@ -307,7 +545,7 @@ def analyze_pdf(uploaded_file, min_dpi, preferred_modes, display_column):
             status_text.text("Analysis complete!")
             
             # Display results
-            display_results(analysis_result, min_dpi, preferred_modes)
+            display_results(analysis_result, min_dpi, preferred_modes, pdf_data)
             
         except Exception as e:
             st.error(f"An unexpected error occurred: {str(e)}")
@@ -315,7 +553,24 @@ def analyze_pdf(uploaded_file, min_dpi, preferred_modes, display_column):
             progress_bar.empty()
             status_text.empty()
 
-def analyze_multiple_pdfs(uploaded_files, min_dpi, preferred_modes, display_column):
+def analysis_jobs(uploaded_files, quick_scans, pages=None, image_filter=None):
+    """Pool jobs for the uploaded files and the file name of each job
+    
+    Jobs are identified by upload index, since two uploads can share a file name.
+    """
+    jobs = [
+        (upload_index, uploaded_file.getvalue(), {
+            # Continue from a quick scan if there is one; a scan of another file is ignored
+            'resume_from': quick_scans.get(upload_index),
+            'pages': pages,
+            'image_filter': image_filter
+        })
+        for upload_index, uploaded_file in enumerate(uploaded_files)
+    ]
+    filenames = {upload_index: uploaded_file.name for upload_index, uploaded_file in enumerate(uploaded_files)}
+    return jobs, filenames
+
+def analyze_multiple_pdfs(uploaded_files, min_dpi, preferred_modes, display_column, pages=None, image_filter=None):
     """Analyze multiple uploaded PDF files"""
     with display_column:
         st.header("Analysis Results")
@@ -328,31 +583,48 @@ def analyze_multiple_pdfs(uploaded_files, min_dpi, preferred_modes, display_colu
         total_files = len(uploaded_files)
         
         try:
-            analyzer = PDFAnalyzer()
+            jobs, filenames = analysis_jobs(uploaded_files, st.session_state.get('quick_scans', {}), pages, image_filter)
+            status_text.text(f"Processing {total_files} file(s)...")
             
-            for i, uploaded_file in enumerate(uploaded_files):
-                status_text.text(f"Processing {uploaded_file.name} ({i+1}/{total_files})...")
-                
-                # Update overall progress
-                file_progress = i / total_files
-                overall_progress.progress(file_progress)
-                
-                try:
-                    # Analyze individual PDF
-                    pdf_data = uploaded_file.getvalue()
-                    analysis_result = analyzer.analyze_pdf(pdf_data)
-                    
-                    if analysis_result['error']:
-                        st.error(f"Error analyzing {uploaded_file.name}: {analysis_result['error']}")
-                        continue
+            # Placements are appended to the exports as each file finishes
+            export_writers = open_batch_exports()
+            
+            # Each file runs in a worker process so a pathological file cannot stall the batch
+            pool = get_analyzer_pool(st.session_state.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET_MB))
+            results = pool.analyze(jobs, wall_timeout=st.session_state.get('file_timeout_s', 300))
+            with closing(results):
+                for i, (upload_index, analysis_result) in enumerate(results):
+                    filename = filenames[upload_index]
+                    overall_progress.progress((i + 1) / total_files)
+                    status_text.text(f"Finished {filename} ({i+1}/{total_files})...")
                     
-                    # Add file name to results
-                    analysis_result['filename'] = uploaded_file.name
-                    all_results.append(analysis_result)
+                    try:
+                        get_history().record(analysis_result, filename, min_dpi, preferred_modes, ink_limit=st.session_state.get('ink_limit', 300))
+                        
+                        if analysis_result.get('partial'):
+                            st.warning(
+                                f"{filename}: {analysis_result['error']}. Showing the "
+                                f"{len(analysis_result['analyzed_pages'])} page(s) analyzed before it was stopped."
+                            )
+                            if not analysis_result['images']:
+                                continue
+                        elif analysis_result['error']:
+                            st.error(f"Error analyzing {filename}: {analysis_result['error']}")
+                            continue
+                        
+                        # Add file name to results
+                        analysis_result['filename'] = filename
+                        analysis_result['upload_index'] = upload_index
+                        all_results.append(analysis_result)
+                        for writer in export_writers.values():
+                            writer.write_result(analysis_result, filename)
                     
-                except Exception as e:
-                    st.error(f"Error processing {uploaded_file.name}: {str(e)}")
-                    continue
+                    except Exception as e:
+                        st.error(f"Error processing {filename}: {str(e)}")
+                        continue
+            
+            for writer in export_writers.values():
+                writer.close()
             
             # Final progress update
             overall_progress.progress(1.0)
@@ -363,16 +635,160 @@ def analyze_multiple_pdfs(uploaded_files, min_dpi, preferred_modes, display_colu
                 return
             
             # Display combined results
-            display_multiple_pdf_results(all_results, min_dpi, preferred_modes)
-            
+            documents = {upload_index: pdf_data for upload_index, pdf_data, _ in jobs}
+            display_multiple_pdf_results(all_results, min_dpi, preferred_modes, documents)
+            display_export_downloads(export_writers)
+        
         except Exception as e:
             st.error(f"Error during analysis: {str(e)}")
         finally:
             overall_progress.empty()
             status_text.empty()
 
-def display_multiple_pdf_results(all_results, min_dpi, preferred_modes):
-    """Display results for multiple PDF files"""
+def quick_scan_pdfs(uploaded_files, min_dpi, preferred_modes, display_column):
+    """Quick-scan uploaded PDF files and show sampled estimates"""
+    with display_column:
+        st.header("Quick Scan Estimates")
+        
+        status_text = st.empty()
+        analyzer = create_analyzer()
+        quick_scans = st.session_state.setdefault('quick_scans', {})
+        
+        try:
+            for i, uploaded_file in enumerate(uploaded_files):
+                status_text.text(f"Scanning {uploaded_file.name} ({i+1}/{len(uploaded_files)})...")
+                
+                scan_result = analyzer.quick_scan(uploaded_file.getvalue())
+                if scan_result['error']:
+                    st.error(f"Error scanning {uploaded_file.name}: {scan_result['error']}")
+                    continue
+                
+                # Kept so that "Analyze PDFs" continues from the work already done
+                quick_scans[i] = scan_result
+                
+                st.markdown(f"## 📄 {uploaded_file.name}")
+                display_scan_estimates(
+                    estimate_quality_from_scan(scan_result, min_dpi, preferred_modes, ink_limit=st.session_state.get('ink_limit', 300))
+                )
+        finally:
+            status_text.empty()
+        
+        st.info("Click **Analyze PDFs** to continue into a full analysis; scanned pages are reused.")
+
+def display_scan_estimates(estimates):
+    """Display quick-scan estimates with their confidence bounds"""
+    def bounds(value):
+        return f"{value['estimate']:.0f}% ({value['low']:.0f}–{value['high']:.0f}%)"
+    
+    if estimates['exact']:
+        st.caption(f"All {estimates['total_pages']} pages analyzed — figures are exact.")
+    else:
+        st.caption(
+            f"Sampled {estimates['sampled_pages']} of {estimates['total_pages']} pages, "
+            f"{estimates['confidence']:.0%} confidence bounds in brackets."
+        )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Estimated Pass Rate", bounds(estimates['pass_rate']))
+    with col2:
+        st.metric("Estimated Placements", f"~{estimates['estimated_placements']}")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("**Visible DPI Distribution:**")
+        for category, value in estimates['dpi_distribution'].items():
+            st.write(f"• {category}: {bounds(value)}")
+    with col2:
+        st.write("**Color Space Mix:**")
+        for color_mode, value in estimates['color_space_mix'].items():
+            st.write(f"• {color_mode}: {bounds(value)}")
+        if estimates['distinct_image_color_mix']:
+            distinct = ", ".join(f"{mode}: {count}" for mode, count in estimates['distinct_image_color_mix'].items())
+            st.caption(f"Distinct images (exact): {distinct}")
+
+def compare_pdfs(previous_file, current_file, min_dpi, preferred_modes, display_column):
+    """Compare two versions of a PDF by image stream hashes and placement metadata"""
+    with display_column:
+        st.header("Version Comparison")
+        st.caption(f"From **{previous_file.name}** to **{current_file.name}**")
+        
+        analyzer = create_analyzer()
+        with st.spinner("Comparing image placements..."):
+            previous = analyzer.inventory(previous_file.getvalue())
+            current = analyzer.inventory(current_file.getvalue())
+        
+        for uploaded_file, inventory in ((previous_file, previous), (current_file, current)):
+            if inventory['error']:
+                st.error(f"Error reading {uploaded_file.name}: {inventory['error']}")
+                return
+        
+        display_comparison(compare_documents(previous, current, min_dpi, preferred_modes, st.session_state.get('ink_limit', 300)))
+
+def display_comparison(comparison):
+    """Display the image changes between two versions of a document"""
+    import pandas as pd
+    
+    if comparison['previous_pages'] != comparison['pages']:
+        st.warning(
+            f"⚠️ Page count changed from {comparison['previous_pages']} to {comparison['pages']}; "
+            "placements are matched by page number."
+        )
+    
+    categories = [
+        ('replaced', "Replaced"),
+        ('rescaled', "Rescaled"),
+        ('moved', "Moved"),
+        ('added', "Added"),
+        ('removed', "Removed")
+    ]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Unchanged Placements", comparison['unchanged'])
+    with col2:
+        st.metric("Changed Placements", sum(len(comparison[category]) for category, _ in categories))
+    with col3:
+        st.metric("New Failures", comparison['new_failures'])
+    
+    if not any(comparison[category] for category, _ in categories):
+        st.success("✅ No image changes between the two versions.")
+        return
+    
+    def describe(img):
+        if img is None:
+            return "—"
+        dpi = f"{img['visible_dpi']:.0f} DPI" if img.get('visible_dpi') else "unknown DPI"
+        return f"{img['width']} × {img['height']} px, {dpi}, {img['color_mode']}"
+    
+    rows = []
+    for category, label in categories:
+        for item in comparison[category]:
+            rows.append({
+                'Change': label,
+                'Page': item['page'],
+                'Before': describe(item['previous']),
+                'After': describe(item['current']),
+                'Status Before': item['previous_status'] or "—",
+                'Status After': item['status'] or "—"
+            })
+    
+    def style_status(val):
+        if val == "PASS":
+            return 'background-color: #d4edda; color: #155724'
+        elif val == "FAIL":
+            return 'background-color: #f8d7da; color: #721c24'
+        return ''
+    
+    changes_df = pd.DataFrame(rows).sort_values('Page', kind='stable')
+    st.dataframe(
+        changes_df.style.map(style_status, subset=['Status Before', 'Status After']),
+        use_container_width=True,
+        hide_index=True
+    )
+
+def display_multiple_pdf_results(all_results, min_dpi, preferred_modes, documents=None):
+    """Display results for multiple PDF files; ``documents`` maps upload indexes to PDF bytes for page overviews"""
     
     # Overall summary
     total_files = len(all_results)
@@ -394,17 +810,23 @@ def display_multiple_pdf_results(all_results, min_dpi, preferred_modes):
     </div>
     """, unsafe_allow_html=True)
     
+    # Near-duplicates are matched across every file of the batch
+    display_lower_resolution_variants(all_results)
+    
     # Display results for each PDF
     for i, result in enumerate(all_results):
         st.markdown(f"## 📄 {result['filename']}")
         
         # Display individual PDF results
         if result['total_images'] > 0:
+            if documents and result.get('upload_index') in documents:
+                display_page_overview(result, documents[result['upload_index']], min_dpi, preferred_modes, key=f"file_{i}")
+            
             display_image_grid(result['images'], min_dpi, preferred_modes)
             
             # Individual summary table
             st.subheader("📊 Summary Table")
-            df = create_results_dataframe(result['images'], min_dpi, preferred_modes)
+            df = create_results_dataframe(result['images'], min_dpi, preferred_modes, st.session_state.get('ink_limit', 300))
             
             # Style the dataframe
             def style_results(val):
@@ -426,8 +848,9 @@ def display_multiple_pdf_results(all_results, min_dpi, preferred_modes):
         if i < len(all_results) - 1:
             st.markdown("---")
 
-def display_results(results, min_dpi, preferred_modes):
+def display_results(results, min_dpi, preferred_modes, pdf_data=None):
     """Display the analysis results"""
+    import pandas as pd
     
     # Overall summary
     st.subheader("📊 Summary")
@@ -461,6 +884,9 @@ def display_results(results, min_dpi, preferred_modes):
         st.warning("No images found in the PDF file.")
         return
     
+    if pdf_data is not None:
+        display_page_overview(results, pdf_data, min_dpi, preferred_modes, key="single")
+    
     # Image previews and detailed analysis
     st.subheader("🔍 Image Analysis with Previews")
     
@@ -470,7 +896,7 @@ def display_results(results, min_dpi, preferred_modes):
     # Detailed results table
     st.subheader("📊 Summary Table")
     
-    df = create_results_dataframe(results['images'], min_dpi, preferred_modes)
+    df = create_results_dataframe(results['images'], min_dpi, preferred_modes, st.session_state.get('ink_limit', 300))
     
     # Style the dataframe
     def style_results(val):
@@ -502,26 +928,119 @@ def display_results(results, min_dpi, preferred_modes):
                 percentage = (count / results['total_images']) * 100
                 st.write(f"• {mode}: {count} ({percentage:.1f}%)")
     
+    display_lower_resolution_variants([results])
+    
     # Issues and recommendations
     display_recommendations(results, min_dpi, preferred_modes)
+
+@st.fragment
+def display_page_overview(result, pdf_data, min_dpi, preferred_modes, key):
+    """Paginated low-resolution page renders with failing placements highlighted
+    
+    Runs as a fragment, so paging reruns only this section and not the analysis.
+    Only the pages in view are rendered, in parallel on the analyzer workers, and
+    renders are cached by document and page across reruns and sessions.
+    """
+    ink_limit = st.session_state.get('ink_limit', 300)
+    placements_by_page = {}
+    for img in result['images']:
+        failing = not placement_passes(img, min_dpi, preferred_modes, ink_limit)
+        placements_by_page.setdefault(img.get('page'), []).append((img.get('placement_rect'), failing))
+    failing_pages = [
+        page for page, placements in sorted(placements_by_page.items())
+        if any(failing for _, failing in placements)
+    ]
+    
+    st.subheader("🗺️ Page Overview")
+    only_failing = st.checkbox(
+        "Only pages with failing placements",
+        value=bool(failing_pages),
+        key=f"overview_failing_{key}",
+        help="Failing placements are filled red, passing ones outlined green"
+    )
+    pages = failing_pages if only_failing else result.get('analyzed_pages') or list(range(1, result['total_pages'] + 1))
+    if not pages:
+        st.info("No pages with failing placements")
+        return
+    
+    view_count = math.ceil(len(pages) / OVERVIEW_PAGES_PER_VIEW)
+    view = 1
+    if view_count > 1:
+        view = st.number_input(
+            f"Overview page (of {view_count})", min_value=1, max_value=view_count, value=1,
+            key=f"overview_view_{key}"
+        )
+    view_pages = pages[(view - 1) * OVERVIEW_PAGES_PER_VIEW:view * OVERVIEW_PAGES_PER_VIEW]
+    
+    cache = get_overview_cache()
+    # Results stopped part way carry no file hash
+    file_hash = result.get('file_hash') or hashlib.sha256(pdf_data).hexdigest()
+    overviews = {page: cache.get(overview_key(file_hash, page)) for page in view_pages}
+    missing = [page for page, overview in overviews.items() if overview is None]
+    if missing:
+        with st.spinner(f"Rendering {len(missing)} page overview(s)..."):
+            pool = get_analyzer_pool(st.session_state.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET_MB))
+            with closing(pool.render_overviews(pdf_data, missing)) as rendered:
+                for page, overview in rendered:
+                    if overview is not None:
+                        cache.put(overview_key(file_hash, page), overview)
+                    overviews[page] = overview
+    
+    for row_start in range(0, len(view_pages), OVERVIEW_COLUMNS):
+        columns = st.columns(OVERVIEW_COLUMNS)
+        for column, page in zip(columns, view_pages[row_start:row_start + OVERVIEW_COLUMNS]):
+            placements = placements_by_page.get(page, [])
+            failing_count = sum(1 for _, failing in placements if failing)
+            with column:
+                if overviews[page] is None:
+                    st.caption(f"Page {page}: could not be rendered")
+                    continue
+                st.image(
+                    draw_placements(overviews[page], placements),
+                    caption=f"Page {page} — {failing_count} of {len(placements)} failing",
+                    use_container_width=True
+                )
+
+def display_lower_resolution_variants(all_results):
+    """List images that have a higher-resolution near-duplicate elsewhere in the job"""
+    import pandas as pd
     
+    variants = find_lower_resolution_variants(all_results)
+    if not variants:
+        return
+    
+    def pages(page_numbers):
+        return ", ".join(str(page) for page in page_numbers)
+    
+    st.subheader("🔁 Lower-Resolution Duplicates")
+    st.warning(
+        f"{len(variants)} image(s) look like lower-resolution versions of another image in this job. "
+        "Use the higher-resolution version where possible."
+    )
+    rows = []
+    for variant in variants:
+        rows.append({
+            'File': variant['filename'],
+            'Pages': pages(variant['pages']),
+            'Size (px)': f"{variant['width']} × {variant['height']}",
+            'Lowest Visible DPI': f"{variant['min_visible_dpi']:.0f}" if variant['min_visible_dpi'] else "Unknown",
+            'Higher-Res File': variant['better_filename'],
+            'Higher-Res Pages': pages(variant['better_pages']),
+            'Higher-Res Size (px)': f"{variant['better_width']} × {variant['better_height']}",
+            'Hash Distance': variant['distance']
+        })
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
 
 
 def determine_overall_status(results, min_dpi, preferred_modes):
-    """Determine overall pass/fail status based on visible DPI"""
+    """Determine overall pass/fail status based on visible DPI, color space and total ink"""
     if results['total_images'] == 0:
         return "N/A"
     
-    for img in results['images']:
-        # Check VISIBLE DPI (what matters for print quality)
-        if img.get('visible_dpi') and img['visible_dpi'] < min_dpi:
-            return "FAIL"
-        
-        # Check color mode
-        if img.get('color_mode') and img['color_mode'] not in preferred_modes:
-            return "FAIL"
-    
-    return "PASS"
+    ink_limit = st.session_state.get('ink_limit', 300)
+    if all(placement_passes(img, min_dpi, preferred_modes, ink_limit) for img in results['images']):
+        return "PASS"
+    return "FAIL"
 
 def display_recommendations(results, min_dpi, preferred_modes):
     """Display recommendations based on analysis"""
@@ -536,6 +1055,15 @@ def display_recommendations(results, min_dpi, preferred_modes):
         issues.append(f"{len(low_dpi_images)} image placement(s) have visible DPI below {min_dpi}")
         recommendations.append("Increase image size in document or use higher resolution source images")
     
+    # Check for images that reach the DPI only through upsampling
+    upsampled_images = [img for img in results['images'] if looks_upsampled(img, min_dpi)]
+    if upsampled_images:
+        issues.append(
+            f"{len(upsampled_images)} image placement(s) meet {min_dpi} DPI only through upsampling "
+            f"(estimated native resolution as low as {min(img['estimated_native_dpi'] for img in upsampled_images):.0f} DPI)"
+        )
+        recommendations.append("Replace upsampled images with original high-resolution sources; upscaling adds pixels, not detail")
+    
     # Check for images scaled too large
     over_scaled_images = [img for img in results['images'] 
                          if img.get('visible_dpi') and img.get('metadata_dpi') 
@@ -551,6 +1079,17 @@ def display_recommendations(results, min_dpi, preferred_modes):
         issues.append(f"{len(wrong_color_images)} image(s) use non-preferred color spaces: {', '.join(color_modes)}")
         recommendations.append(f"Convert images to preferred color spaces: {', '.join(preferred_modes)}")
     
+    # Check total ink coverage against the printer's limit
+    ink_limit = st.session_state.get('ink_limit', 300)
+    over_ink_images = [img for img in results['images'] if exceeds_ink_limit(img, ink_limit)]
+    if over_ink_images:
+        heaviest = max(img['tac_p99'] for img in over_ink_images)
+        issues.append(
+            f"{len(over_ink_images)} CMYK image placement(s) exceed the {ink_limit}% total ink limit "
+            f"(up to {heaviest:.0f}% over 1% of the image)"
+        )
+        recommendations.append("Convert heavy CMYK images with a profile that applies your printer's total ink limit")
+    
     # Check for missing image data
     unknown_images = [img for img in results['images'] if not img.get('visible_dpi') or not img.get('color_mode')]
     if unknown_images:
@@ -586,11 +1125,11 @@ def display_image_grid(images, min_dpi, preferred_modes):
     pass_count = 0
     high_quality_count = 0
     
+    ink_limit = st.session_state.get('ink_limit', 300)
     for img in images:
         visible_dpi = img.get('visible_dpi', 0)
-        color_mode = img.get('color_mode', '')
         
-        if (visible_dpi and visible_dpi >= min_dpi) and (color_mode in preferred_modes):
+        if placement_passes(img, min_dpi, preferred_modes, ink_limit):
             pass_count += 1
         if visible_dpi and visible_dpi >= 300:
             high_quality_count += 1
@@ -644,7 +1183,7 @@ def display_single_image(img_data, img_number, min_dpi, preferred_modes):
     color_mode = img_data.get('color_mode', '')
     dpi_pass = dpi and dpi >= min_dpi
     color_pass = color_mode in preferred_modes
-    overall_pass = dpi_pass and color_pass
+    overall_pass = placement_passes(img_data, min_dpi, preferred_modes, st.session_state.get('ink_limit', 300))
     
     # Quality indicator
     if dpi and dpi >= 300:
@@ -673,10 +1212,11 @@ def display_single_image(img_data, img_number, min_dpi, preferred_modes):
     """, unsafe_allow_html=True)
     
     # Display image preview if available
-    if img_data.get('preview_base64'):
+    if img_data.get('preview'):
         try:
+            # Raw bytes are served from Streamlit's media endpoint, not inlined in the page
             st.image(
-                f"data:image/png;base64,{img_data['preview_base64']}", 
+                img_data['preview'],
                 caption=None,
                 use_container_width=True
             )
@@ -689,7 +1229,7 @@ def display_single_image(img_data, img_number, min_dpi, preferred_modes):
             📷 Preview not available
         </div>
         """, unsafe_allow_html=True)
-        
+    
     # Key metrics display
     st.markdown(f"""
     <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 0.5rem; margin: 1rem 0;">
@@ -748,6 +1288,10 @@ def display_single_image(img_data, img_number, min_dpi, preferred_modes):
             st.text(f"Original PDF Colorspace: {img_data['original_colorspace']}")
         if img_data.get('dpi_method'):
             st.text(f"DPI Method: {img_data['dpi_method']}")
+        if img_data.get('analysis_level') == 'metadata':
+            st.text("Analysis: metadata only")
+        elif img_data.get('analysis_level') == 'reduced':
+            st.text("Analysis: metadata + reduced-resolution decode")
         if img_data.get('error'):
             st.error(f"Error: {img_data['error']}")
 
@@ -0,0 +1,113 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Width in pixels of page overview renders; pages are rasterized at this size only
+OVERVIEW_WIDTH = 280
+OVERVIEW_QUALITY = 75
+
+FAIL_COLOR = (220, 53, 69)
+PASS_COLOR = (40, 167, 69)
+
+def render_overviews(pdf_data, pages, width=OVERVIEW_WIDTH):
+    """Render 1-based ``pages`` of a document at ``width`` pixels, yielding ``(page_number, overview)``
+    
+    An overview is a dict with the JPEG bytes and the matrix from page coordinates (as
+    used by placement rects) to its pixels, which includes the page rotation. MuPDF
+    decodes images at the reduced size where the codec allows, so nothing is
+    rasterized at full resolution. Pages that cannot be rendered yield None.
+    """
+    import fitz
+    
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        for page_number in pages:
+            try:
+                page = doc[page_number - 1]
+                zoom = width / max(page.rect.width, 1)
+                matrix = page.rotation_matrix * fitz.Matrix(zoom, zoom)
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False, annots=False)
+                yield page_number, {
+                    'image': pix.tobytes("jpeg", jpg_quality=OVERVIEW_QUALITY),
+                    'matrix': tuple(matrix)
+                }
+            except Exception as e:
+                logger.warning(f"Could not render overview of page {page_number}: {str(e)}")
+                yield page_number, None
+
+def overview_key(file_hash, page_number, width=OVERVIEW_WIDTH):
+    """Cache key of a page overview: the document's hash, the page and the render settings
+    
+    Page fingerprints are not used: they cover the page's content and images but not
+    its fonts, shadings or other resources, so two different pages could share one.
+    """
+    return f"{file_hash}:{page_number}@{width}:{OVERVIEW_QUALITY}"
+
+class OverviewCache:
+    """In-memory LRU cache of page overviews, bounded by the bytes of their images
+    
+    Keyed by :func:`overview_key`, so a page is rendered once per document however
+    many sessions view it. Safe to share between sessions.
+    """
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the overview stored under ``key``, or None"""
+        with self._lock:
+            overview = self._entries.get(key)
+            if overview is not None:
+                self._entries.move_to_end(key)
+            return overview
+    
+    def put(self, key, overview):
+        """Store an overview, evicting the least recently used ones beyond the bound"""
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous['image'])
+            self._entries[key] = overview
+            self._size += len(overview['image'])
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted['image'])
+
+def draw_placements(overview, placements):
+    """Draw placement rects over an overview; returns JPEG bytes
+    
+    ``placements`` are ``(placement_rect, failing)`` pairs. Failing placements are
+    filled in translucent red, passing ones are outlined in green.
+    """
+    from PIL import Image, ImageDraw
+    
+    img = Image.open(io.BytesIO(overview['image'])).convert('RGB')
+    layer = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    a, b, c, d, e, f = overview['matrix']
+    
+    # Passing placements first, so failing ones stay visible where they overlap
+    for rect, failing in sorted(placements, key=lambda placement: placement[1]):
+        if not rect:
+            continue
+        corners = [
+            (x * a + y * c + e, x * b + y * d + f)
+            for x in (rect['x0'], rect['x1']) for y in (rect['y0'], rect['y1'])
+        ]
+        xs = [x for x, _ in corners]
+        ys = [y for _, y in corners]
+        box = (min(xs), min(ys), max(max(xs), min(xs) + 1), max(max(ys), min(ys) + 1))
+        if failing:
+            draw.rectangle(box, fill=FAIL_COLOR + (90,), outline=FAIL_COLOR + (255,), width=2)
+        else:
+            draw.rectangle(box, outline=PASS_COLOR + (255,), width=1)
+    
+    img = Image.alpha_composite(img.convert('RGBA'), layer).convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=OVERVIEW_QUALITY)
+    return buffer.getvalue()
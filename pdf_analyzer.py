@@ -1,86 +1,299 @@
 import fitz  # PyMuPDF
 import io
-import base64
-from PIL import Image
+import math
+import hashlib
+import random
+import re
 import logging
 import struct
+import sys
+import zlib
+from contextlib import contextmanager
+
+from content_stream import walk_image_draws
+from image_similarity import perceptual_hashes
+
+def _reset_peak_rss():
+    """Reset the kernel's peak RSS counter so it covers one document (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss():
+    """Peak resident set size in bytes since the last reset or process start"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other Unix systems kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def parse_page_selection(selection, page_count):
+    """Turn a page selection into a sorted list of 0-based page numbers
+
+    ``selection`` uses 1-based page numbers and may be ``None`` (all pages), a string
+    such as ``"1-3, 7, 10-"``, or an iterable of page numbers and ``range`` objects.
+    Pages beyond ``page_count`` are ignored; malformed entries raise ``ValueError``.
+    """
+    if selection is None:
+        return list(range(page_count))
+    
+    if isinstance(selection, str):
+        items = []
+        for part in selection.split(','):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                if '-' in part:
+                    first, _, last = part.partition('-')
+                    first = int(first) if first.strip() else 1
+                    last = int(last) if last.strip() else page_count
+                    items.append(range(first, last + 1))
+                else:
+                    items.append(int(part))
+            except ValueError:
+                raise ValueError(f"Invalid page selection entry '{part}'")
+    else:
+        items = selection
+    
+    pages = set()
+    for item in items:
+        numbers = item if isinstance(item, range) else [int(item)]
+        for number in numbers:
+            if number < 1:
+                raise ValueError(f"Invalid page number {number}: pages start at 1")
+            if number <= page_count:
+                pages.add(number - 1)
+    
+    return sorted(pages)
+
+class ImageFilter:
+    """Picklable ``image_filter`` predicate for :meth:`PDFAnalyzer.analyze_pdf`"""
+    
+    def __init__(self, min_megapixels=None, xrefs=None):
+        self.min_megapixels = min_megapixels
+        self.xrefs = set(xrefs) if xrefs is not None else None
+    
+    def __call__(self, header):
+        if self.xrefs is not None and header['xref'] not in self.xrefs:
+            return False
+        if self.min_megapixels is not None and header['megapixels'] < self.min_megapixels:
+            return False
+        return True
+
+def make_image_filter(min_megapixels=None, xrefs=None):
+    """Build an ``image_filter`` predicate for :meth:`PDFAnalyzer.analyze_pdf`"""
+    return ImageFilter(min_megapixels=min_megapixels, xrefs=xrefs)
+
+# Encodings for preview bytes, by Pillow format name
+PREVIEW_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP', 'png': 'PNG'}
 
 class PDFAnalyzer:
     """PDF analysis class for extracting and analyzing images from PDF files"""
     
-    def __init__(self):
+    def __init__(self, image_index=None, memory_budget_bytes=None, preview_format='jpeg', preview_quality=80):
         self.logger = logging.getLogger(__name__)
+        # Optional image_index.ImageFactIndex shared across documents
+        self.image_index = image_index
+        # Images whose decoded pixmap would exceed this are analyzed from metadata only
+        self.memory_budget_bytes = memory_budget_bytes
+        if preview_format not in PREVIEW_FORMATS:
+            raise ValueError(f"Unsupported preview format '{preview_format}'")
+        # Previews are kept as encoded bytes in this format (PNG where JPEG cannot hold alpha)
+        self.preview_format = preview_format
+        self.preview_quality = preview_quality
         
-    def analyze_pdf(self, pdf_data):
-        """Analyze a PDF file and extract image information"""
+    def analyze_pdf(self, pdf_data, resume_from=None, pages=None, image_filter=None, previous=None,
+                    on_page=None, fingerprint_pages=False):
+        """Analyze a PDF file and extract image information
+
+        ``resume_from`` may be a previous :meth:`quick_scan` result for the same file;
+        the pages and images it already analyzed are reused instead of being redone.
+        ``pages`` limits the analysis to a page selection (see :func:`parse_page_selection`)
+        and ``image_filter`` is a predicate on an image header dict (see
+        :func:`make_image_filter`); pages outside the selection are never loaded and
+        filtered-out images are never decoded.
+
+        ``previous`` may be the result of analyzing an earlier revision of the document.
+        Every page is then fingerprinted, and pages whose fingerprint matches a page of
+        the previous result reuse its placements instead of being re-analyzed. Pages are
+        only fingerprinted (which hashes all their content and image streams) with
+        ``previous`` or ``fingerprint_pages``; the fingerprints are returned under
+        ``page_fingerprints`` for a later incremental run or ``utils.diff_preflight``.
+
+        ``on_page(page_number, page_images, page_count)`` is called as each page is
+        finished, so callers can report progress or keep partial results.
+        """
         try:
+            peak_scope = 'document' if _reset_peak_rss() else 'process'
+            
             # Open PDF from bytes
             doc = fitz.open(stream=pdf_data, filetype="pdf")
+            file_hash = hashlib.sha256(pdf_data).hexdigest()
+            selected_pages = parse_page_selection(pages, len(doc))
+            
+            page_images, image_facts = self._reusable_work(resume_from, file_hash)
+            selected = set(selected_pages)
+            page_images = {page: page_images[page] for page in page_images if page - 1 in selected}
+            
+            previous_pages = self._previous_pages_by_fingerprint(previous)
+            fingerprint_pages = fingerprint_pages or previous is not None
+            stream_hashes = {}
+            page_fingerprints = {}
+            reused_pages = []
+            
+            # Process each selected page not already covered by a previous analysis
+            for page_num in selected_pages:
+                fingerprint = None
+                if fingerprint_pages:
+                    fingerprint, image_xrefs = self._page_fingerprint(doc, page_num, stream_hashes)
+                    page_fingerprints[page_num + 1] = {
+                        'fingerprint': fingerprint,
+                        'image_xrefs': image_xrefs
+                    }
+                
+                if page_num + 1 in page_images:
+                    images = self._filter_placements(doc, page_images[page_num + 1], image_filter)
+                elif fingerprint in previous_pages:
+                    reused = self._reuse_page(previous_pages[fingerprint], page_num + 1, image_xrefs)
+                    images = self._filter_placements(doc, reused, image_filter)
+                    reused_pages.append(page_num + 1)
+                else:
+                    images = self._analyze_page(doc, page_num, image_facts, image_filter, stream_hashes)
+                
+                page_images[page_num + 1] = images
+                if on_page:
+                    on_page(page_num + 1, images, len(doc))
+            
+            result = self._build_result(doc, file_hash, page_images, image_facts)
+            result['selection'] = {
+                'pages': pages,
+                'image_filter': image_filter is not None
+            }
+            result['page_fingerprints'] = page_fingerprints
+            doc.close()
+            doc = None
+            result['memory'] = self._memory_report(image_facts, peak_scope)
+            if previous is not None:
+                result['incremental'] = {
+                    'reused_pages': reused_pages,
+                    'reanalyzed_pages': [page for page in result['analyzed_pages'] if page not in reused_pages]
+                }
+            
+            return result
             
-            result = {
-                'error': None,
-                'total_pages': len(doc),
+        except Exception as e:
+            self.logger.error(f"Error analyzing PDF: {str(e)}")
+            return {
+                'error': str(e),
+                'total_pages': 0,
                 'total_images': 0,
-                'total_placements': 0,
-                'unique_images': 0,
                 'images': []
             }
+    
+    def quick_scan(self, pdf_data, sample_pages=24, distinct_images=True, seed=None):
+        """Analyze a stratified sample of pages for a fast first estimate
+
+        The document is split into ``sample_pages`` contiguous blocks and one random page
+        is analyzed from each block. With ``distinct_images`` every distinct image in the
+        document is also decoded once, so the per-image facts are exact even though the
+        placements are sampled. Pass the result to ``utils.estimate_quality_from_scan``
+        for estimates with confidence bounds, or to ``analyze_pdf(resume_from=...)`` to
+        continue into a full analysis.
+        """
+        try:
+            doc = fitz.open(stream=pdf_data, filetype="pdf")
+            file_hash = hashlib.sha256(pdf_data).hexdigest()
+            page_count = len(doc)
+            
+            sampled_pages = self._stratified_pages(page_count, sample_pages, random.Random(seed))
+            
+            page_images = {}
+            image_facts = {}
+            stream_hashes = {}
+            for page_num in sampled_pages:
+                page_images[page_num + 1] = self._analyze_page(
+                    doc, page_num, image_facts, stream_hashes=stream_hashes
+                )
+            
+            if distinct_images:
+                for xref in self._document_image_xrefs(doc):
+                    self._get_image_facts(doc, xref, image_facts, stream_hashes)
+            
+            result = self._build_result(doc, file_hash, page_images, image_facts)
+            result['scan'] = {
+                'sampled_pages': [page_num + 1 for page_num in sampled_pages],
+                'page_count': page_count,
+                'complete': len(sampled_pages) == page_count,
+                'distinct_images_scanned': distinct_images
+            }
+            doc.close()
             
-            placement_count = 0
-            processed_xrefs = set()
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"Error scanning PDF: {str(e)}")
+            return {
+                'error': str(e),
+                'total_pages': 0,
+                'total_images': 0,
+                'images': []
+            }
+    
+    def inventory(self, pdf_data, pages=None):
+        """List every image placement from content streams and image dictionaries only
+
+        Nothing is decoded: sizes, colorspaces and visible DPI come from metadata, and
+        each placement carries the ``stream_hash`` of its raw image stream (see
+        :func:`utils.compare_documents`). Previews, ink coverage and upsampling
+        estimates are left empty. ``pages`` is a page selection as for :meth:`analyze_pdf`.
+        """
+        try:
+            doc = fitz.open(stream=pdf_data, filetype="pdf")
+            file_hash = hashlib.sha256(pdf_data).hexdigest()
             
-            # Process each page
-            for page_num in range(len(doc)):
+            page_images = {}
+            image_facts = {}
+            stream_hashes = {}
+            for page_num in parse_page_selection(pages, len(doc)):
                 page = doc[page_num]
-                image_list = page.get_images(full=True)
+                draws_by_image = {}
+                for draw in walk_image_draws(doc, page):
+                    draws_by_image.setdefault(draw.xref or draw.inline_key, []).append(draw)
                 
-                # Process each unique image on this page
-                for img_index, img in enumerate(image_list):
-                    xref = img[0]  # Image reference number
-                    
-                    # Track unique images
-                    if xref not in processed_xrefs:
-                        processed_xrefs.add(xref)
-                    
-                    # Get all placement rectangles for this image on this page
-                    try:
-                        rects = page.get_image_rects(xref)
-                        if not rects:
-                            # Skip if no placement rects found - can't calculate visible DPI
-                            self.logger.warning(f"No placement rectangles found for xref {xref} on page {page_num + 1}")
-                            continue
-                    except Exception as e:
-                        self.logger.warning(f"Could not get image rects for xref {xref}: {str(e)}")
-                        continue
-                    
-                    # Create pixmap once per xref for efficiency
-                    pix = fitz.Pixmap(doc, xref)
-                    
-                    # Process each placement of this image
-                    for placement_index, rect in enumerate(rects):
-                        placement_count += 1
-                        
-                        # Get image properties with placement information
+                images = []
+                for key, draws in draws_by_image.items():
+                    if key not in image_facts:
+                        image_facts[key] = self._metadata_facts(doc, page, draws[0], stream_hashes)
+                    facts = image_facts[key]
+                    for placement_index, draw in enumerate(draws):
                         img_data = self._analyze_image_placement(
-                            doc, xref, pix, page_num + 1, placement_count, 
-                            rect, placement_index + 1, len(rects)
+                            facts, page_num + 1, draw, placement_index + 1, len(draws)
                         )
-                        
-                        if img_data:
-                            result['images'].append(img_data)
-                    
-                    # Clean up pixmap
-                    pix = None
-            
-            result['total_images'] = len(result['images'])  # Total placements
-            result['total_placements'] = len(result['images'])
-            result['unique_images'] = len(processed_xrefs)
+                        img_data['stream_hash'] = facts.get('stream_hash')
+                        images.append(img_data)
+                page_images[page_num + 1] = images
+            
+            result = self._build_result(doc, file_hash, page_images, image_facts)
             doc.close()
             
             return result
-            
+        
         except Exception as e:
-            self.logger.error(f"Error analyzing PDF: {str(e)}")
+            self.logger.error(f"Error listing PDF placements: {str(e)}")
             return {
                 'error': str(e),
                 'total_pages': 0,
@@ -88,94 +301,622 @@ class PDFAnalyzer:
                 'images': []
             }
     
-    def _analyze_image_placement(self, doc, xref, pix, page_num, placement_number, rect, placement_index, total_placements):
+    def _metadata_facts(self, doc, page, draw, stream_hashes):
+        """Describe an image from its dictionary (or inline header) and raw stream hash"""
+        facts = {
+            'xref': draw.xref,
+            'error': None,
+            'preview_handle': None,
+            'metadata_dpi': None,
+            'preview': None,
+            'dpi_method': 'visible_calculated',
+            'analysis_level': 'metadata'
+        }
+        try:
+            if draw.xref:
+                header = self._image_header(doc, draw.xref)
+                colorspace = self._colorspace_info(doc, draw.xref)
+                bits = doc.xref_get_key(draw.xref, "BitsPerComponent")
+                file_size, image_format, _ = self._raw_image_data(doc, draw.xref)
+                bit_depth = int(bits[1]) if bits[0] == 'int' else 8
+                stream_hash = self._stream_hash(doc, draw.xref, stream_hashes)
+            else:
+                header = draw.inline_header()
+                colorspace = self._inline_colorspace(doc, page, draw, header['colorspace'])
+                codecs = [name for name in header['filters'] if name in self.IMAGE_CODECS]
+                filters = codecs[-1:] or header['filters'][:1]
+                image_format = self.FILTER_FORMATS.get(filters[0], filters[0].upper()) if filters else 'RAW'
+                file_size = len(draw.inline_data)
+                bit_depth = header['bit_depth']
+                stream_hash = draw.inline_key
+            
+            facts.update({
+                'width': header['width'],
+                'height': header['height'],
+                'channels': colorspace['channels'],
+                'color_mode': self._color_mode_name(colorspace['channels']),
+                'bit_depth': bit_depth,
+                'format': image_format,
+                'file_size': file_size,
+                'original_colorspace': colorspace['name'],
+                'stream_hash': stream_hash,
+                'inline': draw.xref is None
+            })
+        except Exception as e:
+            self.logger.warning(f"Could not read image metadata on page {page.number + 1}: {str(e)}")
+            facts['error'] = str(e)
+        return facts
+    
+    def _memory_report(self, image_facts, peak_scope):
+        """Summarize memory use of the document just analyzed"""
+        return {
+            'peak_rss_bytes': _peak_rss(),
+            # 'process' when the OS cannot reset the peak counter per document
+            'peak_rss_scope': peak_scope,
+            'budget_bytes': self.memory_budget_bytes,
+            'metadata_only_images': sum(
+                1 for facts in image_facts.values() if facts.get('analysis_level') == 'metadata'
+            )
+        }
+    
+    def _stratified_pages(self, page_count, sample_pages, rng):
+        """Pick one random page (0-based) from each of ``sample_pages`` equal page blocks"""
+        if page_count <= sample_pages:
+            return list(range(page_count))
+        
+        pages = []
+        for stratum in range(sample_pages):
+            first = stratum * page_count // sample_pages
+            last = (stratum + 1) * page_count // sample_pages
+            pages.append(rng.randrange(first, last))
+        return pages
+    
+    def _document_image_xrefs(self, doc):
+        """List every image xref in the document, skipping soft masks"""
+        image_xrefs = []
+        mask_xrefs = set()
+        for xref in range(1, doc.xref_length()):
+            if doc.xref_get_key(xref, "Subtype") != ('name', '/Image'):
+                continue
+            image_xrefs.append(xref)
+            smask = doc.xref_get_key(xref, "SMask")
+            if smask[0] == 'xref':
+                mask_xrefs.add(int(smask[1].split()[0]))
+        return [xref for xref in image_xrefs if xref not in mask_xrefs]
+    
+    def _reusable_work(self, previous, file_hash):
+        """Return the per-page placements and per-xref facts a previous scan already produced"""
+        if not previous or previous.get('error'):
+            return {}, {}
+        if previous.get('file_hash') != file_hash:
+            self.logger.warning("Previous scan belongs to a different file, starting from scratch")
+            return {}, {}
+        
+        page_images = {page: [] for page in previous.get('analyzed_pages', [])}
+        for img in previous.get('images', []):
+            if img.get('page') in page_images:
+                page_images[img['page']].append(img)
+        return page_images, dict(previous.get('image_facts', {}))
+    
+    def _stream_hash(self, doc, xref, stream_hashes):
+        """Hash an object's raw (still compressed) stream once per document"""
+        if xref not in stream_hashes:
+            digest = hashlib.blake2b(doc.xref_stream_raw(xref) or b'', digest_size=16)
+            # Indirect reference numbers change between revisions, the dictionary itself matters
+            digest.update(re.sub(rb'\d+ \d+ R', b'R', doc.xref_object(xref, compressed=True).encode()))
+            stream_hashes[xref] = digest.hexdigest()
+        return stream_hashes[xref]
+    
+    def _page_fingerprint(self, doc, page_num, stream_hashes):
+        """Fingerprint a page by its geometry, content streams and referenced image streams
+
+        Returns the fingerprint and the page's image xrefs in resource order, which is
+        used to map reused placements onto the xref numbers of a new revision.
+        """
+        page = doc[page_num]
+        digest = hashlib.sha256()
+        digest.update(f"{tuple(page.rect)}|{page.rotation}".encode())
+        
+        for xref in page.get_contents():
+            digest.update(self._stream_hash(doc, xref, stream_hashes).encode())
+        
+        # Form XObjects can draw images too, their content is part of the page
+        for xobject in page.get_xobjects():
+            digest.update(self._stream_hash(doc, xobject[0], stream_hashes).encode())
+        
+        image_xrefs = []
+        for img in page.get_images(full=True):
+            digest.update(img[7].encode())  # Resource name used by the content stream
+            digest.update(self._stream_hash(doc, img[0], stream_hashes).encode())
+            if img[0] not in image_xrefs:
+                image_xrefs.append(img[0])
+        
+        return digest.hexdigest(), image_xrefs
+    
+    def _previous_pages_by_fingerprint(self, previous):
+        """Index a previous result's pages by fingerprint"""
+        if not previous or previous.get('error'):
+            return {}
+        
+        images_by_page = {}
+        for img in previous.get('images', []):
+            images_by_page.setdefault(img.get('page'), []).append(img)
+        
+        pages = {}
+        for page, record in previous.get('page_fingerprints', {}).items():
+            # Keys become strings when a result has been stored as JSON
+            page = int(page)
+            pages.setdefault(record['fingerprint'], {
+                'image_xrefs': record['image_xrefs'],
+                'images': images_by_page.get(page, [])
+            })
+        return pages
+    
+    def _filter_placements(self, doc, images, image_filter):
+        """Apply this run's image filter to placements reused from an earlier analysis"""
+        if not image_filter:
+            return images
+        return [
+            img for img in images
+            if image_filter(
+                self._image_header(doc, img['xref']) if img.get('xref')
+                else self._inline_header(img.get('width', 0), img.get('height', 0))
+            )
+        ]
+    
+    def _reuse_page(self, previous_page, page, image_xrefs):
+        """Copy a previous revision's placements for an unchanged page"""
+        # Identical pages list their images in the same order, even if xrefs were renumbered
+        xref_map = dict(zip(previous_page['image_xrefs'], image_xrefs))
+        
+        page_images = []
+        for img in previous_page['images']:
+            img_data = dict(img)
+            img_data['page'] = page
+            img_data['xref'] = xref_map.get(img.get('xref'), img.get('xref'))
+            page_images.append(img_data)
+        return page_images
+    
+    def _build_result(self, doc, file_hash, page_images, image_facts):
+        """Assemble the result dict from per-page placements in page order"""
+        images = []
+        for page in sorted(page_images):
+            images.extend(page_images[page])
+        
+        # Placements are numbered across the whole document in page order
+        for placement_number, img_data in enumerate(images, 1):
+            img_data['image_number'] = placement_number
+        
+        return {
+            'error': None,
+            'file_hash': file_hash,
+            'total_pages': len(doc),
+            'total_images': len(images),  # Total placements
+            'total_placements': len(images),
+            'unique_images': len({img['xref'] for img in images if img.get('xref')}),
+            'analyzed_pages': sorted(page_images),
+            'image_facts': image_facts,
+            'images': images
+        }
+    
+    def _image_header(self, doc, xref):
+        """Read cheap image properties from the image dictionary without decoding"""
+        width = doc.xref_get_key(xref, "Width")
+        height = doc.xref_get_key(xref, "Height")
+        width = int(width[1]) if width[0] == 'int' else 0
+        height = int(height[1]) if height[0] == 'int' else 0
+        return {
+            'xref': xref,
+            'width': width,
+            'height': height,
+            'megapixels': (width * height) / 1000000.0
+        }
+    
+    def _inline_header(self, width, height):
+        """Filter header of an inline image, which has no xref"""
+        return {
+            'xref': None,
+            'width': width,
+            'height': height,
+            'megapixels': (width * height) / 1000000.0
+        }
+    
+    def _decoded_size(self, doc, xref, colorspace=None):
+        """Bytes a full-resolution pixmap of the image would take"""
+        header = self._image_header(doc, xref)
+        colorspace = colorspace or self._colorspace_info(doc, xref)
+        # Unknown colorspaces (e.g. JPX) are assumed to be the widest common one
+        return header['width'] * header['height'] * (colorspace['channels'] or 4)
+    
+    def _exceeds_memory_budget(self, doc, xref, colorspace=None):
+        """Whether decoding the image would exceed the configured memory budget"""
+        return bool(self.memory_budget_bytes) and self._decoded_size(doc, xref, colorspace) > self.memory_budget_bytes
+    
+    def _analyze_page(self, doc, page_num, image_facts, image_filter=None, stream_hashes=None):
+        """Analyze every image placement on one page (0-based ``page_num``)
+
+        Placements come from one walk of the page's content, which also finds inline
+        images and images drawn by nested forms, without decoding anything.
+        """
+        page = doc[page_num]
+        page_images = []
+        
+        # Group draws by image, in the order images are first drawn
+        draws_by_image = {}
+        for draw in walk_image_draws(doc, page):
+            draws_by_image.setdefault(draw.xref or draw.inline_key, []).append(draw)
+        
+        for draws in draws_by_image.values():
+            first = draws[0]
+            if first.xref:
+                if image_filter and not image_filter(self._image_header(doc, first.xref)):
+                    continue
+                # Decoded image facts are shared by every placement of the xref
+                facts = self._get_image_facts(doc, first.xref, image_facts, stream_hashes)
+            else:
+                header = first.inline_header()
+                if image_filter and not image_filter(self._inline_header(header['width'], header['height'])):
+                    continue
+                facts = self._get_inline_image_facts(doc, page, first, image_facts)
+            
+            # Process each placement of this image
+            for placement_index, draw in enumerate(draws):
+                img_data = self._analyze_image_placement(
+                    facts, page_num + 1, draw, placement_index + 1, len(draws)
+                )
+                
+                if img_data:
+                    page_images.append(img_data)
+        
+        # Drop decoded images MuPDF keeps in its resource store before the next page
+        if self.memory_budget_bytes:
+            page = None
+            fitz.TOOLS.store_shrink(100)
+        
+        return page_images
+    
+    def _get_inline_image_facts(self, doc, page, draw, image_facts):
+        """Describe an inline image once per document, keyed by its content"""
+        key = draw.inline_key
+        if key in image_facts:
+            return image_facts[key]
+        
+        header = draw.inline_header()
+        colorspace = self._inline_colorspace(doc, page, draw, header['colorspace'])
+        codecs = [name for name in header['filters'] if name in self.IMAGE_CODECS]
+        if codecs:
+            image_format = self.FILTER_FORMATS[codecs[-1]]
+        elif header['filters']:
+            image_format = self.FILTER_FORMATS.get(header['filters'][0], header['filters'][0].upper())
+        else:
+            image_format = 'RAW'
+        
+        facts = {
+            'xref': None,
+            'error': None,
+            'preview_handle': key,
+            'width': header['width'],
+            'height': header['height'],
+            'channels': colorspace['channels'],
+            'color_mode': self._color_mode_name(colorspace['channels']),
+            'bit_depth': header['bit_depth'],
+            'format': image_format,
+            'file_size': len(draw.inline_data),
+            'metadata_dpi': None,
+            'preview': None,
+            'phash': None,
+            'dhash': None,
+            'tac_max': None,
+            'tac_p99': None,
+            'tac_mean': None,
+            'detail_ratio': None,
+            'dpi_method': 'visible_calculated',
+            'original_colorspace': colorspace['name'],
+            'analysis_level': 'metadata',
+            'inline': True
+        }
+        
+        try:
+            if header['filters'] == ['DCTDecode']:
+                facts['metadata_dpi'] = self._extract_dpi_from_image_data(draw.inline_data, 'JPEG')
+                if facts['metadata_dpi']:
+                    facts['dpi_method'] = 'visible_calculated + metadata_extracted'
+            img = self._decode_inline(draw, header, colorspace)
+            if img is not None:
+                facts.update(self._create_preview_image(img))
+                facts.update(self._image_ink_coverage(img))
+                facts.update(self._image_detail(img))
+                facts['analysis_level'] = 'decoded'
+        except Exception as e:
+            self.logger.debug(f"Could not decode inline image on page {page.number + 1}: {str(e)}")
+        
+        if not facts['metadata_dpi']:
+            facts['metadata_dpi'] = self._estimate_dpi(facts['width'], facts['height'])
+        
+        image_facts[key] = facts
+        return facts
+    
+    def _inline_colorspace(self, doc, page, draw, colorspace):
+        """Resolve an inline image's colorspace, which may name a resource of its content stream"""
+        if colorspace == 'ImageMask':
+            return {'name': 'ImageMask', 'channels': 1}
+        if isinstance(colorspace, list) and colorspace and colorspace[0] == 'Indexed':
+            base = self._inline_colorspace(doc, page, draw, colorspace[1] if len(colorspace) > 1 else None)
+            return {'name': f"Indexed({base['name']})", 'channels': base['channels']}
+        if not isinstance(colorspace, str):
+            return {'name': None, 'channels': None}
+        if colorspace in self.COLORSPACE_CHANNELS:
+            return {'name': colorspace, 'channels': self.COLORSPACE_CHANNELS[colorspace]}
+        
+        kind, value = doc.xref_get_key(draw.referencer or page.xref, f"Resources/ColorSpace/{colorspace}")
+        if kind == 'null':
+            return {'name': colorspace, 'channels': None}
+        return self._parse_colorspace(doc, value)
+    
+    # Pillow modes for 8-bit inline image data by channel count
+    INLINE_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+    
+    def _decode_inline(self, draw, header, colorspace):
+        """Decode an inline image with Pillow where the encoding allows; None otherwise"""
+        from PIL import Image
+        
+        data = draw.inline_data
+        if header['filters'] == ['DCTDecode']:
+            return Image.open(io.BytesIO(data))
+        if header['filters'] == ['FlateDecode']:
+            data = zlib.decompress(data)
+        elif header['filters']:
+            return None
+        
+        mode = self.INLINE_MODES.get(colorspace['channels'])
+        if header['bit_depth'] != 8 or mode is None or (colorspace['name'] or '').startswith('Indexed'):
+            return None
+        return Image.frombytes(mode, (header['width'], header['height']), data)
+    
+    def _image_index_key(self, doc, xref, stream_hashes):
+        """Key an image by its raw stream, dictionary and the colorspace objects it uses
+
+        The key also covers the settings the stored facts depend on: whether the memory
+        budget limits the image to metadata or a reduced decode, and the preview encoding.
+        """
+        key = hashlib.blake2b(self._stream_hash(doc, xref, stream_hashes).encode(), digest_size=16)
+        key.update(f"{self._exceeds_memory_budget(doc, xref)}:{self.preview_format}:{self.preview_quality}".encode())
+        
+        # Resolve colorspace references (ICC profiles, Indexed lookups) a couple of levels deep
+        pending = [doc.xref_get_key(xref, "ColorSpace")[1]]
+        for _ in range(3):
+            referenced = [int(ref) for text in pending for ref in re.findall(r'(\d+) \d+ R', text)]
+            for ref in referenced:
+                key.update(self._stream_hash(doc, ref, stream_hashes).encode())
+            pending = [doc.xref_object(ref, compressed=True) for ref in referenced]
+        
+        return key.hexdigest()
+    
+    def _get_image_facts(self, doc, xref, image_facts, stream_hashes=None):
+        """Decode an image once per document and cache its placement-independent facts
+
+        With an image index the facts are also looked up by raw stream hash, so an image
+        already seen in another document is not decoded at all.
+        """
+        if xref in image_facts:
+            return image_facts[xref]
+        
+        index_key = None
+        if self.image_index is not None:
+            try:
+                index_key = self._image_index_key(doc, xref, stream_hashes if stream_hashes is not None else {})
+                indexed = self.image_index.get(index_key)
+            except Exception as e:
+                self.logger.warning(f"Image index lookup failed for xref {xref}: {str(e)}")
+                indexed = None
+            
+            if indexed is not None:
+                facts = dict(indexed, xref=xref, error=None, preview_handle=index_key)
+                facts['preview'] = self.image_index.get_preview(index_key)
+                image_facts[xref] = facts
+                return facts
+        
+        facts = {'xref': xref, 'error': None, 'preview_handle': index_key}
+        try:
+            colorspace = self._colorspace_info(doc, xref)
+            facts.update({
+                'format': None,
+                'metadata_dpi': None,  # Original embedded DPI
+                'bit_depth': 8,  # Most common, could be refined
+                'file_size': 0,
+                'preview': None,
+                'phash': None,
+                'dhash': None,
+                'tac_max': None,
+                'tac_p99': None,
+                'tac_mean': None,
+                'detail_ratio': None,
+                'dpi_method': 'visible_calculated',
+                'original_colorspace': colorspace['name']
+            })
+            
+            pix = None
+            reduced = None
+            header = self._image_header(doc, xref)
+            is_large = max(header['width'], header['height']) > self.FULL_DECODE_MAX_SIDE
+            if self._exceeds_memory_budget(doc, xref, colorspace) or (is_large and colorspace['channels']):
+                # Describe big images from the image dictionary and decode them at reduced size only
+                bits = doc.xref_get_key(xref, "BitsPerComponent")
+                facts.update({
+                    'width': header['width'],
+                    'height': header['height'],
+                    'channels': colorspace['channels'],
+                    'color_mode': self._color_mode_name(colorspace['channels']),
+                    'bit_depth': int(bits[1]) if bits[0] == 'int' else facts['bit_depth'],
+                    'analysis_level': 'metadata'
+                })
+                reduced = self._decode_reduced(doc, xref, self.PREVIEW_SIZE)
+                if reduced is not None:
+                    facts['analysis_level'] = 'reduced'
+            else:
+                pix = fitz.Pixmap(doc, xref)
+                facts.update({
+                    'width': pix.width,  # Native pixel width
+                    'height': pix.height,  # Native pixel height
+                    'channels': pix.n,
+                    'color_mode': self._get_color_mode(pix),
+                    'analysis_level': 'decoded'
+                })
+            
+            # Size, format and embedded metadata come from the raw stream, not a re-encode
+            try:
+                file_size, image_format, encoded = self._raw_image_data(doc, xref)
+                facts['file_size'] = file_size
+                facts['format'] = image_format
+                
+                # Try to get metadata DPI from original image
+                if encoded is not None:
+                    metadata_dpi = self._extract_dpi_from_image_data(encoded, image_format)
+                    if metadata_dpi:
+                        facts['metadata_dpi'] = metadata_dpi
+                        facts['dpi_method'] = 'visible_calculated + metadata_extracted'
+                
+            except Exception as e:
+                self.logger.warning(f"Could not read original image data: {str(e)}")
+            
+            # Estimate metadata DPI if not found (keep for reference)
+            if not facts['metadata_dpi']:
+                facts['metadata_dpi'] = self._estimate_dpi(facts['width'], facts['height'])
+            
+            # Generate preview and perceptual hashes
+            try:
+                if pix is not None:
+                    facts.update(self._create_preview(pix))
+                elif reduced is not None:
+                    facts.update(self._create_preview_image(reduced))
+            except Exception as e:
+                self.logger.warning(f"Could not create preview: {str(e)}")
+            
+            # Ink coverage reads the pixels already decoded for the preview
+            try:
+                if pix is not None:
+                    facts.update(self._pixmap_ink_coverage(pix))
+                elif reduced is not None:
+                    facts.update(self._image_ink_coverage(reduced))
+            except Exception as e:
+                self.logger.warning(f"Could not measure ink coverage of xref {xref}: {str(e)}")
+            
+            # Upsampling is judged at native resolution, on a bounded window of the image
+            try:
+                if pix is not None:
+                    facts.update(self._pixmap_detail(pix))
+                else:
+                    facts.update(self._rendered_detail(doc, xref, facts['width'], facts['height']))
+            except Exception as e:
+                self.logger.warning(f"Could not estimate native resolution of xref {xref}: {str(e)}")
+            
+            # Clean up pixmap
+            pix = None
+            reduced = None
+            
+        except Exception as e:
+            self.logger.warning(f"Could not decode image xref {xref}: {str(e)}")
+            facts['error'] = str(e)
+        
+        if index_key and not facts['error']:
+            self._store_in_index(index_key, facts)
+        
+        image_facts[xref] = facts
+        return facts
+    
+    def _store_in_index(self, index_key, facts):
+        """Add decoded facts to the image index, with the preview stored alongside"""
+        try:
+            stored = {
+                key: value for key, value in facts.items()
+                if key not in ('xref', 'error', 'preview', 'preview_handle')
+            }
+            self.image_index.put(index_key, stored, facts['preview'])
+        except Exception as e:
+            self.logger.warning(f"Could not store image facts in index: {str(e)}")
+    
+    def _analyze_image_placement(self, facts, page_num, draw, placement_index, total_placements):
         """Analyze individual image placement properties including visible DPI"""
         try:
+            if facts['error']:
+                raise ValueError(facts['error'])
+            
+            # Placed size along the image's own axes, so rotated placements are measured correctly
+            rect = draw.rect
+            placed_width, placed_height = draw.placed_size
+            
             # Calculate placement dimensions in inches (PDF points to inches: 1 inch = 72 points)
-            placed_width_in = rect.width / 72.0 if rect.width > 0 else None
-            placed_height_in = rect.height / 72.0 if rect.height > 0 else None
+            placed_width_in = placed_width / 72.0 if placed_width > 0 else None
+            placed_height_in = placed_height / 72.0 if placed_height > 0 else None
             
             # Calculate effective DPI based on actual placement
             if placed_width_in and placed_height_in and placed_width_in > 0 and placed_height_in > 0:
-                eff_ppi_x = pix.width / placed_width_in
-                eff_ppi_y = pix.height / placed_height_in
+                eff_ppi_x = facts['width'] / placed_width_in
+                eff_ppi_y = facts['height'] / placed_height_in
                 visible_dpi = min(eff_ppi_x, eff_ppi_y)  # Use the limiting dimension
             else:
                 eff_ppi_x = None
                 eff_ppi_y = None
                 visible_dpi = None
             
+            # Resolution the image really carries, when it was upsampled before placing
+            detail_ratio = facts.get('detail_ratio')
+            estimated_native_dpi = visible_dpi * detail_ratio if visible_dpi and detail_ratio else None
+            
             img_data = {
                 'page': page_num,
-                'image_number': placement_number,
+                'image_number': None,  # Assigned once the whole document is assembled
                 'placement_index': placement_index,
                 'total_placements_of_image': total_placements,
-                'xref': xref,
-                'width': pix.width,  # Native pixel width
-                'height': pix.height,  # Native pixel height
+                'xref': facts['xref'],
+                'width': facts['width'],
+                'height': facts['height'],
                 'placed_width_in': round(placed_width_in, 3) if placed_width_in else None,
                 'placed_height_in': round(placed_height_in, 3) if placed_height_in else None,
-                'placed_width_points': round(rect.width, 1),
-                'placed_height_points': round(rect.height, 1),
+                'placed_width_points': round(placed_width, 1),
+                'placed_height_points': round(placed_height, 1),
                 'eff_ppi_x': round(eff_ppi_x, 1) if eff_ppi_x else None,
                 'eff_ppi_y': round(eff_ppi_y, 1) if eff_ppi_y else None,
                 'visible_dpi': round(visible_dpi, 1) if visible_dpi else None,
-                'channels': pix.n,
-                'format': None,
-                'color_mode': self._get_color_mode(pix),
-                'metadata_dpi': None,  # Original embedded DPI
-                'bit_depth': None,
-                'file_size': 0,
-                'preview_base64': None,
-                'dpi_method': 'visible_calculated',
-                'pixel_density': (pix.width * pix.height) / 1000000.0,  # Megapixels
-                'original_colorspace': None,
+                'estimated_native_dpi': round(estimated_native_dpi, 1) if estimated_native_dpi else None,
+                'detail_ratio': detail_ratio,
+                'channels': facts['channels'],
+                'format': facts['format'],
+                'color_mode': facts['color_mode'],
+                'metadata_dpi': facts['metadata_dpi'],
+                'bit_depth': facts['bit_depth'],
+                'file_size': facts['file_size'],
+                'preview': facts['preview'],
+                'preview_handle': facts['preview_handle'],
+                'phash': facts.get('phash'),
+                'dhash': facts.get('dhash'),
+                'tac_max': facts.get('tac_max'),
+                'tac_p99': facts.get('tac_p99'),
+                'dpi_method': facts['dpi_method'],
+                'analysis_level': facts.get('analysis_level', 'decoded'),
+                'pixel_density': (facts['width'] * facts['height']) / 1000000.0,  # Megapixels
+                'original_colorspace': facts['original_colorspace'],
                 'placement_rect': {
                     'x0': round(rect.x0, 1),
                     'y0': round(rect.y0, 1), 
                     'x1': round(rect.x1, 1),
                     'y1': round(rect.y1, 1)
                 },
+                # Part of the placement left visible by a clipping path, when one cuts it
+                'clip_rect': self._rect_dict(draw.visible_rect),
+                'inline': facts.get('inline', False),
                 'error': None
             }
             
-            # Try to get original image data from PDF
-            try:
-                img_dict = doc.extract_image(xref)
-                img_data['file_size'] = len(img_dict['image'])
-                img_data['format'] = img_dict['ext'].upper()
-                
-                # Try to get metadata DPI from original image
-                if img_dict['ext'] in ['jpg', 'jpeg', 'png', 'tiff']:
-                    metadata_dpi = self._extract_dpi_from_image_data(img_dict['image'], img_dict['ext'])
-                    if metadata_dpi:
-                        img_data['metadata_dpi'] = metadata_dpi
-                        img_data['dpi_method'] = 'visible_calculated + metadata_extracted'
-                
-            except Exception as e:
-                self.logger.warning(f"Could not extract original image data: {str(e)}")
-            
-            # Estimate metadata DPI if not found (keep for reference)
-            if not img_data['metadata_dpi']:
-                img_data['metadata_dpi'] = self._estimate_dpi(pix.width, pix.height)
-            
-            # Get bit depth
-            img_data['bit_depth'] = 8  # Most common, could be refined
-            
-            # Generate preview
-            try:
-                img_data['preview_base64'] = self._create_preview(pix)
-            except Exception as e:
-                self.logger.warning(f"Could not create preview: {str(e)}")
-            
             return img_data
             
         except Exception as e:
-            self.logger.error(f"Error analyzing image placement {placement_number}: {str(e)}")
+            self.logger.error(f"Error analyzing placement of xref {facts['xref']} on page {page_num}: {str(e)}")
             return {
                 'page': page_num,
-                'image_number': placement_number,
+                'image_number': None,
                 'placement_index': placement_index,
+                'xref': facts['xref'],
                 'error': str(e),
                 'width': 0,
                 'height': 0,
@@ -187,21 +928,139 @@ class PDFAnalyzer:
                 'placed_height_in': 0
             }
     
+    def _rect_dict(self, rect):
+        """Rounded rect as a dict, as placement rects are reported"""
+        if rect is None:
+            return None
+        return {'x0': round(rect.x0, 1), 'y0': round(rect.y0, 1), 'x1': round(rect.x1, 1), 'y1': round(rect.y1, 1)}
+    
+    # Format reported for each PDF stream filter; the last image codec in a chain wins
+    FILTER_FORMATS = {
+        'DCTDecode': 'JPEG',
+        'JPXDecode': 'JPX',
+        'JBIG2Decode': 'JBIG2',
+        'CCITTFaxDecode': 'CCITT',
+        'FlateDecode': 'FLATE',
+        'LZWDecode': 'LZW',
+        'RunLengthDecode': 'RLE'
+    }
+    IMAGE_CODECS = ('DCTDecode', 'JPXDecode', 'JBIG2Decode', 'CCITTFaxDecode')
+    
+    def _stream_filters(self, doc, xref):
+        """List the filter names applied to a stream, outermost first"""
+        filter_value = doc.xref_get_key(xref, "Filter")
+        return re.findall(r'/(\w+)', filter_value[1]) if filter_value[0] in ('name', 'array') else []
+    
+    def _raw_image_data(self, doc, xref):
+        """Get compressed size, format and sniffable encoded bytes from the image stream
+
+        ``file_size`` is the stream's size inside the PDF. The encoded bytes are only
+        returned when the stream holds a self-contained image file (JPEG) whose headers
+        may carry resolution metadata; PyMuPDF extraction is only used when such a file
+        is wrapped in further filters.
+        """
+        filters = self._stream_filters(doc, xref)
+        codecs = [name for name in filters if name in self.IMAGE_CODECS]
+        if codecs:
+            image_format = self.FILTER_FORMATS[codecs[-1]]
+        elif filters:
+            image_format = self.FILTER_FORMATS.get(filters[0], filters[0].upper())
+        else:
+            image_format = 'RAW'
+        
+        raw = None
+        length = doc.xref_get_key(xref, "Length")
+        if length[0] == 'int':
+            file_size = int(length[1])
+        else:
+            raw = doc.xref_stream_raw(xref)
+            file_size = len(raw)
+        
+        encoded = None
+        if filters == ['DCTDecode']:
+            encoded = raw if raw is not None else doc.xref_stream_raw(xref)
+        elif codecs == ['DCTDecode']:
+            # JPEG wrapped in e.g. FlateDecode, extraction strips the outer filters
+            encoded = doc.extract_image(xref)['image']
+        
+        return file_size, image_format, encoded
+    
     def _get_color_mode(self, pix):
         """Determine color mode from pixmap"""
-        if pix.n == 1:
+        return self._color_mode_name(pix.n, pix.alpha)
+    
+    def _color_mode_name(self, channels, alpha=False):
+        """Name the color mode for a channel count"""
+        if channels is None:
+            return "Unknown"
+        elif channels == 1:
             return "Grayscale"
-        elif pix.n == 3:
+        elif channels == 3:
             return "RGB"
-        elif pix.n == 4:
-            if pix.alpha:
+        elif channels == 4:
+            if alpha:
                 return "RGBA"
             else:
                 return "CMYK"
-        elif pix.n == 2:
+        elif channels == 2:
             return "Grayscale + Alpha"
         else:
-            return f"{pix.n}-channel"
+            return f"{channels}-channel"
+    
+    # Components of the colorspace families that name their own channel count
+    COLORSPACE_CHANNELS = {
+        'DeviceGray': 1,
+        'CalGray': 1,
+        'DeviceRGB': 3,
+        'CalRGB': 3,
+        'Lab': 3,
+        'DeviceCMYK': 4,
+        'Separation': 1
+    }
+    
+    def _colorspace_info(self, doc, xref):
+        """Read an image's colorspace name and channel count from its dictionary"""
+        if doc.xref_get_key(xref, "ImageMask")[1] == 'true':
+            return {'name': 'ImageMask', 'channels': 1}
+        
+        kind, value = doc.xref_get_key(xref, "ColorSpace")
+        if kind == 'null':
+            # JPX images may carry their colorspace inside the codestream
+            return {'name': None, 'channels': None}
+        return self._parse_colorspace(doc, value)
+    
+    def _parse_colorspace(self, doc, value, depth=0):
+        """Resolve a colorspace object (name, array or reference) to name and channels"""
+        value = value.strip()
+        reference = re.match(r'(\d+) \d+ R', value)
+        if reference and depth < 4:
+            return self._parse_colorspace(doc, doc.xref_object(int(reference.group(1)), compressed=True), depth + 1)
+        
+        family = re.match(r'\[?\s*/(\w+)', value)
+        if not family:
+            return {'name': None, 'channels': None}
+        name = family.group(1)
+        rest = value[family.end():]
+        
+        if name in self.COLORSPACE_CHANNELS:
+            return {'name': name, 'channels': self.COLORSPACE_CHANNELS[name]}
+        
+        if name == 'ICCBased':
+            profile = re.search(r'(\d+) \d+ R', rest)
+            components = doc.xref_get_key(int(profile.group(1)), "N") if profile else ('null', 'null')
+            return {'name': name, 'channels': int(components[1]) if components[0] == 'int' else None}
+        
+        if name == 'Indexed' and depth < 4:
+            # Indexed images decode to their base colorspace
+            base = self._parse_colorspace(doc, rest, depth + 1)
+            return {'name': f"Indexed({base['name']})", 'channels': base['channels']}
+        
+        if name == 'DeviceN':
+            colorants = re.match(r'\s*\[([^\]]*)\]', rest)
+            channels = len(re.findall(r'/', colorants.group(1))) if colorants else None
+            return {'name': name, 'channels': channels}
+        
+        return {'name': name, 'channels': None}
     
     def _estimate_dpi(self, width, height):
         """Estimate DPI based on image dimensions"""
@@ -222,85 +1081,455 @@ class PDFAnalyzer:
         else:
             return 72
     
+    # Resolution metadata lives in the first segments/chunks; never look past this
+    HEADER_READ_LIMIT = 128 * 1024
+    
     def _extract_dpi_from_image_data(self, image_data, format):
-        """Extract DPI from image metadata"""
+        """Extract DPI from image metadata
+
+        Only the header region of ``image_data`` (bytes or memoryview) is read. TIFF
+        IFDs may sit anywhere in the file, so TIFF gets a zero-copy view of the whole
+        buffer but still only reads the first IFD.
+        """
+        data = memoryview(image_data)
         try:
             if format.lower() in ['jpg', 'jpeg']:
-                return self._extract_jpeg_dpi(image_data)
+                return self._extract_jpeg_dpi(data[:self.HEADER_READ_LIMIT])
             elif format.lower() == 'png':
-                return self._extract_png_dpi(image_data)
+                return self._extract_png_dpi(data[:self.HEADER_READ_LIMIT])
             elif format.lower() in ['tif', 'tiff']:
-                return self._extract_tiff_dpi(image_data)
+                return self._extract_tiff_dpi(data)
         except Exception as e:
             self.logger.debug(f"Could not extract DPI from {format}: {str(e)}")
         
         return None
     
     def _extract_jpeg_dpi(self, image_data):
-        """Extract DPI from JPEG EXIF data"""
-        try:
-            # Look for JFIF header
-            pos = image_data.find(b'JFIF')
-            if pos != -1:
-                # JFIF density info starts 5 bytes after "JFIF"
-                density_pos = pos + 7
-                if density_pos + 4 < len(image_data):
-                    units = image_data[density_pos]
-                    x_density = struct.unpack('>H', image_data[density_pos+1:density_pos+3])[0]
-                    
-                    if units == 1:  # DPI
-                        return x_density
-                    elif units == 2:  # DPC (dots per cm)
-                        return int(x_density * 2.54)
-        except:
-            pass
+        """Extract DPI by walking JPEG marker segments up to the start of scan
+
+        EXIF (APP1) resolution is preferred, then Photoshop resolution info (APP13),
+        then the JFIF density (APP0).
+        """
+        data = memoryview(image_data)
+        if bytes(data[:2]) != b'\xff\xd8':
+            return None
+        
+        found = {}
+        pos = 2
+        while pos + 4 <= len(data):
+            if data[pos] != 0xFF:
+                break
+            marker = data[pos + 1]
+            if marker == 0xFF:  # Fill byte
+                pos += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+                pos += 2
+                continue
+            if marker in (0xDA, 0xD9):  # Start of scan / end of image: headers are over
+                break
+            
+            length = struct.unpack_from('>H', data, pos + 2)[0]
+            segment = data[pos + 4:pos + 2 + length]
+            
+            if marker == 0xE0 and bytes(segment[:5]) == b'JFIF\x00' and len(segment) >= 12:
+                units = segment[7]
+                x_density = struct.unpack_from('>H', segment, 8)[0]
+                if units == 1:  # DPI
+                    found.setdefault('jfif', x_density)
+                elif units == 2:  # DPC (dots per cm)
+                    found.setdefault('jfif', int(x_density * 2.54))
+            elif marker == 0xE1 and bytes(segment[:6]) == b'Exif\x00\x00':
+                exif_dpi = self._extract_tiff_dpi(segment[6:])
+                if exif_dpi:
+                    found.setdefault('exif', exif_dpi)
+            elif marker == 0xED and bytes(segment[:14]) == b'Photoshop 3.0\x00':
+                photoshop_dpi = self._extract_photoshop_dpi(segment[14:])
+                if photoshop_dpi:
+                    found.setdefault('photoshop', photoshop_dpi)
+            
+            pos += 2 + length
+        
+        for source in ('exif', 'photoshop', 'jfif'):
+            if found.get(source):
+                return found[source]
+        return None
+    
+    def _extract_photoshop_dpi(self, resources):
+        """Read the ResolutionInfo (0x03ED) block from Photoshop image resources"""
+        pos = 0
+        while pos + 12 <= len(resources) and bytes(resources[pos:pos + 4]) == b'8BIM':
+            resource_id = struct.unpack_from('>H', resources, pos + 4)[0]
+            name_length = resources[pos + 6]
+            # Pascal string name, padded so that length byte + name is even
+            pos += 6 + name_length + 1 + ((name_length + 1) % 2)
+            if pos + 4 > len(resources):
+                break
+            size = struct.unpack_from('>I', resources, pos)[0]
+            pos += 4
+            
+            if resource_id == 0x03ED and size >= 4 and pos + 4 <= len(resources):
+                # Horizontal resolution in pixels per inch, 16.16 fixed point
+                return round(struct.unpack_from('>I', resources, pos)[0] / 65536.0)
+            
+            pos += size + (size % 2)
         return None
     
     def _extract_png_dpi(self, image_data):
-        """Extract DPI from PNG pHYs chunk"""
-        try:
-            # Look for pHYs chunk
-            pos = image_data.find(b'pHYs')
-            if pos != -1:
-                # pHYs data starts 4 bytes after chunk name
-                data_pos = pos + 4
-                if data_pos + 8 < len(image_data):
-                    x_pixels_per_unit = struct.unpack('>I', image_data[data_pos:data_pos+4])[0]
-                    unit_specifier = image_data[data_pos+8]
-                    
-                    if unit_specifier == 1:  # meters
-                        return int(x_pixels_per_unit / 39.3701)  # Convert to DPI
-        except:
-            pass
+        """Extract DPI from the PNG pHYs chunk, walking chunks up to the image data"""
+        data = memoryview(image_data)
+        if bytes(data[:8]) != b'\x89PNG\r\n\x1a\n':
+            return None
+        
+        pos = 8
+        while pos + 8 <= len(data):
+            length, chunk_type = struct.unpack_from('>I4s', data, pos)
+            if chunk_type in (b'IDAT', b'IEND'):  # pHYs must come before the image data
+                break
+            
+            if chunk_type == b'pHYs' and length >= 9 and pos + 17 <= len(data):
+                x_pixels_per_unit = struct.unpack_from('>I', data, pos + 8)[0]
+                unit_specifier = data[pos + 16]
+                if unit_specifier == 1:  # meters
+                    return round(x_pixels_per_unit * 0.0254)  # Convert to DPI
+                return None
+            
+            pos += 12 + length  # Length, type, data and CRC
         return None
     
     def _extract_tiff_dpi(self, image_data):
-        """Extract DPI from TIFF metadata"""
-        try:
-            # Basic TIFF DPI extraction would be complex
-            # For now, return None and use estimation
-            pass
-        except:
-            pass
+        """Extract DPI from XResolution/ResolutionUnit in the first TIFF IFD
+
+        Also used for the TIFF structure embedded in JPEG EXIF segments.
+        """
+        data = memoryview(image_data)
+        byte_order = bytes(data[:4])
+        if byte_order == b'II*\x00':
+            endian = '<'
+        elif byte_order == b'MM\x00*':
+            endian = '>'
+        else:
+            return None
+        
+        ifd_offset = struct.unpack_from(endian + 'I', data, 4)[0]
+        if ifd_offset + 2 > len(data):
+            return None
+        entry_count = struct.unpack_from(endian + 'H', data, ifd_offset)[0]
+        
+        x_resolution = None
+        resolution_unit = 2  # TIFF default: inches
+        for entry in range(entry_count):
+            entry_pos = ifd_offset + 2 + entry * 12
+            if entry_pos + 12 > len(data):
+                break
+            tag, field_type, count, value = struct.unpack_from(endian + 'HHII', data, entry_pos)
+            
+            if tag == 282 and field_type == 5 and value + 8 <= len(data):  # XResolution, RATIONAL
+                numerator, denominator = struct.unpack_from(endian + 'II', data, value)
+                if denominator:
+                    x_resolution = numerator / denominator
+            elif tag == 296 and field_type == 3:  # ResolutionUnit, SHORT stored in the value field
+                resolution_unit = struct.unpack_from(endian + 'H', data, entry_pos + 8)[0]
+        
+        if not x_resolution:
+            return None
+        if resolution_unit == 2:  # Inches
+            return round(x_resolution)
+        elif resolution_unit == 3:  # Centimeters
+            return round(x_resolution * 2.54)
         return None
     
+    # Images with a longer side than this are previewed from reduced-resolution decodes
+    FULL_DECODE_MAX_SIDE = 2048
+    PREVIEW_SIZE = 200
+    
+    def _decode_reduced(self, doc, xref, target_side):
+        """Decode an image at roughly ``target_side`` pixels on its longest side
+
+        JPEG streams use DCT scaling (1/2 to 1/8 of the full size) and JPEG 2000 streams
+        decode a lower resolution level. Anything else is rendered on its own (see
+        :meth:`_image_page`) at low zoom, where MuPDF subsamples while decoding. The cost
+        scales with the output size. Returns a PIL image (at least ``target_side`` where
+        the codec allows), in CMYK for four-channel images and RGB otherwise.
+        """
+        from PIL import Image, features
+        
+        header = self._image_header(doc, xref)
+        longest = max(header['width'], header['height'], 1)
+        scale = target_side / longest
+        filters = self._stream_filters(doc, xref)
+        
+        try:
+            if filters == ['DCTDecode']:
+                img = Image.open(io.BytesIO(doc.xref_stream_raw(xref)))
+                img.draft(img.mode, (max(1, int(header['width'] * scale)), max(1, int(header['height'] * scale))))
+                img.load()
+                # Pillow inverts CMYK JPEGs by Adobe's convention; MuPDF keeps the stored samples
+                return self._apply_decode_array(doc, xref, img, inverted=img.mode == 'CMYK')
+            
+            if filters == ['JPXDecode'] and features.check('jpg_2000'):
+                img = Image.open(io.BytesIO(doc.xref_stream_raw(xref)))
+                # Each resolution level halves the size; codestreams usually carry 5
+                img.reduce = max(0, min(5, int(math.log2(max(1.0, 1 / scale)))))
+                img.load()
+                return self._apply_decode_array(doc, xref, img)
+        except Exception as e:
+            self.logger.debug(f"Reduced decode of xref {xref} failed, rendering instead: {str(e)}")
+        
+        with self._image_page(doc, xref) as (page, points_per_pixel):
+            zoom = scale / points_per_pixel
+            cmyk = self._colorspace_info(doc, xref)['channels'] == 4
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csCMYK if cmyk else fitz.csRGB)
+            return Image.frombytes("CMYK" if cmyk else "RGB", (pix.width, pix.height), pix.samples)
+    
+    def _apply_decode_array(self, doc, xref, img, inverted=False):
+        """Map a Pillow decode of an image stream to the samples MuPDF decodes from it
+
+        MuPDF applies the image dictionary's ``/Decode`` array to the stored samples.
+        ``inverted`` says Pillow returned the stored samples inverted, as it does for
+        CMYK JPEGs. Inverted CMYK JPEGs (common from Photoshop) carry ``/Decode [1 0 1 0
+        1 0 1 0]``; without this mapping their ink coverage reads near 0% or near 400%.
+        """
+        from PIL import Image
+        
+        decode = doc.xref_get_key(xref, "Decode")
+        values = [float(value) for value in re.findall(r'-?[\d.]+', decode[1])] if decode[0] == 'array' else []
+        
+        ranges = []
+        for band in range(len(img.getbands())):
+            low, high = values[2 * band:2 * band + 2] if len(values) >= 2 * band + 2 else (0.0, 1.0)
+            # A stored sample s is 255 - p for Pillow's p, so low + s * (high - low) = high + p * (low - high)
+            ranges.append((high, low) if inverted else (low, high))
+        if all(band_range == (0.0, 1.0) for band_range in ranges):
+            return img
+        
+        bands = [
+            band.point([round(255 * min(1.0, max(0.0, low + (high - low) * value / 255))) for value in range(256)])
+            for band, (low, high) in zip(img.split(), ranges)
+        ]
+        return Image.merge(img.mode, bands)
+    
+    # Longest side of the scratch pages images are rendered on, within PDF page size limits
+    SCRATCH_PAGE_SIDE = 10000
+    
+    @contextmanager
+    def _image_page(self, doc, xref):
+        """A scratch page that draws only image ``xref``, filling the page
+
+        The image's object graph is copied into a new one-page document, so renders
+        show the image itself: not the text, vectors or other images that overlap it
+        on its own pages, nor their clipping. MuPDF applies the image's ``/Decode``
+        array, masks and colorspace as it would on the page. Yields the page and its
+        size in points per image pixel.
+        """
+        header = self._image_header(doc, xref)
+        points_per_pixel = min(1.0, self.SCRATCH_PAGE_SIDE / max(header['width'], header['height'], 1))
+        width, height = header['width'] * points_per_pixel, header['height'] * points_per_pixel
+        
+        scratch = fitz.open()
+        try:
+            page = scratch.new_page(width=width, height=height)
+            image = fitz.mupdf.pdf_graft_object(
+                fitz.mupdf.pdf_specifics(scratch.this), fitz.mupdf.pdf_new_indirect(fitz.mupdf.pdf_specifics(doc.this), xref, 0)
+            )
+            scratch.xref_set_key(page.xref, "Resources", f"<</XObject<</Im {fitz.mupdf.pdf_to_num(image)} 0 R>>>>")
+            contents = scratch.get_new_xref()
+            scratch.update_object(contents, "<<>>")
+            scratch.update_stream(contents, f"q {width:.4f} 0 0 {height:.4f} 0 0 cm /Im Do Q".encode())
+            scratch.xref_set_key(page.xref, "Contents", f"{contents} 0 R")
+            yield scratch.reload_page(page), points_per_pixel
+        finally:
+            scratch.close()
+    
+    # Ink coverage is measured on at most this many pixels, sampled on a regular grid
+    INK_SAMPLE_PIXELS = 4000000
+    
+    def _pixmap_samples(self, pix):
+        """A height x width x n NumPy view of a pixmap's samples, without copying them"""
+        import numpy as np
+        
+        samples = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+        return samples.reshape(pix.height, pix.stride)[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+    
+    def _pixmap_ink_coverage(self, pix):
+        """Ink coverage of a CMYK pixmap, read in place through a NumPy view of its samples"""
+        if pix.colorspace is None or pix.colorspace.n != 4:
+            return {}
+        return self._ink_coverage(self._pixmap_samples(pix)[:, :, :4])
+    
+    def _image_ink_coverage(self, img):
+        """Ink coverage of a CMYK PIL image, such as a reduced-resolution JPEG decode"""
+        if img.mode != 'CMYK':
+            return {}
+        import numpy as np
+        
+        return self._ink_coverage(np.asarray(img))
+    
+    def _ink_coverage(self, cmyk):
+        """Total area coverage of a height x width x 4 array of CMYK samples
+
+        Returns the maximum, 99th percentile and mean of C+M+Y+K in percent (0-400).
+        Large images are sampled on a strided grid, which is a view, not a copy; the
+        percentile comes from a histogram of the per-pixel sums, so nothing is sorted.
+        """
+        import numpy as np
+        
+        height, width = cmyk.shape[:2]
+        if not height or not width:
+            return {}
+        step = max(1, math.ceil(math.sqrt(height * width / self.INK_SAMPLE_PIXELS)))
+        sampled = cmyk[::step, ::step]
+        
+        totals = sampled.sum(axis=2, dtype=np.uint16)
+        histogram = np.bincount(totals.ravel(), minlength=4 * 255 + 1)
+        cumulative = np.cumsum(histogram)
+        count = cumulative[-1]
+        to_percent = 100.0 / 255
+        return {
+            'tac_max': round(float(np.flatnonzero(histogram)[-1]) * to_percent, 1),
+            'tac_p99': round(float(np.searchsorted(cumulative, 0.99 * count)) * to_percent, 1),
+            'tac_mean': round(float(np.dot(histogram, np.arange(histogram.size)) / count) * to_percent, 1)
+        }
+    
+    # Upsampling is judged at native resolution on a central window of at most this many
+    # pixels a side, split into tiles of which the busiest are analysed. Images too big to
+    # decode are judged on a strip of this many rows rendered from the top of the image.
+    DETAIL_WINDOW = 1024
+    DETAIL_STRIP_ROWS = 256
+    DETAIL_TILE = 128
+    DETAIL_TILES = 8
+    
+    def _pixmap_detail(self, pix):
+        """Detail ratio of a decoded pixmap, from a window of its samples read in place"""
+        return self._detail_ratio(self._pixmap_samples(pix)[:, :, :pix.n - pix.alpha])
+    
+    def _image_detail(self, img):
+        """Detail ratio of a full-resolution PIL image, such as a decoded inline image"""
+        import numpy as np
+        
+        if img.mode not in ('L', 'RGB', 'CMYK'):
+            img = img.convert('RGB')
+        samples = np.asarray(img)
+        return self._detail_ratio(samples.reshape(samples.shape[0], samples.shape[1], -1))
+    
+    def _rendered_detail(self, doc, xref, width, height):
+        """Detail ratio of an image too big to decode, from a native-resolution render of part of it
+
+        Only a strip of ``DETAIL_STRIP_ROWS`` rows at the top of the image is rendered, at
+        most ``DETAIL_WINDOW`` pixels wide, from the image alone (see :meth:`_image_page`).
+        MuPDF decodes just the rows it needs, so time and memory depend on the strip, not
+        on the image height.
+        """
+        with self._image_page(doc, xref) as (page, points_per_pixel):
+            strip_width = min(self.DETAIL_WINDOW, width) * points_per_pixel
+            strip_height = min(self.DETAIL_STRIP_ROWS, height) * points_per_pixel
+            center_x = page.rect.width / 2
+            clip = fitz.Rect(center_x - strip_width / 2, 0, center_x + strip_width / 2, strip_height)
+            
+            zoom = 1 / points_per_pixel
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+            return self._detail_ratio(self._pixmap_samples(pix))
+    
+    def _detail_ratio(self, samples):
+        """Estimate the share of an image's nominal resolution that carries real detail
+
+        ``samples`` is a height x width x channels array. The busiest tiles of a central
+        window are windowed and Fourier transformed; their radial power spectrum is
+        weighted by frequency squared (gradient energy), which is roughly flat up to the
+        Nyquist limit for a native image. An image upsampled by k loses that energy above
+        1/k of the limit, so the highest frequency still carrying 30% of the
+        low-frequency level gives the ratio. Pixel replication (nearest-neighbour
+        upscaling) keeps sharp edges, so duplicated rows and columns are counted as well.
+        Returns ``{'detail_ratio': r}`` with r from about 0.1 to 1.0, or {} when the
+        image is too small or too flat to judge.
+        """
+        import numpy as np
+        
+        height, width = samples.shape[:2]
+        tile = self.DETAIL_TILE
+        if height < tile or width < tile:
+            return {}
+        window_h, window_w = min(height, self.DETAIL_WINDOW), min(width, self.DETAIL_WINDOW)
+        top, left = (height - window_h) // 2, (width - window_w) // 2
+        luminance = samples[top:top + window_h, left:left + window_w].mean(axis=2, dtype=np.float32)
+        
+        rows, cols = window_h // tile, window_w // tile
+        tiles = luminance[:rows * tile, :cols * tile].reshape(rows, tile, cols, tile).swapaxes(1, 2).reshape(-1, tile, tile)
+        energy = np.abs(np.diff(tiles, axis=1)).mean(axis=(1, 2)) + np.abs(np.diff(tiles, axis=2)).mean(axis=(1, 2))
+        busiest = tiles[np.argsort(energy)[-self.DETAIL_TILES:]]
+        if energy.max() < 0.5:
+            return {}
+        
+        # Share of rows and columns that repeat their neighbour exactly
+        repeated_cols = np.all(busiest[:, :, 1:] == busiest[:, :, :-1], axis=1).mean()
+        repeated_rows = np.all(busiest[:, 1:, :] == busiest[:, :-1, :], axis=2).mean()
+        replication_ratio = 1.0 - max(repeated_cols, repeated_rows)
+        
+        hann = np.hanning(tile).astype(np.float32)
+        centred = busiest - busiest.mean(axis=(1, 2), keepdims=True)
+        power = (np.abs(np.fft.rfft2(centred * np.outer(hann, hann))) ** 2).mean(axis=0)
+        
+        radius = np.hypot(np.fft.fftfreq(tile)[:, None], np.fft.rfftfreq(tile)[None, :])
+        bands = 32
+        band = np.minimum((radius * 2 * bands).astype(np.intp), bands).ravel()
+        counts = np.bincount(band, minlength=bands + 1)[:bands]
+        gradient_energy = np.bincount(band, weights=(power * radius ** 2).ravel(), minlength=bands + 1)[:bands]
+        gradient_energy /= np.maximum(counts, 1)
+        
+        reference = np.median(gradient_energy[2:8])
+        if reference <= 0:
+            return {}
+        spectral_ratio = (np.flatnonzero(gradient_energy >= 0.3 * reference)[-1] + 1) / bands
+        
+        return {'detail_ratio': round(float(min(spectral_ratio, replication_ratio)), 2)}
+    
     def _create_preview(self, pix):
-        """Create base64 encoded preview image"""
+        """Create encoded preview bytes and perceptual hashes from a pixmap"""
+        from PIL import Image
+        
         try:
-            # Convert to PIL Image
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
+            # Previews are for display, convert CMYK and other spaces to RGB
+            if pix.n - pix.alpha not in (1, 3):
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+            
+            # Wrap the samples directly rather than round-tripping through PNG
+            mode = {(1, 0): 'L', (1, 1): 'LA', (3, 0): 'RGB', (3, 1): 'RGBA'}[(pix.n - pix.alpha, pix.alpha)]
+            img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+            
+            return self._create_preview_image(img)
+            
+        except Exception as e:
+            self.logger.warning(f"Could not create preview: {str(e)}")
+            return {}
+    
+    def _create_preview_image(self, img):
+        """Create encoded preview bytes from a PIL image, with perceptual hashes of the thumbnail
+
+        Returns a dict with 'preview', 'phash' and 'dhash', or {} if no preview could be made.
+        """
+        from PIL import Image
+        
+        try:
+            if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                img = img.convert('RGB')
             
             # Resize for preview (max 200x200)
-            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
+            img.thumbnail((self.PREVIEW_SIZE, self.PREVIEW_SIZE), Image.Resampling.LANCZOS)
+            
+            image_format = PREVIEW_FORMATS[self.preview_format]
+            if image_format == 'JPEG' and img.mode in ('RGBA', 'LA'):
+                # JPEG has no alpha channel
+                image_format = 'PNG'
             
-            # Convert to base64
             buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
+            if image_format == 'PNG':
+                img.save(buffer, format='PNG')
+            else:
+                img.save(buffer, format=image_format, quality=self.preview_quality)
             
-            return img_str
+            # Hashing the thumbnail costs a 32x32 resize, not another pass over the image
+            return dict(perceptual_hashes(img), preview=buffer.getvalue())
             
         except Exception as e:
             self.logger.warning(f"Could not create preview: {str(e)}")
-            return None
\ No newline at end of file
+            return {}
\ No newline at end of file
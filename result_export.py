@@ -0,0 +1,210 @@
+import csv
+import importlib.util
+import json
+import math
+from datetime import datetime, timezone
+
+# Raw placement table: one row per placement, values unformatted
+PLACEMENT_COLUMNS = [
+    ('file', 'str'),
+    ('file_hash', 'str'),
+    ('analyzed_at', 'timestamp'),
+    ('page', 'int'),
+    ('image_number', 'int'),
+    ('xref', 'int'),
+    ('placement_index', 'int'),
+    ('total_placements_of_image', 'int'),
+    ('width', 'int'),
+    ('height', 'int'),
+    ('channels', 'int'),
+    ('bit_depth', 'int'),
+    ('color_mode', 'str'),
+    ('original_colorspace', 'str'),
+    ('format', 'str'),
+    ('file_size', 'int'),
+    ('placed_width_in', 'float'),
+    ('placed_height_in', 'float'),
+    ('placed_width_points', 'float'),
+    ('placed_height_points', 'float'),
+    ('eff_ppi_x', 'float'),
+    ('eff_ppi_y', 'float'),
+    ('visible_dpi', 'float'),
+    ('estimated_native_dpi', 'float'),
+    ('detail_ratio', 'float'),
+    ('metadata_dpi', 'float'),
+    ('pixel_density', 'float'),
+    ('tac_max', 'float'),
+    ('tac_p99', 'float'),
+    ('phash', 'str'),
+    ('dhash', 'str'),
+    ('analysis_level', 'str'),
+    ('dpi_method', 'str'),
+    ('rect_x0', 'float'),
+    ('rect_y0', 'float'),
+    ('rect_x1', 'float'),
+    ('rect_y1', 'float'),
+    ('error', 'str')
+]
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet', 'arrow')
+
+def arrow_available():
+    """Whether Parquet and Arrow export can be used, without importing pyarrow"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+def _import_arrow(purpose):
+    """Import pyarrow on first use; it is optional and slow to import"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(f"{purpose} requires pyarrow")
+    return pa, pq
+
+def _convert(value, kind):
+    """Coerce a raw placement value to its column type, keeping missing values as None"""
+    if value is None or value == '':
+        return None
+    try:
+        if kind == 'int':
+            return int(value)
+        if kind == 'float':
+            value = float(value)
+            return None if math.isnan(value) else value
+        if kind == 'str':
+            return str(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+def placement_rows(result, filename, analyzed_at=None):
+    """Yield typed rows of the raw placement table for one analysis result"""
+    analyzed_at = analyzed_at or datetime.now(timezone.utc)
+    for img in result.get('images', []):
+        rect = img.get('placement_rect') or {}
+        raw = dict(
+            img,
+            file=filename,
+            file_hash=result.get('file_hash'),
+            analyzed_at=analyzed_at,
+            rect_x0=rect.get('x0'),
+            rect_y0=rect.get('y0'),
+            rect_x1=rect.get('x1'),
+            rect_y1=rect.get('y1')
+        )
+        yield {column: _convert(raw.get(column), kind) for column, kind in PLACEMENT_COLUMNS}
+
+class _ExportWriter:
+    """Base for writers that append one document's placements at a time"""
+    
+    def __init__(self, path):
+        self.path = str(path)
+        self.rows_written = 0
+    
+    def write_result(self, result, filename, analyzed_at=None):
+        """Append the placements of one analysis result"""
+        rows = list(placement_rows(result, filename, analyzed_at))
+        if rows:
+            self._write_rows(rows)
+            self.rows_written += len(rows)
+    
+    def _write_rows(self, rows):
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CSVExportWriter(_ExportWriter):
+    """Streaming CSV writer; timestamps are written in ISO 8601"""
+    
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=[column for column, _ in PLACEMENT_COLUMNS])
+        self._writer.writeheader()
+    
+    def _write_rows(self, rows):
+        for row in rows:
+            row['analyzed_at'] = row['analyzed_at'].isoformat()
+            self._writer.writerow(row)
+        self._file.flush()
+    
+    def close(self):
+        self._file.close()
+
+class JSONLExportWriter(_ExportWriter):
+    """Streaming JSON Lines writer, one placement object per line"""
+    
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(self.path, 'w', encoding='utf-8')
+    
+    def _write_rows(self, rows):
+        for row in rows:
+            row['analyzed_at'] = row['analyzed_at'].isoformat()
+            self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+    
+    def close(self):
+        self._file.close()
+
+def _arrow_schema(pa):
+    types = {
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'str': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC')
+    }
+    return pa.schema([(column, types[kind]) for column, kind in PLACEMENT_COLUMNS])
+
+class ParquetExportWriter(_ExportWriter):
+    """Parquet writer that adds one row group per document"""
+    
+    def __init__(self, path):
+        self._pa, pq = _import_arrow("Parquet export")
+        super().__init__(path)
+        self._schema = _arrow_schema(self._pa)
+        self._writer = pq.ParquetWriter(self.path, self._schema)
+    
+    def _write_rows(self, rows):
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+    
+    def close(self):
+        self._writer.close()
+
+class ArrowExportWriter(_ExportWriter):
+    """Arrow IPC file writer that adds one record batch per document"""
+    
+    def __init__(self, path):
+        self._pa, _ = _import_arrow("Arrow export")
+        super().__init__(path)
+        self._schema = _arrow_schema(self._pa)
+        self._sink = self._pa.OSFile(self.path, 'wb')
+        self._writer = self._pa.ipc.new_file(self._sink, self._schema)
+    
+    def _write_rows(self, rows):
+        self._writer.write_batch(self._pa.RecordBatch.from_pylist(rows, schema=self._schema))
+    
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+EXPORT_WRITERS = {
+    'csv': CSVExportWriter,
+    'jsonl': JSONLExportWriter,
+    'parquet': ParquetExportWriter,
+    'arrow': ArrowExportWriter
+}
+
+def open_export_writer(path, export_format=None):
+    """Open a writer for ``path``, choosing the format from its extension if not given"""
+    export_format = (export_format or str(path).rsplit('.', 1)[-1]).lower()
+    if export_format not in EXPORT_WRITERS:
+        raise ValueError(f"Unsupported export format '{export_format}'")
+    return EXPORT_WRITERS[export_format](path)
@@ -0,0 +1,264 @@
+import logging
+import secrets
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+# States of values in packed numeric columns
+_PRESENT, _NONE, _MISSING = 0, 1, 2
+
+class _Missing:
+    """Placeholder for a key a placement does not have"""
+    
+    def __reduce__(self):
+        return '_MISSING_VALUE'
+
+_MISSING_VALUE = _Missing()
+
+def share_document(pdf_data):
+    """Copy a document into shared memory once so every worker can read it in place
+    
+    Returns the segment, or None if shared memory is unavailable (the caller then
+    sends the bytes). The caller closes and unlinks the segment when done.
+    """
+    try:
+        segment = shared_memory.SharedMemory(create=True, size=max(len(pdf_data), 1))
+    except (OSError, ValueError) as e:
+        logger.debug(f"Shared memory unavailable, sending document bytes: {str(e)}")
+        return None
+    segment.buf[:len(pdf_data)] = pdf_data
+    return segment
+
+def document_ref(segment, pdf_data):
+    """What to send a worker for a document: a shared memory reference or the bytes"""
+    if segment is None:
+        return pdf_data
+    return ('shm', segment.name, len(pdf_data))
+
+def release_document(segment):
+    """Free a segment made by :func:`share_document` once no worker needs it"""
+    if segment is not None:
+        segment.close()
+        segment.unlink()
+
+class SharedDocument:
+    """Worker-side view of a document sent by :func:`document_ref`
+    
+    Used as a context manager that yields a bytes-like object. Shared segments are
+    mapped rather than copied, and are left to the parent to unlink.
+    """
+    
+    def __init__(self, ref):
+        self.ref = ref
+        self._segment = None
+        self._view = None
+    
+    def __enter__(self):
+        if not isinstance(self.ref, tuple):
+            return self.ref
+        _, name, size = self.ref
+        # Workers share the parent's resource tracker, which unlinks the segment if the parent dies
+        self._segment = shared_memory.SharedMemory(name=name)
+        self._view = self._segment.buf[:size]
+        return self._view
+    
+    def __exit__(self, *exc_info):
+        if self._segment is None:
+            return
+        try:
+            self._view.release()
+            self._segment.close()
+        except BufferError:
+            # A document object still holds the buffer; it is unmapped when collected
+            logger.debug("Shared document still referenced, leaving it mapped")
+
+def pack_placements(placements, sent_previews, segments=None):
+    """Pack a page's placement dicts into columns for sending to the parent process
+    
+    Integer and float columns become NumPy arrays, which pickle as one buffer
+    instead of one object per value. Preview bytes are shared once per job keyed by
+    preview handle (or xref), tracked in ``sent_previews``; placements only carry
+    the key, and the page's new previews go into one shared memory segment named by
+    ``segments`` (see :func:`_share_previews`). Other values are sent as plain lists.
+    """
+    keys = []
+    for img_data in placements:
+        for key in img_data:
+            if key not in keys:
+                keys.append(key)
+    
+    previews = {}
+    columns = {}
+    for key in keys:
+        values = [img_data.get(key, _MISSING_VALUE) for img_data in placements]
+        if key == 'preview':
+            preview_keys = []
+            for img_data, preview in zip(placements, values):
+                if not isinstance(preview, bytes):
+                    preview_keys.append(preview)
+                    continue
+                preview_key = img_data.get('preview_handle') or f"xref:{img_data.get('xref')}"
+                if preview_key not in sent_previews:
+                    previews[preview_key] = preview
+                    sent_previews.add(preview_key)
+                preview_keys.append(preview_key)
+            columns[key] = ('preview', preview_keys)
+        else:
+            columns[key] = _pack_column(values)
+    
+    return {'count': len(placements), 'columns': columns, 'previews': _share_previews(previews, segments)}
+
+def new_segment_prefix():
+    """A random prefix for one job's preview segments, short enough for macOS (31 characters)"""
+    return f"pdfa_{secrets.token_hex(6)}"
+
+def _segment_name(prefix, number):
+    return f"{prefix}_{number}"
+
+class PreviewSegments:
+    """Worker-side namer of the shared memory segments that carry one job's previews
+    
+    Segments are named from a prefix chosen by the parent and a running number. The
+    parent frees each segment as it reads it, in order, so the ones a dead worker
+    leaves behind are found by counting on from the number read (see
+    :func:`free_unread_previews`).
+    """
+    
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.created = 0
+    
+    def next_name(self):
+        return _segment_name(self.prefix, self.created)
+
+def _share_previews(previews, segments=None):
+    """Write a frame's new previews into one shared memory segment, referenced by offset
+    
+    The parent frees the segment once it has read it, or when it stops the worker
+    before reading it. Falls back to sending the bytes when shared memory is
+    unavailable.
+    """
+    if not previews:
+        return previews
+    try:
+        segment = shared_memory.SharedMemory(
+            name=segments.next_name() if segments else None, create=True,
+            size=sum(len(preview) for preview in previews.values())
+        )
+    except (OSError, ValueError) as e:
+        logger.debug(f"Shared memory unavailable, sending preview bytes: {str(e)}")
+        return previews
+    if segments:
+        segments.created += 1
+    
+    offsets = {}
+    offset = 0
+    for key, preview in previews.items():
+        segment.buf[offset:offset + len(preview)] = preview
+        offsets[key] = (offset, len(preview))
+        offset += len(preview)
+    segment.close()
+    return ('shm', segment.name, offsets)
+
+def _read_shared_previews(ref):
+    """Copy the previews of a frame out of its segment and free the segment"""
+    _, name, offsets = ref
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        return {key: bytes(segment.buf[offset:offset + length]) for key, (offset, length) in offsets.items()}
+    finally:
+        segment.close()
+        segment.unlink()
+
+def free_unread_previews(prefix, read):
+    """Unlink the preview segments of a job that follow the first ``read``; returns how many
+    
+    Only call this once the job's worker has exited, so no more segments appear.
+    """
+    freed = 0
+    while True:
+        try:
+            segment = shared_memory.SharedMemory(name=_segment_name(prefix, read + freed))
+        except FileNotFoundError:
+            return freed
+        segment.close()
+        segment.unlink()
+        freed += 1
+
+# Numeric columns shorter than this are cheaper to send as plain lists
+NUMPY_MIN_ROWS = 256
+
+def _pack_column(values):
+    present = [value for value in values if value is not None and value is not _MISSING_VALUE]
+    if len(values) < NUMPY_MIN_ROWS or not present:
+        return ('object', values)
+    
+    # Only pages this large pay for importing NumPy
+    import numpy as np
+    
+    if all(type(value) is int for value in present):
+        dtype, fill = np.int64, 0
+    elif all(type(value) is float for value in present):
+        dtype, fill = np.float64, np.nan
+    else:
+        return ('object', values)
+    
+    states = np.array([
+        _MISSING if value is _MISSING_VALUE else _NONE if value is None else _PRESENT
+        for value in values
+    ], dtype=np.uint8)
+    data = np.array([fill if value is None or value is _MISSING_VALUE else value for value in values], dtype=dtype)
+    return ('numeric', data, states if states.any() else None)
+
+class PlacementDecoder:
+    """Parent-side decoder for the pages of one document
+    
+    Keeps the previews received so far, so every placement of an image shares one
+    bytes object. Previews are copied out of their segment once, because results
+    outlive the segment and are shown, pickled and stored as plain values.
+    
+    Placements are rebuilt as plain dicts of Python values rather than handed out as
+    views over the column buffers: every consumer (the UI, JSON and SQLite, session
+    state) needs Python values, and NumPy scalars do not serialize as JSON or bind
+    as SQLite parameters. Decoding costs about 10 µs per placement (20 ms for a
+    2,000 placement page), far below the analysis of those placements.
+    """
+    
+    def __init__(self):
+        self.previews = {}
+    
+    def unpack(self, frame):
+        """Turn a frame from :func:`pack_placements` back into placement dicts"""
+        previews = frame['previews']
+        if isinstance(previews, tuple):
+            previews = _read_shared_previews(previews)
+        self.previews.update(previews)
+        
+        keys = list(frame['columns'])
+        columns = []
+        for key in keys:
+            column = frame['columns'][key]
+            if column[0] == 'preview':
+                values = [
+                    self.previews.get(value) if isinstance(value, str) else value
+                    for value in column[1]
+                ]
+            elif column[0] == 'numeric':
+                _, data, states = column
+                values = data.tolist()
+                if states is not None:
+                    values = [
+                        value if state == _PRESENT else None if state == _NONE else _MISSING_VALUE
+                        for value, state in zip(values, states.tolist())
+                    ]
+            else:
+                values = column[1]
+            columns.append(values)
+        
+        placements = [dict(zip(keys, row)) for row in zip(*columns)]
+        for key, values in zip(keys, columns):
+            if any(value is _MISSING_VALUE for value in values):
+                for img_data in placements:
+                    if img_data[key] is _MISSING_VALUE:
+                        del img_data[key]
+        return placements
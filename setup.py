@@ -10,7 +10,16 @@ APP = ['app_launcher.py']
 DATA_FILES = [
     'main.py',
     'pdf_analyzer.py', 
-    'utils.py'
+    'content_stream.py',
+    'image_similarity.py',
+    'page_overview.py',
+    'utils.py',
+    'image_index.py',
+    'worker_pool.py',
+    'result_transfer.py',
+    'result_export.py',
+    'history_store.py',
+    'hot_folder.py'
 ]
 
 # Options for py2app
@@ -23,12 +32,23 @@ OPTIONS = {
         'fitz',
         'numpy',
         'socket',
+        'sqlite3',
+        'multiprocessing',
         'threading',
         'webbrowser'
     ],
     'includes': [
         'pdf_analyzer',
+        'content_stream',
+        'image_similarity',
+        'page_overview',
         'utils',
+        'image_index',
+        'worker_pool',
+        'result_transfer',
+        'result_export',
+        'history_store',
+        'hot_folder',
         'streamlit.web.cli',
         'fitz',
         'PIL.Image'
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for PDF Preflight Tool
+Measures the cold import time of each entry point in a fresh interpreter and
+checks that none of them loads heavy libraries it does not need at import time,
+then times the first pooled analysis with a cold and a pre-warmed worker pool.
+
+    python startup_benchmark.py                 # report, fail on eager heavy imports
+    python startup_benchmark.py --strict        # also fail when over the time budgets
+    python startup_benchmark.py --profile main  # slowest imports of one module
+    python startup_benchmark.py --skip-pool     # import times only, no worker pool
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).parent
+
+HEAVY_MODULES = ['streamlit', 'pandas', 'pyarrow', 'fitz', 'PIL', 'numpy']
+
+# Entry point -> (heavy modules it may load at import time, budget in ms on a laptop)
+ENTRY_POINTS = {
+    'app_launcher': ([], 150),
+    'main': (['streamlit'], 1200),
+    'pdf_analyzer': (['fitz'], 500),
+    'content_stream': (['fitz'], 500),
+    'image_similarity': ([], 100),
+    'page_overview': ([], 100),
+    'worker_pool': (['fitz'], 600),
+    'image_index': ([], 100),
+    'history_store': ([], 100),
+    'hot_folder': ([], 100),
+    'result_export': ([], 100),
+    'result_transfer': ([], 100),
+    'utils': ([], 100)
+}
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'ms': elapsed * 1000,
+    'loaded': [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+# Budget in ms for the first analysis on a pre-warmed pool, as the launcher leaves it
+FIRST_ANALYSIS_BUDGET_MS = 1000
+
+MEASURE_FIRST_ANALYSIS = """
+import json, time
+import fitz
+from worker_pool import AnalyzerPool
+
+if __name__ == '__main__':
+    doc = fitz.open()
+    for _ in range(4):
+        doc.new_page().insert_image(
+            fitz.Rect(72, 72, 360, 360), pixmap=fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 1200, 1200), False)
+        )
+    pdf_data = doc.tobytes()
+    
+    timings = {{}}
+    for warm in (False, True):
+        start = time.perf_counter()
+        with AnalyzerPool(workers=2) as pool:
+            if warm:
+                pool.warm_up()
+                start = time.perf_counter()
+            list(pool.analyze([('first', pdf_data, {{}})]))
+            timings['warm' if warm else 'cold'] = (time.perf_counter() - start) * 1000
+    print(json.dumps(timings))
+"""
+
+def measure(module, runs):
+    """Median import time of ``module`` over fresh interpreters, and the heavy modules it loaded"""
+    times = []
+    loaded = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', MEASURE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        times.append(sample['ms'])
+        loaded = sample['loaded']
+    return statistics.median(times), loaded
+
+def measure_first_analysis(runs):
+    """Median ms of the first pooled analysis with a cold pool (spawn, imports, health check) and a warmed one"""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', MEASURE_FIRST_ANALYSIS.format()],
+            cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return (
+        statistics.median(sample['cold'] for sample in samples),
+        statistics.median(sample['warm'] for sample in samples)
+    )
+
+def profile(module, top):
+    """Print the slowest imports (cumulative) triggered by importing ``module``"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR, capture_output=True, text=True
+    ).stderr
+    
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    
+    print(f"Slowest imports for {module} (cumulative ms, self ms):")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and guard import-time startup cost")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters per entry point")
+    parser.add_argument('--strict', action='store_true', help="Fail when an entry point is over its time budget")
+    parser.add_argument('--profile', metavar='MODULE', help="Show the slowest imports of one module instead")
+    parser.add_argument('--skip-pool', action='store_true', help="Do not measure the first pooled analysis")
+    parser.add_argument('--top', type=int, default=20, help="Imports to show with --profile")
+    args = parser.parse_args()
+    
+    if args.profile:
+        profile(args.profile, args.top)
+        return 0
+    
+    failures = []
+    print(f"{'entry point':<18}{'ms':>8}{'budget':>8}  heavy modules loaded")
+    for module, (allowed, budget_ms) in ENTRY_POINTS.items():
+        elapsed_ms, loaded = measure(module, args.runs)
+        print(f"{module:<18}{elapsed_ms:>8.0f}{budget_ms:>8}  {', '.join(loaded) or '-'}")
+        
+        unexpected = [name for name in loaded if name not in allowed]
+        if unexpected:
+            failures.append(f"{module} imports {', '.join(unexpected)} at import time")
+        if args.strict and elapsed_ms > budget_ms:
+            failures.append(f"{module} took {elapsed_ms:.0f} ms (budget {budget_ms} ms)")
+    
+    if not args.skip_pool:
+        cold_ms, warm_ms = measure_first_analysis(args.runs)
+        print(f"\nfirst pooled analysis: {cold_ms:.0f} ms cold, {warm_ms:.0f} ms pre-warmed "
+              f"(budget {FIRST_ANALYSIS_BUDGET_MS} ms)")
+        if args.strict and warm_ms > FIRST_ANALYSIS_BUDGET_MS:
+            failures.append(f"first pre-warmed analysis took {warm_ms:.0f} ms (budget {FIRST_ANALYSIS_BUDGET_MS} ms)")
+    
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
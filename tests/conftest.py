@@ -0,0 +1,23 @@
+import fitz
+import pytest
+
+def build_pdf(pages):
+    """Build a PDF from a list of pages, each a list of ``(rect, side)`` RGB images
+    
+    Images of the same side share one pixel pattern, so they differ from images of
+    other sides but PyMuPDF still embeds each insertion as its own xref.
+    """
+    doc = fitz.open()
+    for images in pages:
+        page = doc.new_page()
+        for rect, side in images:
+            pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, side, side), False)
+            pixmap.set_rect(pixmap.irect, (side % 256, 80, 160))
+            page.insert_image(fitz.Rect(rect), pixmap=pixmap)
+    pdf_data = doc.tobytes()
+    doc.close()
+    return pdf_data
+
+@pytest.fixture
+def make_pdf():
+    return build_pdf
@@ -0,0 +1,60 @@
+import fitz
+import pytest
+
+from content_stream import walk_image_draws
+
+def page_with_content(content):
+    """A one-page document whose content stream is ``content``"""
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.insert_text((10, 10), "x")
+    doc.update_stream(page.get_contents()[0], content)
+    return doc, doc.reload_page(page)
+
+def test_form_without_resources_uses_its_callers_images():
+    doc = fitz.open()
+    page = doc.new_page(width=200, height=200)
+    page.insert_image(fitz.Rect(0, 0, 50, 50), pixmap=fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False))
+    image_xref, image_name = page.get_images(full=True)[0][0], page.get_images(full=True)[0][7]
+    
+    form = doc.get_new_xref()
+    doc.update_object(form, "<< /Type /XObject /Subtype /Form /BBox [0 0 200 200] >>")
+    doc.update_stream(form, f"q 40 0 0 20 10 30 cm /{image_name} Do Q".encode())
+    resources = int(doc.xref_get_key(page.xref, "Resources")[1].split()[0])
+    doc.xref_set_key(resources, "XObject/Fm9", f"{form} 0 R")
+    doc.update_stream(page.get_contents()[0], b"q 2 0 0 2 0 0 cm /Fm9 Do Q")
+    page = doc.reload_page(page)
+    
+    draws = walk_image_draws(doc, page)
+    assert [draw.xref for draw in draws] == [image_xref]
+    assert draws[0].placed_size == pytest.approx((80, 40))
+
+def test_inline_image_abbreviations_are_expanded():
+    content = b"q 20 0 0 10 5 5 cm BI /W 2 /H 1 /CS /RGB /BPC 8 /I true ID \x01\x02\x03\x04\x05\x06 EI Q"
+    doc, page = page_with_content(content)
+    
+    draw, = walk_image_draws(doc, page)
+    assert draw.xref is None
+    assert draw.inline_dict == {'Width': 2, 'Height': 1, 'ColorSpace': 'DeviceRGB', 'BitsPerComponent': 8, 'Interpolate': True}
+    assert draw.inline_data == b"\x01\x02\x03\x04\x05\x06"
+    assert draw.placed_size == pytest.approx((20, 10))
+
+def test_inline_image_data_may_contain_ei():
+    data = b"a EI b"
+    content = b"BI /W 6 /H 1 /CS /G /BPC 8 ID " + data + b" EI 10 0 0 10 0 0 cm BI /W 1 /H 1 /CS /G ID \xff EI"
+    doc, page = page_with_content(content)
+    
+    first, second = walk_image_draws(doc, page)
+    assert first.inline_data == data
+    assert second.inline_data == b"\xff"
+
+def test_indexed_inline_image_length_is_computed():
+    palette = b"<000000ffffff>"
+    # Searching for EI would end the data at its second byte
+    data = b"\x00 EI"
+    content = b"BI /W 4 /H 1 /CS [/I /RGB 1 " + palette + b"] /BPC 8 ID " + data + b" EI"
+    doc, page = page_with_content(content)
+    
+    draw, = walk_image_draws(doc, page)
+    assert draw.inline_dict['ColorSpace'] == ['Indexed', 'DeviceRGB', 1, b"\x00\x00\x00\xff\xff\xff"]
+    assert draw.inline_data == data
@@ -0,0 +1,76 @@
+import pytest
+
+from pdf_analyzer import PDFAnalyzer
+from utils import diff_preflight
+
+def fingerprinted(*fingerprints, images=()):
+    """Minimal analysis result with one fingerprint per page"""
+    return {
+        'total_pages': len(fingerprints),
+        'page_fingerprints': {page: {'fingerprint': fingerprint} for page, fingerprint in enumerate(fingerprints, 1)},
+        'images': list(images)
+    }
+
+def placement(page, x0, visible_dpi):
+    return {
+        'page': page,
+        'visible_dpi': visible_dpi,
+        'color_mode': 'CMYK',
+        'placement_rect': {'x0': x0, 'y0': 0, 'x1': x0 + 100, 'y1': 100}
+    }
+
+def diff(previous, current):
+    return diff_preflight(previous, current, 300, ['CMYK'])
+
+def test_repeated_pages_are_matched_once_each():
+    report = diff(fingerprinted('A', 'B', 'A', 'C'), fingerprinted('B', 'A', 'A', 'C', 'D'))
+    
+    assert report['unchanged_pages'] == [3, 4]
+    assert report['moved_pages'] == [{'page': 1, 'previous_page': 2}, {'page': 2, 'previous_page': 1}]
+    assert report['added_pages'] == [5]
+    assert report['removed_pages'] == []
+
+def test_removed_page_shifts_the_rest():
+    report = diff(fingerprinted('A', 'B', 'C'), fingerprinted('A', 'C'))
+    
+    assert report['unchanged_pages'] == [1]
+    assert report['moved_pages'] == [{'page': 2, 'previous_page': 3}]
+    assert report['removed_pages'] == [2]
+    assert report['changed_pages'] == []
+
+def test_changed_page_reports_new_and_resolved_failures():
+    previous = fingerprinted('A', 'B', images=[placement(2, 0, 150), placement(2, 200, 350)])
+    current = fingerprinted('A', 'X', images=[placement(2, 0, 350), placement(2, 200, 150)])
+    
+    changed, = diff(previous, current)['changed_pages']
+    
+    assert (changed['page'], changed['previous_page']) == (2, 2)
+    assert (changed['previous_status'], changed['status']) == ("FAIL", "FAIL")
+    assert [img['placement_rect']['x0'] for img in changed['new_failures']] == [200]
+    assert [img['placement_rect']['x0'] for img in changed['resolved_failures']] == [0]
+
+def test_pages_inserted_before_a_changed_page_keep_the_pairing():
+    report = diff(fingerprinted('A', 'B', 'C'), fingerprinted('N', 'A', 'X', 'C'))
+    
+    assert report['added_pages'] == [1]
+    assert [(page['page'], page['previous_page']) for page in report['changed_pages']] == [(3, 2)]
+
+def test_results_without_fingerprints_are_rejected():
+    with pytest.raises(ValueError):
+        diff({'total_pages': 2, 'images': []}, fingerprinted('A', 'B'))
+
+def test_pages_are_fingerprinted_only_when_needed(make_pdf):
+    analyzer = PDFAnalyzer()
+    first = make_pdf([[((72, 72, 144, 144), 32)], [((72, 72, 144, 144), 48)]])
+    revised = make_pdf([[((72, 72, 144, 144), 32)], [((72, 72, 144, 144), 64)]])
+    
+    assert analyzer.analyze_pdf(first)['page_fingerprints'] == {}
+    
+    previous = analyzer.analyze_pdf(first, fingerprint_pages=True)
+    assert sorted(previous['page_fingerprints']) == [1, 2]
+    
+    result = analyzer.analyze_pdf(revised, previous=previous)
+    assert result['incremental'] == {'reused_pages': [1], 'reanalyzed_pages': [2]}
+    report = diff(previous, result)
+    assert report['unchanged_pages'] == [1]
+    assert [page['page'] for page in report['changed_pages']] == [2]
@@ -0,0 +1,37 @@
+import sqlite3
+
+import image_index
+from image_index import ImageFactIndex
+
+def counters(path):
+    with sqlite3.connect(path) as conn:
+        return dict(conn.execute("SELECT name, value FROM counters").fetchall())
+
+def test_lookups_are_counted_in_memory_and_written_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_index, 'LOOKUP_FLUSH_SECONDS', 3600)
+    path = tmp_path / "index.sqlite"
+    index = ImageFactIndex(path)
+    index.put('a', {'width': 1})
+    
+    for _ in range(image_index.LOOKUP_FLUSH_INTERVAL - 1):
+        assert index.get('a') == {'width': 1}
+    assert index.get('b') is None
+    assert counters(path) == {'stores': 1, 'hits': image_index.LOOKUP_FLUSH_INTERVAL - 1, 'misses': 1}
+    
+    index.get('a')
+    assert counters(path)['hits'] == image_index.LOOKUP_FLUSH_INTERVAL - 1
+    stats = index.stats()
+    assert stats['hits'] == image_index.LOOKUP_FLUSH_INTERVAL
+    assert stats['entries'] == 1
+    index.close()
+
+def test_stats_reuses_the_index_size_for_a_while(tmp_path):
+    index = ImageFactIndex(tmp_path / "index.sqlite")
+    index.put('a', {'width': 1})
+    assert index.stats()['entries'] == 1
+    
+    index.put('b', {'width': 2})
+    assert index.stats()['entries'] == 1
+    index._size = None
+    assert index.stats()['entries'] == 2
+    index.close()
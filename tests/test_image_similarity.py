@@ -0,0 +1,27 @@
+import random
+
+import pytest
+
+from image_similarity import MultiIndexHash, hash_distance
+
+@pytest.mark.parametrize("radius", [0, 3, 4, 7, 10, 13])
+def test_search_finds_exactly_the_hashes_within_the_radius(radius):
+    rng = random.Random(radius)
+    query = rng.getrandbits(64)
+    keys = [rng.getrandbits(64) for _ in range(200)]
+    for distance in range(radius + 2):
+        for _ in range(5):
+            flipped = rng.sample(range(64), distance)
+            keys.append(query ^ sum(1 << bit for bit in flipped))
+    # The pigeonhole edge: flips spread over the chunks as evenly as possible
+    spread = [radius // 4 + (chunk < radius % 4) for chunk in range(4)]
+    keys.append(query ^ sum(1 << (chunk * 16 + bit) for chunk in range(4) for bit in range(spread[chunk])))
+    
+    index = MultiIndexHash()
+    for position, key in enumerate(keys):
+        index.add(key, position)
+    
+    found = sorted(index.search(query, radius), key=lambda match: match[1])
+    expected = [(hash_distance(key, query), position) for position, key in enumerate(keys)
+                if hash_distance(key, query) <= radius]
+    assert found == expected
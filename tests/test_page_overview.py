@@ -0,0 +1,10 @@
+from page_overview import OverviewCache, overview_key
+
+def test_overviews_of_different_documents_do_not_collide():
+    cache = OverviewCache()
+    cache.put(overview_key('first', 1), {'image': b'first page', 'matrix': (1, 0, 0, 1, 0, 0)})
+    
+    assert cache.get(overview_key('first', 1))['image'] == b'first page'
+    assert cache.get(overview_key('second', 1)) is None
+    assert cache.get(overview_key('first', 2)) is None
+    assert cache.get(overview_key('first', 1, width=560)) is None
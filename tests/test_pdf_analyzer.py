@@ -0,0 +1,43 @@
+import io
+
+import fitz
+import pytest
+from PIL import Image
+
+from pdf_analyzer import PDFAnalyzer
+
+def test_reduced_preview_renders_the_image_without_overlapping_content():
+    doc = fitz.open()
+    page = doc.new_page(width=600, height=600)
+    pixmap = fitz.Pixmap(fitz.csRGB, 3000, 2000, bytes((20, 200, 20)) * 3000 * 2000, False)
+    page.insert_image(fitz.Rect(50, 50, 550, 383), pixmap=pixmap)
+    page.draw_rect(fitz.Rect(100, 100, 400, 300), color=(1, 0, 0), fill=(1, 0, 0))
+    page.insert_text((120, 200), "OVERLAP", fontsize=40)
+    
+    img, = PDFAnalyzer().analyze_pdf(doc.tobytes())['images']
+    
+    assert img['analysis_level'] == 'reduced'
+    preview = Image.open(io.BytesIO(img['preview'])).convert('RGB')
+    assert preview.size == (200, 134)
+    red, green, blue = preview.getpixel((100, 67))
+    assert green > 150 and red < 60
+
+@pytest.mark.parametrize('decode', [None, 'null'])
+def test_reduced_cmyk_jpeg_ink_matches_a_full_decode(decode):
+    # PyMuPDF stores Pillow's inverted CMYK JPEGs with /Decode [1 0 1 0 1 0 1 0]
+    jpeg = io.BytesIO()
+    Image.new('CMYK', (2400, 1600), (200, 0, 0, 30)).save(jpeg, 'JPEG', quality=95)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=jpeg.getvalue())
+    xref = page.get_images()[0][0]
+    if decode:
+        doc.xref_set_key(xref, "Decode", decode)
+    analyzer = PDFAnalyzer()
+    
+    img, = analyzer.analyze_pdf(doc.tobytes())['images']
+    
+    assert img['analysis_level'] == 'reduced'
+    full_decode = analyzer._pixmap_ink_coverage(fitz.Pixmap(doc, xref))
+    assert img['tac_p99'] == pytest.approx(full_decode['tac_p99'], abs=1)
+    assert img['tac_max'] == pytest.approx(full_decode['tac_max'], abs=1)
@@ -0,0 +1,46 @@
+import pytest
+
+from hot_folder import build_report
+from utils import _ratio_estimate, create_results_dataframe, get_quality_summary, placement_passes
+
+def cmyk_placement(tac_p99):
+    return {'page': 1, 'visible_dpi': 350, 'color_mode': 'CMYK', 'tac_p99': tac_p99}
+
+def test_placement_passes_checks_the_ink_limit_when_given():
+    heavy = cmyk_placement(340)
+    assert placement_passes(heavy, 300, ['CMYK'])
+    assert not placement_passes(heavy, 300, ['CMYK'], ink_limit=300)
+    assert placement_passes(cmyk_placement(280), 300, ['CMYK'], ink_limit=300)
+    assert placement_passes({'visible_dpi': 350, 'color_mode': 'CMYK'}, 300, ['CMYK'], ink_limit=300)
+
+def test_over_ink_placement_fails_in_every_summary():
+    images = [cmyk_placement(340), cmyk_placement(250)]
+    
+    assert get_quality_summary(images, 300, ['CMYK'], 300)['pass_count'] == 1
+    assert list(create_results_dataframe(images, 300, ['CMYK'], 300)['Overall Status']) == ["FAIL", "PASS"]
+    
+    report = build_report({'images': images}, 'a.pdf', 300, ['CMYK'], 300)
+    assert report['status'] == 'fail'
+    assert [failing['reasons'] for failing in report['failing_placements']] == [['ink_limit']]
+
+def test_wilson_interval_for_one_placement_per_page():
+    # 80 of 100 sampled pages from a very large document, one placement each
+    estimate = _ratio_estimate([1] * 80 + [0] * 20, [1] * 100, 10 ** 9, 1.96)
+    assert estimate['estimate'] == pytest.approx(80)
+    assert estimate['low'] == pytest.approx(71.1, abs=0.5)
+    assert estimate['high'] == pytest.approx(86.7, abs=0.5)
+
+def test_wilson_interval_is_not_empty_when_nothing_matches():
+    estimate = _ratio_estimate([0] * 50, [2] * 50, 1000, 1.96)
+    assert estimate['low'] == 0
+    assert 0 < estimate['high'] < 5
+
+def test_wilson_interval_widens_for_clustered_pages():
+    spread = _ratio_estimate([1, 1] * 25, [2] * 50, 10 ** 9, 1.96)
+    clustered = _ratio_estimate([2, 0] * 25, [2] * 50, 10 ** 9, 1.96)
+    assert spread['estimate'] == clustered['estimate'] == pytest.approx(50)
+    assert clustered['high'] - clustered['low'] > spread['high'] - spread['low']
+
+def test_estimate_is_exact_when_every_page_was_sampled():
+    estimate = _ratio_estimate([1, 0, 2], [1, 1, 3], 3, 1.96)
+    assert estimate['low'] == estimate['estimate'] == estimate['high'] == pytest.approx(60)
@@ -0,0 +1,143 @@
+import asyncio
+import glob
+import os
+
+import fitz
+import pytest
+
+from main import analysis_jobs
+from worker_pool import AnalyzerPool, AsyncAnalyzer
+
+class FakeUpload:
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+    
+    def getvalue(self):
+        return self.data
+
+@pytest.fixture(scope="module")
+def pool():
+    with AnalyzerPool(workers=2, wall_timeout=60) as pool:
+        yield pool
+
+def test_duplicate_job_ids_are_rejected(pool, make_pdf):
+    pdf_data = make_pdf([[((72, 72, 144, 144), 32)]])
+    with pytest.raises(ValueError):
+        list(pool.analyze([('x.pdf', pdf_data, {}), ('x.pdf', pdf_data, {})]))
+
+def test_uploads_with_the_same_name_are_analyzed_separately(pool, make_pdf):
+    one_image = make_pdf([[((72, 72, 144, 144), 32)]])
+    three_images = make_pdf([[((72, 72, 144, 144), 32), ((200, 72, 272, 144), 48), ((72, 200, 144, 272), 64)]])
+    uploads = [FakeUpload('proof.pdf', one_image), FakeUpload('proof.pdf', three_images)]
+    
+    jobs, filenames = analysis_jobs(uploads, {})
+    results = dict(pool.analyze(jobs))
+    
+    assert filenames == {0: 'proof.pdf', 1: 'proof.pdf'}
+    assert results[0]['error'] is None and results[1]['error'] is None
+    assert results[0]['total_placements'] == 1
+    assert results[1]['total_placements'] == 3
+
+def test_quick_scans_are_matched_by_upload_index():
+    uploads = [FakeUpload('proof.pdf', b'first'), FakeUpload('proof.pdf', b'second')]
+    scan = {'file_hash': 'scan of the second upload'}
+    
+    jobs, _ = analysis_jobs(uploads, {1: scan})
+    
+    assert jobs[0][2]['resume_from'] is None
+    assert jobs[1][2]['resume_from'] is scan
+
+def test_shared_pool_is_replaced_when_its_options_change(make_pdf):
+    import worker_pool
+    
+    first = worker_pool.get_shared_pool(workers=1)
+    try:
+        assert worker_pool.get_shared_pool(workers=1) is first
+        second = worker_pool.get_shared_pool(workers=1, max_jobs_per_worker=10)
+        assert second is not first
+        assert not first._workers
+        with pytest.raises(RuntimeError):
+            list(first.analyze([(0, make_pdf([[]]), {})]))
+        (_, result), = second.analyze([(0, make_pdf([[((72, 72, 144, 144), 32)]]), {})])
+        assert result['total_placements'] == 1
+    finally:
+        worker_pool._shared_pool.close()
+        worker_pool._shared_pool = worker_pool._shared_pool_key = None
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason="needs /dev/shm to list segments")
+def test_stopping_a_worker_frees_the_previews_it_sent(make_pdf):
+    pdf_data = make_pdf([[((72, 72, 144, 144), 16 + page)] for page in range(60)])
+    analyzer = AsyncAnalyzer(max_workers=1)
+    
+    async def first_placement():
+        placements = analyzer.iter_placements(pdf_data)
+        placement = await placements.__anext__()
+        # Let the worker run ahead, leaving frames and their segments unread in the pipe
+        await asyncio.sleep(1)
+        await placements.aclose()
+        return placement
+    
+    assert asyncio.run(first_placement())['preview']
+    assert not glob.glob('/dev/shm/pdfa_*')
+
+def test_hot_folder_feeds_the_pool_as_files_finish(pool, make_pdf, tmp_path):
+    from hot_folder import HotFolderWatcher
+    
+    for number in range(3):
+        (tmp_path / f"{number}.pdf").write_bytes(make_pdf([[((72, 72, 144, 144), 32 + number)]]))
+    watcher = HotFolderWatcher(tmp_path, pool, settle_seconds=0, max_concurrent=1)
+    try:
+        assert watcher.scan() == []
+        ready = watcher.scan()
+        assert len(ready) == 3
+        
+        # One file in memory at a time, but all three done in one pass
+        reports = watcher.process(ready)
+        assert sorted(report['filename'] for report in reports) == ['0.pdf', '1.pdf', '2.pdf']
+        assert watcher.scan() == []
+    finally:
+        watcher.close()
+
+@pytest.fixture(scope="module")
+def sharding_pool():
+    with AnalyzerPool(workers=2, wall_timeout=60, shard_pages=3) as pool:
+        yield pool
+
+def many_pages(count, side=64):
+    """A document of ``count`` pages with one distinct image each, built without set_rect"""
+    doc = fitz.open()
+    for page_number in range(count):
+        page = doc.new_page()
+        samples = bytes((page_number + offset) % 256 for offset in range(side * side * 3))
+        page.insert_image(fitz.Rect(72, 72, 216, 216), pixmap=fitz.Pixmap(fitz.csRGB, side, side, samples, False))
+    pdf_data = doc.tobytes()
+    doc.close()
+    return pdf_data
+
+def test_sharded_document_merges_into_one_result(pool, sharding_pool):
+    pdf_data = many_pages(7)
+    (_, whole), = pool.analyze([(0, pdf_data, {'fingerprint_pages': True})])
+    (_, sharded), = sharding_pool.analyze([(0, pdf_data, {'fingerprint_pages': True})])
+    
+    assert sharded['error'] is None
+    assert sharded['analyzed_pages'] == whole['analyzed_pages'] == list(range(1, 8))
+    assert [img['image_number'] for img in sharded['images']] == list(range(1, 8))
+    assert [img['page'] for img in sharded['images']] == [img['page'] for img in whole['images']]
+    assert sharded['page_fingerprints'] == whole['page_fingerprints']
+    assert sharded['selection']['pages'] is None
+
+def test_timed_out_shards_keep_the_pages_they_finished(sharding_pool):
+    (_, result), = sharding_pool.analyze([(0, many_pages(400), {})], wall_timeout=0.1)
+    
+    assert result['partial'] and result['timed_out']
+    assert result['error'] == "Timed out after 0.1s"
+    assert 0 < len(result['analyzed_pages']) < 400
+    # Both shards got part of the way
+    assert min(result['analyzed_pages']) <= 200 < max(result['analyzed_pages'])
+    assert [img['page'] for img in result['images']] == result['analyzed_pages']
+    assert [img['image_number'] for img in result['images']] == list(range(1, len(result['images']) + 1))
+    
+    # The timed out workers were replaced
+    (_, result), = sharding_pool.analyze([(1, many_pages(4), {})])
+    assert result['error'] is None and result['total_placements'] == 4
@@ -1,4 +1,8 @@
-import pandas as pd
+import math
+from statistics import NormalDist
+
+# Placements overlapping at least this much (intersection over union) count as one replaced image
+REPLACED_MIN_OVERLAP = 0.5
 
 def format_file_size(size_bytes):
     """Convert bytes to human readable file size"""
@@ -18,8 +22,11 @@ def format_file_size(size_bytes):
     else:
         return f"{size_bytes:.1f} {size_names[i]}"
 
-def create_results_dataframe(images, min_dpi, preferred_modes):
+def create_results_dataframe(images, min_dpi, preferred_modes, ink_limit=None):
     """Create a pandas DataFrame with analysis results"""
+    # Imported here: pandas dominates import time and most callers never need it
+    import pandas as pd
+    
     if not images:
         return pd.DataFrame()
     
@@ -31,12 +38,14 @@ def create_results_dataframe(images, min_dpi, preferred_modes):
         width = img.get('width', 0)
         height = img.get('height', 0)
         visible_dpi = img.get('visible_dpi', 0)
+        estimated_native_dpi = img.get('estimated_native_dpi')
         metadata_dpi = img.get('metadata_dpi', 0)
         color_mode = img.get('color_mode', 'Unknown')
         file_size = img.get('file_size', 0)
         format_type = img.get('format', 'Unknown')
         placed_width_in = img.get('placed_width_in', 0)
         placed_height_in = img.get('placed_height_in', 0)
+        tac_max = img.get('tac_max')
         
         # Handle placement information
         placement_info = ""
@@ -50,7 +59,7 @@ def create_results_dataframe(images, min_dpi, preferred_modes):
         # Determine status based on VISIBLE DPI (not metadata DPI)
         dpi_status = "PASS" if visible_dpi and visible_dpi >= min_dpi else "FAIL"
         color_status = "PASS" if color_mode in preferred_modes else "FAIL"
-        overall_status = "PASS" if dpi_status == "PASS" and color_status == "PASS" else "FAIL"
+        overall_status = "PASS" if placement_passes(img, min_dpi, preferred_modes, ink_limit) else "FAIL"
         
         # Quality category based on visible DPI
         if visible_dpi and visible_dpi >= 300:
@@ -68,8 +77,10 @@ def create_results_dataframe(images, min_dpi, preferred_modes):
             'Native Size (px)': f"{width} × {height}" if width and height else "Unknown",
             'Placed Size': placed_size,
             'Visible DPI': f"{visible_dpi:.0f}" if visible_dpi else "Unknown",
+            'Est. Native DPI': f"{estimated_native_dpi:.0f}" if estimated_native_dpi else "—",
             'Metadata DPI': f"{metadata_dpi:.0f}" if metadata_dpi else "Unknown",
             'Color Space': color_mode,
+            'Max Ink': f"{tac_max:.0f}%" if tac_max is not None else "—",
             'Format': format_type,
             'File Size': format_file_size(file_size),
             'Quality': quality,
@@ -80,7 +91,7 @@ def create_results_dataframe(images, min_dpi, preferred_modes):
     
     return pd.DataFrame(data)
 
-def get_quality_summary(images, min_dpi, preferred_modes):
+def get_quality_summary(images, min_dpi, preferred_modes, ink_limit=None):
     """Get summary statistics about image quality based on visible DPI"""
     if not images:
         return {
@@ -102,7 +113,6 @@ def get_quality_summary(images, min_dpi, preferred_modes):
     for img in images:
         visible_dpi = img.get('visible_dpi', 0)
         metadata_dpi = img.get('metadata_dpi', 0)
-        color_mode = img.get('color_mode', '')
         
         # Collect DPI values for average calculation
         if visible_dpi:
@@ -111,10 +121,7 @@ def get_quality_summary(images, min_dpi, preferred_modes):
             metadata_dpi_values.append(metadata_dpi)
         
         # Check if image passes criteria based on VISIBLE DPI
-        dpi_pass = visible_dpi and visible_dpi >= min_dpi
-        color_pass = color_mode in preferred_modes
-        
-        if dpi_pass and color_pass:
+        if placement_passes(img, min_dpi, preferred_modes, ink_limit):
             pass_count += 1
         
         if visible_dpi and visible_dpi >= 300:
@@ -134,6 +141,361 @@ def get_quality_summary(images, min_dpi, preferred_modes):
         'average_metadata_dpi': average_metadata_dpi
     }
 
+def _quality_category(visible_dpi):
+    """Map a visible DPI to the quality category used across the reports"""
+    if visible_dpi and visible_dpi >= 300:
+        return "Excellent"
+    elif visible_dpi and visible_dpi >= 250:
+        return "Good"
+    elif visible_dpi and visible_dpi >= 150:
+        return "Acceptable"
+    return "Poor"
+
+def _ratio_estimate(hits, totals, population_pages, z):
+    """Estimate a placement-level proportion from per-page (cluster) samples
+
+    ``hits`` and ``totals`` hold, for each sampled page, the matching and total
+    placement counts. Returns percentages with a Wilson interval whose sample size
+    is the design-effect adjusted number of placements.
+    """
+    sampled_pages = len(totals)
+    total_placements = sum(totals)
+    if total_placements == 0:
+        return {'estimate': 0, 'low': 0, 'high': 0}
+    
+    ratio = sum(hits) / total_placements
+    if sampled_pages >= population_pages:
+        # Every page was analyzed, the proportion is exact
+        return {'estimate': ratio * 100, 'low': ratio * 100, 'high': ratio * 100}
+    
+    effective_n = total_placements
+    if sampled_pages > 1:
+        mean_placements = total_placements / sampled_pages
+        residual = sum((y - ratio * m) ** 2 for y, m in zip(hits, totals)) / (sampled_pages - 1)
+        fpc = 1 - sampled_pages / population_pages
+        variance = fpc * residual / (sampled_pages * mean_placements ** 2)
+        if variance > 0 and 0 < ratio < 1:
+            effective_n = min(total_placements, ratio * (1 - ratio) / variance)
+    else:
+        effective_n = 1
+    
+    denominator = 1 + z ** 2 / effective_n
+    centre = (ratio + z ** 2 / (2 * effective_n)) / denominator
+    margin = z * math.sqrt(ratio * (1 - ratio) / effective_n + z ** 2 / (4 * effective_n ** 2)) / denominator
+    
+    return {
+        'estimate': ratio * 100,
+        'low': max(0.0, centre - margin) * 100,
+        'high': min(1.0, centre + margin) * 100
+    }
+
+def estimate_quality_from_scan(scan_result, min_dpi, preferred_modes, confidence=0.95, ink_limit=None):
+    """Estimate document-wide quality figures from a ``PDFAnalyzer.quick_scan`` result"""
+    scan = scan_result.get('scan', {})
+    sampled_pages = scan.get('sampled_pages', [])
+    page_count = scan.get('page_count', 0)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    
+    images_by_page = {page: [] for page in sampled_pages}
+    for img in scan_result.get('images', []):
+        if img.get('page') in images_by_page:
+            images_by_page[img['page']].append(img)
+    
+    totals = [len(images_by_page[page]) for page in sampled_pages]
+    
+    def estimate(predicate):
+        hits = [sum(1 for img in images_by_page[page] if predicate(img)) for page in sampled_pages]
+        return _ratio_estimate(hits, totals, page_count, z)
+    
+    dpi_distribution = {}
+    for category in ["Excellent", "Good", "Acceptable", "Poor"]:
+        dpi_distribution[category] = estimate(
+            lambda img, category=category: _quality_category(img.get('visible_dpi')) == category
+        )
+    
+    color_modes = sorted({img.get('color_mode', 'Unknown') for img in scan_result.get('images', [])})
+    color_space_mix = {}
+    for color_mode in color_modes:
+        color_space_mix[color_mode] = estimate(
+            lambda img, color_mode=color_mode: img.get('color_mode', 'Unknown') == color_mode
+        )
+    
+    # Scale the sampled placement count up to the whole document
+    if sampled_pages:
+        mean_placements = sum(totals) / len(sampled_pages)
+        estimated_placements = round(mean_placements * page_count)
+    else:
+        estimated_placements = 0
+    
+    # Distinct images are exact when the scan decoded every xref once
+    distinct_color_mix = {}
+    if scan.get('distinct_images_scanned'):
+        for facts in scan_result.get('image_facts', {}).values():
+            color_mode = facts.get('color_mode') or 'Unknown'
+            distinct_color_mix[color_mode] = distinct_color_mix.get(color_mode, 0) + 1
+    
+    return {
+        'confidence': confidence,
+        'exact': scan.get('complete', False),
+        'sampled_pages': len(sampled_pages),
+        'total_pages': page_count,
+        'sampled_placements': sum(totals),
+        'estimated_placements': estimated_placements,
+        'pass_rate': estimate(lambda img: placement_passes(img, min_dpi, preferred_modes, ink_limit)),
+        'dpi_distribution': dpi_distribution,
+        'color_space_mix': color_space_mix,
+        'distinct_image_color_mix': distinct_color_mix
+    }
+
+def exceeds_ink_limit(img, ink_limit):
+    """Whether more than 1% of a CMYK image's area is above the total ink limit (in %)"""
+    return img.get('tac_p99') is not None and img['tac_p99'] > ink_limit
+
+def looks_upsampled(img, min_dpi):
+    """Whether a placement meets ``min_dpi`` only because its image was upsampled"""
+    visible_dpi = img.get('visible_dpi')
+    estimated_native_dpi = img.get('estimated_native_dpi')
+    return bool(visible_dpi and estimated_native_dpi and visible_dpi >= min_dpi and estimated_native_dpi < min_dpi)
+
+def placement_passes(img, min_dpi, preferred_modes, ink_limit=None):
+    """Whether a placement meets the visible DPI, color space and (if given) total ink criteria"""
+    visible_dpi = img.get('visible_dpi', 0)
+    if not (visible_dpi and visible_dpi >= min_dpi and img.get('color_mode') in preferred_modes):
+        return False
+    return ink_limit is None or not exceeds_ink_limit(img, ink_limit)
+
+def diff_preflight(previous_result, result, min_dpi, preferred_modes, ink_limit=None):
+    """Report preflight changes between two revisions of a document
+
+    Pages are matched by fingerprint, so moved but unchanged pages are recognised.
+    Remaining pages are paired by their position relative to the last matched page,
+    and their placements by placement rect. Both results need page fingerprints, so
+    analyze with ``previous`` or ``fingerprint_pages=True``; raises ``ValueError``
+    otherwise.
+    """
+    for analysis in (previous_result, result):
+        if analysis.get('total_pages') and not analysis.get('page_fingerprints'):
+            raise ValueError("diff_preflight needs results analyzed with page fingerprints")
+    
+    def page_fingerprints(analysis):
+        return {int(page): record['fingerprint'] for page, record in analysis.get('page_fingerprints', {}).items()}
+    
+    def images_by_page(analysis):
+        pages = {}
+        for img in analysis.get('images', []):
+            pages.setdefault(img.get('page'), []).append(img)
+        return pages
+    
+    def failures(images):
+        failing = {}
+        for img in images:
+            if not placement_passes(img, min_dpi, preferred_modes, ink_limit):
+                rect = img.get('placement_rect') or {}
+                key = tuple(round(rect.get(k, 0)) for k in ('x0', 'y0', 'x1', 'y1'))
+                failing[key] = img
+        return failing
+    
+    old_fingerprints = page_fingerprints(previous_result)
+    new_fingerprints = page_fingerprints(result)
+    old_images = images_by_page(previous_result)
+    new_images = images_by_page(result)
+    
+    # Old pages per fingerprint, in page order; a document may repeat a page
+    old_pages_by_fingerprint = {}
+    for page in sorted(old_fingerprints):
+        old_pages_by_fingerprint.setdefault(old_fingerprints[page], []).append(page)
+    
+    # Unchanged pages keep their page number; other copies take the remaining old pages in order
+    matches = {}
+    for page, fingerprint in new_fingerprints.items():
+        if old_fingerprints.get(page) == fingerprint:
+            matches[page] = page
+            old_pages_by_fingerprint[fingerprint].remove(page)
+    for page in sorted(new_fingerprints):
+        candidates = old_pages_by_fingerprint.get(new_fingerprints[page])
+        if page not in matches and candidates:
+            matches[page] = candidates.pop(0)
+    
+    unchanged_pages = []
+    moved_pages = []
+    changed_pages = []
+    added_pages = []
+    matched_old_pages = set(matches.values())
+    
+    for page in sorted(matches):
+        if matches[page] == page:
+            unchanged_pages.append(page)
+        else:
+            moved_pages.append({'page': page, 'previous_page': matches[page]})
+    
+    # Pair each remaining page with the old page at the same offset from the last matched page
+    offset = 0
+    for page in sorted(new_fingerprints):
+        old_page = matches.get(page)
+        if old_page is not None:
+            offset = old_page - page
+            continue
+        old_page = page + offset
+        if old_page not in old_fingerprints or old_page in matched_old_pages:
+            added_pages.append(page)
+            continue
+        
+        matched_old_pages.add(old_page)
+        old_failures = failures(old_images.get(old_page, []))
+        new_failures = failures(new_images.get(page, []))
+        changed_pages.append({
+            'page': page,
+            'previous_page': old_page,
+            'previous_placements': len(old_images.get(old_page, [])),
+            'placements': len(new_images.get(page, [])),
+            'previous_status': "FAIL" if old_failures else "PASS",
+            'status': "FAIL" if new_failures else "PASS",
+            'new_failures': [new_failures[key] for key in new_failures if key not in old_failures],
+            'resolved_failures': [old_failures[key] for key in old_failures if key not in new_failures]
+        })
+    
+    removed_pages = sorted(page for page in old_fingerprints if page not in matched_old_pages)
+    
+    def pass_rate(analysis):
+        return get_quality_summary(analysis.get('images', []), min_dpi, preferred_modes, ink_limit)['pass_rate']
+    
+    return {
+        'unchanged_pages': unchanged_pages,
+        'moved_pages': moved_pages,
+        'changed_pages': changed_pages,
+        'added_pages': added_pages,
+        'removed_pages': removed_pages,
+        'previous_pass_rate': pass_rate(previous_result),
+        'pass_rate': pass_rate(result)
+    }
+
+def compare_documents(previous_result, result, min_dpi, preferred_modes, ink_limit=None):
+    """Report image changes between two versions of a document, from hashes and metadata
+
+    Both results come from ``PDFAnalyzer.inventory`` (or carry ``stream_hash`` per
+    placement). Placements are matched on the same page: first by rect and image, then
+    the same image at another rect (rescaled or moved), then another image covering
+    mostly the same area (replaced). What is left over was added or removed. Every
+    reported change carries the preflight status before and after.
+    """
+    def rect_key(img):
+        rect = img.get('placement_rect') or {}
+        return tuple(round(rect.get(k, 0)) for k in ('x0', 'y0', 'x1', 'y1'))
+    
+    def placed_size(img):
+        return (round(img.get('placed_width_points') or 0), round(img.get('placed_height_points') or 0))
+    
+    def overlap(a, b):
+        """Intersection over union of two placement rects"""
+        a = a.get('placement_rect') or {}
+        b = b.get('placement_rect') or {}
+        if not a or not b:
+            return 0
+        width = min(a['x1'], b['x1']) - max(a['x0'], b['x0'])
+        height = min(a['y1'], b['y1']) - max(a['y0'], b['y0'])
+        if width <= 0 or height <= 0:
+            return 0
+        intersection = width * height
+        area_a = (a['x1'] - a['x0']) * (a['y1'] - a['y0'])
+        area_b = (b['x1'] - b['x0']) * (b['y1'] - b['y0'])
+        return intersection / (area_a + area_b - intersection)
+    
+    def describe(img):
+        if img is None:
+            return None
+        return {
+            'page': img.get('page'),
+            'xref': img.get('xref'),
+            'width': img.get('width'),
+            'height': img.get('height'),
+            'visible_dpi': img.get('visible_dpi'),
+            'color_mode': img.get('color_mode'),
+            'placement_rect': img.get('placement_rect'),
+            'status': "PASS" if placement_passes(img, min_dpi, preferred_modes, ink_limit) else "FAIL"
+        }
+    
+    def change(previous, current):
+        previous, current = describe(previous), describe(current)
+        return {
+            'page': (current or previous)['page'],
+            'previous': previous,
+            'current': current,
+            'previous_status': previous['status'] if previous else None,
+            'status': current['status'] if current else None
+        }
+    
+    def by_page(analysis):
+        pages = {}
+        for img in analysis.get('images', []):
+            if not img.get('error'):
+                pages.setdefault(img.get('page'), []).append(img)
+        return pages
+    
+    def pair(old, new, key):
+        """Pair up placements with equal keys in order; returns the pairs and what is left"""
+        waiting = {}
+        for img in old:
+            waiting.setdefault(key(img), []).append(img)
+        pairs = []
+        unmatched_new = []
+        for img in new:
+            candidates = waiting.get(key(img))
+            if candidates:
+                pairs.append((candidates.pop(0), img))
+            else:
+                unmatched_new.append(img)
+        unmatched_old = [img for candidates in waiting.values() for img in candidates]
+        return pairs, unmatched_old, unmatched_new
+    
+    old_pages = by_page(previous_result)
+    new_pages = by_page(result)
+    
+    unchanged = 0
+    added = []
+    removed = []
+    replaced = []
+    rescaled = []
+    moved = []
+    
+    for page in sorted(set(old_pages) | set(new_pages), key=lambda page: page or 0):
+        same, old, new = pair(old_pages.get(page, []), new_pages.get(page, []),
+                              lambda img: (rect_key(img), img.get('stream_hash')))
+        unchanged += len(same)
+        
+        relocated, old, new = pair(old, new, lambda img: img.get('stream_hash'))
+        for previous, current in relocated:
+            if placed_size(previous) == placed_size(current):
+                moved.append(change(previous, current))
+            else:
+                rescaled.append(change(previous, current))
+        
+        # Another image in place of one: the leftover placement covering most of the same area
+        for current in list(new):
+            best = max(old, key=lambda previous: overlap(previous, current), default=None)
+            if best is not None and overlap(best, current) >= REPLACED_MIN_OVERLAP:
+                old.remove(best)
+                new.remove(current)
+                replaced.append(change(best, current))
+        
+        removed.extend(change(previous, None) for previous in old)
+        added.extend(change(None, current) for current in new)
+    
+    changes = added + removed + replaced + rescaled + moved
+    return {
+        'unchanged': unchanged,
+        'added': added,
+        'removed': removed,
+        'replaced': replaced,
+        'rescaled': rescaled,
+        'moved': moved,
+        # Placements present in both versions whose status changed
+        'verdict_changes': sum(1 for item in replaced + rescaled + moved if item['previous_status'] != item['status']),
+        # Added or changed placements that fail where they did not before
+        'new_failures': sum(1 for item in changes if item['status'] == "FAIL" and item['previous_status'] != "FAIL"),
+        'previous_pages': previous_result.get('total_pages', 0),
+        'pages': result.get('total_pages', 0)
+    }
+
 def get_color_space_distribution(images):
     """Get distribution of color spaces in images"""
     color_counts = {}
@@ -0,0 +1,907 @@
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+
+import fitz
+
+from page_overview import OVERVIEW_WIDTH, render_overviews
+from pdf_analyzer import parse_page_selection
+from result_transfer import (
+    PlacementDecoder, PreviewSegments, SharedDocument, document_ref, free_unread_previews, new_segment_prefix,
+    pack_placements, release_document, share_document
+)
+
+logger = logging.getLogger(__name__)
+
+# Relative cost weights for scheduling, roughly seconds of analysis on a laptop core
+COST_PER_MB = 0.2
+COST_PER_PAGE = 0.02
+COST_PER_IMAGE = 0.1
+
+# Memory assumed per worker when the analyzer has no memory budget
+DEFAULT_WORKER_MEMORY = 1024 * 1024 * 1024
+# Interpreter, PyMuPDF and the open document on top of the decode budget
+WORKER_BASE_MEMORY = 256 * 1024 * 1024
+
+# Seconds an idle worker has to answer a health check, including its startup imports
+HEALTH_CHECK_TIMEOUT = 10
+
+# Seconds between asking for more jobs while workers are idle (see AnalyzerPool.analyze)
+REFILL_INTERVAL = 1.0
+
+def estimate_cost(pdf_data, pages=None):
+    """Estimate the analysis cost of a document from its size and xref table
+    
+    Only the xref table and image dictionaries are read, nothing is decoded. Returns
+    the selected 1-based page numbers (None if the document cannot be opened or the
+    selection is invalid, in which case the worker reports the error) and the cost.
+    """
+    size_mb = len(pdf_data) / (1024 * 1024)
+    try:
+        with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+            page_count = len(doc)
+            selected_pages = [page_num + 1 for page_num in parse_page_selection(pages, page_count)]
+            image_count = sum(
+                1 for xref in range(1, doc.xref_length())
+                if doc.xref_get_key(xref, "Subtype") == ('name', '/Image')
+            )
+    except Exception:
+        return {'pages': None, 'cost': size_mb * COST_PER_MB}
+    
+    # Bytes and images are assumed to be spread evenly over the pages
+    fraction = len(selected_pages) / page_count if page_count else 0
+    cost = (size_mb * COST_PER_MB + image_count * COST_PER_IMAGE) * fraction
+    cost += len(selected_pages) * COST_PER_PAGE
+    return {'pages': selected_pages, 'cost': cost}
+
+def _available_memory():
+    """Bytes of memory available to new processes, or None if unknown"""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def default_worker_count(memory_budget_bytes=None):
+    """Number of workers that fits the machine's CPUs and available memory"""
+    cpus = os.cpu_count() or 1
+    available = _available_memory()
+    if available is None:
+        return cpus
+    per_worker = (memory_budget_bytes or DEFAULT_WORKER_MEMORY) + WORKER_BASE_MEMORY
+    return max(1, min(cpus, available // per_worker))
+
+def _limit_cpu(seconds):
+    """Make the kernel stop this process once it has used ``seconds`` more CPU time"""
+    try:
+        import resource
+    except ImportError:  # Windows has no RLIMIT_CPU
+        return
+    
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    if seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _create_worker_analyzer(analyzer_options):
+    """Build the analyzer a worker process uses for all of its jobs"""
+    from pdf_analyzer import PDFAnalyzer
+    
+    options = dict(analyzer_options)
+    index_path = options.pop('image_index_path', None)
+    if index_path:
+        from image_index import ImageFactIndex
+        options['image_index'] = ImageFactIndex(index_path)
+    return PDFAnalyzer(**options)
+
+def _worker_main(conn, analyzer_options):
+    """Worker process loop: analyze documents sent over ``conn`` and stream back pages"""
+    analyzer = _create_worker_analyzer(analyzer_options)
+    
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message[0] == 'stop':
+            break
+        if message[0] == 'ping':
+            conn.send(('pong',))
+            continue
+        # Acknowledge the job so its wall-clock budget starts now, not while this process started up
+        conn.send(('started', message[1]))
+        if message[0] == 'render':
+            _, job_id, document, pages, width = message
+            with SharedDocument(document) as pdf_data:
+                for page_number, overview in render_overviews(pdf_data, pages, width):
+                    conn.send(('overview', job_id, page_number, overview))
+            conn.send(('rendered', job_id))
+            continue
+        
+        _, job_id, document, analyze_options, cpu_timeout, segment_prefix = message
+        _limit_cpu(cpu_timeout)
+        sent_previews = set()
+        segments = PreviewSegments(segment_prefix)
+        
+        def on_page(page_number, page_images, page_count):
+            frame = pack_placements(page_images, sent_previews, segments)
+            conn.send(('page', job_id, page_number, frame, page_count))
+        
+        with SharedDocument(document) as pdf_data:
+            result = analyzer.analyze_pdf(pdf_data, on_page=on_page, **analyze_options)
+        
+        if not result.get('error'):
+            # Placements already arrived page by page; per-xref facts only matter for quick scans
+            del result['images']
+            del result['image_facts']
+        _limit_cpu(None)
+        conn.send(('done', job_id, result))
+    
+    if analyzer.image_index is not None:
+        # Writes the lookup counts not yet flushed
+        analyzer.image_index.close()
+
+def _ordered_images(pages):
+    """Flatten streamed pages into placements numbered in page order"""
+    images = []
+    for page in sorted(pages):
+        images.extend(pages[page])
+    for placement_number, img_data in enumerate(images, 1):
+        img_data['image_number'] = placement_number
+    return images
+
+def _exit_reason(exitcode, cpu_timeout):
+    """Describe why a worker died; returns ``(reason, timed_out)``"""
+    if hasattr(signal, 'SIGXCPU') and exitcode == -signal.SIGXCPU:
+        return f"CPU budget of {cpu_timeout}s exceeded", True
+    return f"Worker exited unexpectedly (exit code {exitcode})", False
+
+class _Worker:
+    """Parent-side handle for one worker process"""
+    
+    def __init__(self, context, analyzer_options):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, analyzer_options), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.job_id = None
+        self.sent_at = None
+        self.started_at = None
+        self.jobs_done = 0
+        self.segment_prefix = None
+        self.segments_read = 0
+    
+    def send_job(self, job_id, document, analyze_options, cpu_timeout):
+        self.job_id = job_id
+        self.sent_at = time.monotonic()
+        self.started_at = None
+        self.segment_prefix = new_segment_prefix()
+        self.segments_read = 0
+        self.conn.send(('job', job_id, document, analyze_options, cpu_timeout, self.segment_prefix))
+    
+    def send_render(self, job_id, document, pages, width):
+        self.job_id = job_id
+        self.sent_at = time.monotonic()
+        self.started_at = None
+        self.conn.send(('render', job_id, document, pages, width))
+    
+    def acknowledge(self):
+        """Record the worker's ``('started', job_id)`` message"""
+        self.started_at = time.monotonic()
+    
+    def unpack(self, decoder, frame):
+        """Decode a page frame of the current job, counting the preview segments read"""
+        if isinstance(frame['previews'], tuple):
+            self.segments_read += 1
+        return decoder.unpack(frame)
+    
+    def finish_job(self):
+        self.job_id = None
+        self.started_at = None
+        self.segment_prefix = None
+        self.jobs_done += 1
+    
+    def deadline(self, wall_timeout):
+        """Monotonic time by which the current job must finish
+        
+        The budget runs from the worker's acknowledgement, so a replacement worker's
+        startup does not count against the job; until the acknowledgement arrives the
+        worker has ``HEALTH_CHECK_TIMEOUT`` seconds to start.
+        """
+        if self.started_at is None:
+            return self.sent_at + HEALTH_CHECK_TIMEOUT
+        return self.started_at + wall_timeout
+    
+    def timeout_reason(self, wall_timeout):
+        if self.started_at is None:
+            return f"Worker did not start within {HEALTH_CHECK_TIMEOUT}s"
+        return f"Timed out after {wall_timeout}s"
+    
+    def ping(self, timeout=HEALTH_CHECK_TIMEOUT):
+        """Whether an idle worker is alive and answering its pipe"""
+        try:
+            self.conn.send(('ping',))
+            return self.conn.poll(timeout) and self.conn.recv() == ('pong',)
+        except (EOFError, OSError):
+            return False
+    
+    def kill(self):
+        """Stop the process, forcefully if it does not exit promptly
+        
+        Preview segments of an unfinished job that the parent never read (frames
+        still in the pipe, or made just before the process died) are unlinked.
+        """
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        if self.segment_prefix is not None:
+            freed = free_unread_previews(self.segment_prefix, self.segments_read)
+            if freed:
+                logger.debug(f"Freed {freed} preview segment(s) of a stopped job")
+            self.segment_prefix = None
+    
+    def stop(self):
+        try:
+            self.conn.send(('stop',))
+        except (OSError, ValueError):
+            pass
+        self.process.join(2)
+        if self.process.is_alive():
+            self.kill()
+
+class AnalyzerPool:
+    """Supervised pool of analyzer worker processes
+    
+    Each document runs in a worker process under a wall-clock budget (enforced by
+    the supervisor from when the worker picks the document up) and an optional CPU
+    budget (enforced by the kernel through RLIMIT_CPU). Workers that exceed a budget
+    or crash are killed and replaced, and their document is reported with the pages
+    finished so far, so one pathological file cannot hold up the batch.
+    
+    Documents are scheduled shortest estimated job first, which minimizes the mean
+    time until each file's results are ready. With ``shard_pages`` set, documents
+    with more selected pages than that are split into page shards that run on
+    several workers at once, while smaller documents run whole. The budgets apply
+    to each shard.
+    
+    A pool can be kept for the life of the process and shared between callers;
+    runs take turns. Before each run, workers that died or stopped answering are
+    replaced, and with ``max_jobs_per_worker`` set, each worker is recycled after
+    that many jobs so memory held by MuPDF and the analyzer caches cannot grow
+    without bound. A run abandoned part way kills the workers still busy with it.
+    """
+    
+    def __init__(self, workers=None, wall_timeout=300, cpu_timeout=None, analyzer_options=None,
+                 shard_pages=None, max_jobs_per_worker=None):
+        self.analyzer_options = analyzer_options or {}
+        self.worker_count = workers or default_worker_count(self.analyzer_options.get('memory_budget_bytes'))
+        self.wall_timeout = wall_timeout
+        self.cpu_timeout = cpu_timeout
+        self.shard_pages = shard_pages
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._run_wall_timeout = wall_timeout
+        self._lock = threading.Lock()
+        self._closed = False
+        # Spawned workers do not inherit the parent's threads or MuPDF state
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = [self._start_worker() for _ in range(self.worker_count)]
+    
+    def _start_worker(self):
+        return _Worker(self._context, self.analyzer_options)
+    
+    def _replace_worker(self, worker):
+        worker.kill()
+        index = self._workers.index(worker)
+        self._workers[index] = self._start_worker()
+    
+    def _recycle_worker(self, worker):
+        """Retire a worker that has done its share of jobs and start a fresh one"""
+        logger.info(f"Recycling worker after {worker.jobs_done} jobs")
+        worker.stop()
+        index = self._workers.index(worker)
+        self._workers[index] = self._start_worker()
+    
+    def _due_for_recycling(self, worker):
+        return bool(self.max_jobs_per_worker) and worker.jobs_done >= self.max_jobs_per_worker
+    
+    def check_health(self):
+        """Replace idle workers that died or do not answer, and recycle worn ones
+        
+        Returns the number of workers replaced.
+        """
+        replaced = 0
+        for worker in list(self._workers):
+            if worker.job_id is not None:
+                continue
+            if self._due_for_recycling(worker):
+                self._recycle_worker(worker)
+            elif not worker.process.is_alive() or not worker.ping():
+                logger.warning(f"Worker failed its health check (exit code {worker.process.exitcode}), replacing it")
+                self._replace_worker(worker)
+            else:
+                continue
+            replaced += 1
+        return replaced
+    
+    def analyze(self, jobs, wall_timeout=None, more_jobs=None):
+        """Analyze ``(job_id, pdf_data, analyze_options)`` jobs, yielding ``(job_id, result)``
+        
+        Results are yielded as documents finish, not in submission order. Job ids
+        must be unique among the jobs in progress. ``wall_timeout`` overrides the
+        pool's budget for this run; 0 disables it.
+        
+        ``more_jobs``, if given, is called without arguments when a worker is idle and
+        no job is waiting (as a job finishes, and every ``REFILL_INTERVAL`` seconds
+        while workers stay idle) and returns further jobs for this run, possibly none.
+        The run ends once all workers are idle and it has none to add.
+        """
+        jobs = list(jobs)
+        with self._lock:
+            self._check_open()
+            self._run_wall_timeout = self.wall_timeout if wall_timeout is None else wall_timeout or None
+            self.check_health()
+            yield from self._run(jobs, more_jobs)
+    
+    def _queue(self, jobs, pending, documents):
+        """Schedule ``jobs`` onto ``pending`` and track them in ``documents``"""
+        job_ids = [job_id for job_id, _, _ in jobs]
+        if len(set(job_ids)) != len(job_ids) or any(job_id in documents for job_id in job_ids):
+            raise ValueError("Job ids must be unique among the jobs in progress")
+        for job_id, _, analyze_options in jobs:
+            documents[job_id] = {
+                'shards': 0,
+                'results': {},
+                'selection': (analyze_options or {}).get('pages'),
+                'segment': None,
+                'decoder': PlacementDecoder()
+            }
+        for task in self._schedule(jobs):
+            documents[task[0]]['shards'] += 1
+            pending.append(task)
+    
+    def _run(self, jobs, more_jobs=None):
+        """Dispatch loop of :meth:`analyze`, run while holding the pool"""
+        pending = deque()
+        documents = {}
+        self._queue(jobs, pending, documents)
+        progress = {}
+        next_refill = 0
+        
+        try:
+            while True:
+                idle = any(worker.job_id is None for worker in self._workers)
+                if more_jobs is not None and idle and not pending and time.monotonic() >= next_refill:
+                    self._queue(list(more_jobs()), pending, documents)
+                    next_refill = time.monotonic() + REFILL_INTERVAL
+                if not pending and not any(worker.job_id is not None for worker in self._workers):
+                    break
+                
+                for worker in self._workers:
+                    if worker.job_id is None and pending:
+                        job_id, shard, pdf_data, analyze_options = pending.popleft()
+                        document = documents[job_id]
+                        # All shards of a document read the one shared copy
+                        if document['segment'] is None:
+                            document['segment'] = share_document(pdf_data)
+                        progress[(job_id, shard)] = {'pages': {}, 'page_count': 0, 'decoder': document['decoder']}
+                        worker.send_job(
+                            (job_id, shard), document_ref(document['segment'], pdf_data),
+                            analyze_options, self.cpu_timeout
+                        )
+                
+                busy = [worker for worker in self._workers if worker.job_id is not None]
+                waitables = [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy]
+                timeout = self._next_deadline(busy)
+                if more_jobs is not None and len(busy) < len(self._workers):
+                    refill_in = max(0.0, next_refill - time.monotonic())
+                    timeout = refill_in if timeout is None else min(timeout, refill_in)
+                wait(waitables, timeout=timeout)
+                
+                for worker in busy:
+                    for (job_id, shard), result in self._collect(worker, progress):
+                        # A worker is free again, so ask for more work straight away
+                        next_refill = 0
+                        document = documents[job_id]
+                        document['results'][shard] = result
+                        if len(document['results']) == document['shards']:
+                            del documents[job_id]
+                            release_document(document['segment'])
+                            yield job_id, self._merge_shards(document['results'], document['selection'])
+        finally:
+            for document in documents.values():
+                release_document(document['segment'])
+            # Workers still on an abandoned run's jobs would deliver stale results to the next one
+            for worker in self._workers:
+                if worker.job_id is not None:
+                    self._replace_worker(worker)
+    
+    def render_overviews(self, pdf_data, pages, width=OVERVIEW_WIDTH):
+        """Render low-zoom overviews of 1-based ``pages``, yielding ``(page_number, overview)``
+        
+        Pages are split into contiguous chunks, one per worker, which all read one
+        shared copy of the document, and are yielded as they finish. A worker that dies
+        or exceeds the wall-clock budget is replaced and its unfinished pages are
+        yielded with None. See :func:`page_overview.render_overviews`.
+        """
+        with self._lock:
+            self._check_open()
+            self._run_wall_timeout = self.wall_timeout
+            self.check_health()
+            yield from self._render(pdf_data, list(pages), width)
+    
+    def _render(self, pdf_data, pages, width):
+        """Dispatch loop of :meth:`render_overviews`, run while holding the pool"""
+        if not pages:
+            return
+        chunk_count = min(len(self._workers), len(pages))
+        chunks = [
+            pages[chunk * len(pages) // chunk_count:(chunk + 1) * len(pages) // chunk_count]
+            for chunk in range(chunk_count)
+        ]
+        segment = share_document(pdf_data)
+        unfinished = {}
+        
+        try:
+            for chunk, (worker, chunk_pages) in enumerate(zip(list(self._workers), chunks)):
+                worker.send_render(('overview', chunk), document_ref(segment, pdf_data), chunk_pages, width)
+                unfinished[worker] = set(chunk_pages)
+            
+            while unfinished:
+                busy = list(unfinished)
+                wait([worker.conn for worker in busy] + [worker.process.sentinel for worker in busy],
+                     timeout=self._next_deadline(busy))
+                
+                for worker in busy:
+                    try:
+                        while worker.job_id is not None and worker.conn.poll():
+                            message = worker.conn.recv()
+                            if message[0] == 'started':
+                                worker.acknowledge()
+                            elif message[0] == 'overview':
+                                unfinished[worker].discard(message[2])
+                                yield message[2], message[3]
+                            elif message[0] == 'rendered':
+                                del unfinished[worker]
+                                worker.finish_job()
+                                if self._due_for_recycling(worker):
+                                    self._recycle_worker(worker)
+                    except (EOFError, OSError):
+                        pass
+                    if worker not in unfinished:
+                        continue
+                    
+                    if not worker.process.is_alive():
+                        reason, _ = _exit_reason(worker.process.exitcode, self.cpu_timeout)
+                    elif self._run_wall_timeout and time.monotonic() > worker.deadline(self._run_wall_timeout):
+                        reason = worker.timeout_reason(self._run_wall_timeout)
+                    else:
+                        continue
+                    logger.warning(f"Overview rendering: {reason}, replacing worker")
+                    self._replace_worker(worker)
+                    for page_number in sorted(unfinished.pop(worker)):
+                        yield page_number, None
+        finally:
+            release_document(segment)
+            # Workers still rendering for an abandoned run would answer the next one
+            for worker in self._workers:
+                if worker.job_id is not None:
+                    self._replace_worker(worker)
+    
+    def _schedule(self, jobs):
+        """Order jobs shortest first and split large documents into page shards
+        
+        Returns ``(job_id, shard, pdf_data, analyze_options)`` tasks.
+        """
+        estimated = []
+        for job_id, pdf_data, analyze_options in jobs:
+            analyze_options = dict(analyze_options or {})
+            estimate = estimate_cost(pdf_data, analyze_options.get('pages'))
+            estimated.append((estimate['cost'], job_id, pdf_data, analyze_options, estimate['pages']))
+        estimated.sort(key=lambda job: job[0])
+        
+        tasks = []
+        for cost, job_id, pdf_data, analyze_options, pages in estimated:
+            shards = self._shard_pages(pages)
+            if len(shards) == 1:
+                tasks.append((job_id, 0, pdf_data, analyze_options))
+                continue
+            logger.info(f"Job {job_id}: split into {len(shards)} shards (estimated cost {cost:.1f})")
+            for shard, shard_pages in enumerate(shards):
+                tasks.append((job_id, shard, pdf_data, dict(analyze_options, pages=shard_pages)))
+        return tasks
+    
+    def _shard_pages(self, pages):
+        """Split selected pages into contiguous shards, at most one per worker"""
+        if not self.shard_pages or not pages or len(pages) <= self.shard_pages:
+            return [pages]
+        shard_count = min(math.ceil(len(pages) / self.shard_pages), self.worker_count)
+        return [
+            pages[shard * len(pages) // shard_count:(shard + 1) * len(pages) // shard_count]
+            for shard in range(shard_count)
+        ]
+    
+    def _next_deadline(self, busy):
+        """Seconds until the earliest running job reaches its wall-clock budget"""
+        if not self._run_wall_timeout or not busy:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(worker.deadline(self._run_wall_timeout) - now for worker in busy))
+    
+    def _collect(self, worker, progress):
+        """Drain a worker's messages and enforce its budgets; returns finished jobs"""
+        finished = []
+        job_id = worker.job_id
+        
+        try:
+            while worker.conn.poll():
+                message = worker.conn.recv()
+                if message[0] == 'started':
+                    worker.acknowledge()
+                elif message[0] == 'page':
+                    _, _, page_number, frame, page_count = message
+                    job_progress = progress[job_id]
+                    job_progress['pages'][page_number] = worker.unpack(job_progress['decoder'], frame)
+                    job_progress['page_count'] = page_count
+                elif message[0] == 'done':
+                    finished.append((job_id, self._assemble(message[2], progress.pop(job_id))))
+                    worker.finish_job()
+                    if self._due_for_recycling(worker):
+                        self._recycle_worker(worker)
+                    return finished
+        except (EOFError, OSError):
+            pass
+        
+        if not worker.process.is_alive():
+            reason, timed_out = _exit_reason(worker.process.exitcode, self.cpu_timeout)
+            logger.warning(f"Job {job_id[0]} (shard {job_id[1]}): {reason}")
+            finished.append((job_id, self._partial_result(progress.pop(job_id), reason, timed_out)))
+            self._replace_worker(worker)
+        elif self._run_wall_timeout and time.monotonic() > worker.deadline(self._run_wall_timeout):
+            reason = worker.timeout_reason(self._run_wall_timeout)
+            logger.warning(f"Job {job_id[0]} (shard {job_id[1]}): {reason}, replacing worker")
+            finished.append((job_id, self._partial_result(progress.pop(job_id), reason, True)))
+            self._replace_worker(worker)
+        
+        return finished
+    
+    def _assemble(self, result, job_progress):
+        """Attach the streamed placements to a worker's final result"""
+        if result.get('error'):
+            return result
+        result['pages'] = job_progress['pages']
+        return result
+    
+    def _partial_result(self, job_progress, reason, timed_out):
+        """Result for a job whose worker was stopped, keeping the pages it finished"""
+        return {
+            'error': reason,
+            'timed_out': timed_out,
+            'partial': True,
+            'total_pages': job_progress['page_count'],
+            'pages': job_progress['pages']
+        }
+    
+    def _merge_shards(self, shard_results, selection):
+        """Combine the results of a document's shards into one analysis result"""
+        results = [shard_results[shard] for shard in sorted(shard_results)]
+        failed = [result for result in results if result.get('error')]
+        if any(not result.get('partial') for result in failed):
+            # The document itself could not be analyzed; every shard reports the same error
+            return next(result for result in failed if not result.get('partial'))
+        
+        pages = {}
+        for result in results:
+            pages.update(result.pop('pages'))
+        images = _ordered_images(pages)
+        
+        merged = dict(results[0]) if not failed else {}
+        merged.update({
+            'error': failed[0]['error'] if failed else None,
+            'total_pages': max(result['total_pages'] for result in results),
+            'total_images': len(images),
+            'total_placements': len(images),
+            'unique_images': len({img['xref'] for img in images if img.get('xref')}),
+            'analyzed_pages': sorted(pages),
+            'images': images
+        })
+        if failed:
+            merged['timed_out'] = any(result['timed_out'] for result in failed)
+            merged['partial'] = True
+            return merged
+        
+        if len(results) > 1:
+            merged['selection'] = dict(merged['selection'], pages=selection)
+            merged['page_fingerprints'] = {}
+            for result in results:
+                merged['page_fingerprints'].update(result['page_fingerprints'])
+            merged['memory'] = dict(
+                merged['memory'],
+                peak_rss_bytes=max(result['memory']['peak_rss_bytes'] for result in results),
+                metadata_only_images=sum(result['memory']['metadata_only_images'] for result in results)
+            )
+            if 'incremental' in merged:
+                merged['incremental'] = {
+                    key: sorted(page for result in results for page in result['incremental'][key])
+                    for key in merged['incremental']
+                }
+        return merged
+    
+    def warm_up(self):
+        """Run a small one-image document on every worker
+        
+        Workers import PyMuPDF and the analyzer when they start, but Pillow, NumPy and
+        the image index are loaded by the first image analyzed; this takes both costs
+        out of the first real analysis.
+        """
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(72, 72, 144, 144), pixmap=fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False))
+        pdf_data = doc.tobytes()
+        doc.close()
+        
+        jobs = [(f"warm-up {number}", pdf_data, {}) for number in range(self.worker_count)]
+        for _ in self.analyze(jobs, wall_timeout=0):
+            pass
+    
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("Analyzer pool is closed")
+    
+    def close(self):
+        """Stop all worker processes, after any run in progress"""
+        with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+_shared_pool = None
+_shared_pool_key = None
+_shared_pool_lock = threading.Lock()
+
+def get_shared_pool(**pool_options):
+    """The process-wide :class:`AnalyzerPool`, started on first use
+    
+    Lets a launcher start and warm the pool ahead of the app, which then picks up
+    the same workers. There is only ever one pool, so the process's memory stays
+    bounded: asking for different constructor options (such as another memory
+    budget) closes the current pool, after any run in progress, before starting
+    the new one. Callers arriving meanwhile wait for it.
+    """
+    global _shared_pool, _shared_pool_key
+    key = json.dumps(pool_options, sort_keys=True, default=str)
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool_key != key:
+            logger.info("Analyzer pool options changed, replacing the shared pool")
+            _shared_pool.close()
+            _shared_pool = None
+        if _shared_pool is None:
+            _shared_pool = AnalyzerPool(**pool_options)
+            _shared_pool_key = key
+        return _shared_pool
+
+class AnalysisStopped(RuntimeError):
+    """Raised by :meth:`AsyncAnalyzer.iter_placements` when a worker is stopped by a budget or dies"""
+
+class AsyncAnalyzer:
+    """asyncio front end to analyzer worker processes
+    
+    Each document runs in its own worker process, so the event loop never blocks on
+    PDF work and many documents can be analyzed concurrently; ``max_workers`` bounds
+    how many run at once and further documents wait for a free worker. Workers are
+    reused between documents once they answer a health check.
+    
+    Cancelling a task that awaits :meth:`analyze_pdf_async`, or closing an
+    :meth:`iter_placements` iterator early, kills the document's worker. Placements
+    are streamed back through a pipe that is only read as the consumer asks for
+    more, so a slow consumer stalls its worker instead of buffering the document.
+    """
+    
+    def __init__(self, max_workers=None, wall_timeout=None, cpu_timeout=None, analyzer_options=None):
+        self.analyzer_options = analyzer_options or {}
+        self.max_workers = max_workers or default_worker_count(self.analyzer_options.get('memory_budget_bytes'))
+        self.wall_timeout = wall_timeout
+        self.cpu_timeout = cpu_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._idle_workers = []
+        self._slots = None
+        # Threads only wait on worker pipes; PDF work stays in the worker processes
+        self._receivers = ThreadPoolExecutor(max_workers=self.max_workers)
+    
+    async def analyze_pdf_async(self, pdf_data, **analyze_options):
+        """Analyze a PDF without blocking the event loop
+        
+        Takes the same options as :meth:`PDFAnalyzer.analyze_pdf` (except ``on_page``)
+        and returns the same result. A document stopped by a budget is returned with
+        the pages finished so far, marked ``partial`` as in :class:`AnalyzerPool`.
+        """
+        pages = {}
+        page_count = 0
+        messages = self._run(pdf_data, analyze_options)
+        try:
+            async for message in messages:
+                if message[0] == 'page':
+                    _, page_number, page_images, page_count = message
+                    pages[page_number] = page_images
+                elif message[0] == 'done':
+                    result = message[1]
+                    if not result.get('error'):
+                        result['images'] = _ordered_images(pages)
+                    return result
+                else:
+                    _, reason, timed_out = message
+                    images = _ordered_images(pages)
+                    return {
+                        'error': reason,
+                        'timed_out': timed_out,
+                        'partial': True,
+                        'total_pages': page_count,
+                        'total_images': len(images),
+                        'total_placements': len(images),
+                        'unique_images': len({img['xref'] for img in images if img.get('xref')}),
+                        'analyzed_pages': sorted(pages),
+                        'images': images
+                    }
+        finally:
+            await messages.aclose()
+    
+    async def iter_placements(self, pdf_data, **analyze_options):
+        """Yield the document's placements in page order as pages are analyzed
+        
+        Raises ``ValueError`` if the document cannot be analyzed and
+        :class:`AnalysisStopped` if its worker is stopped part way.
+        """
+        placement_number = 0
+        messages = self._run(pdf_data, analyze_options)
+        try:
+            async for message in messages:
+                if message[0] == 'page':
+                    for img_data in message[2]:
+                        placement_number += 1
+                        img_data['image_number'] = placement_number
+                        yield img_data
+                elif message[0] == 'done':
+                    if message[1].get('error'):
+                        raise ValueError(message[1]['error'])
+                else:
+                    raise AnalysisStopped(message[1])
+        finally:
+            # Closing early (or being cancelled) stops the worker straight away
+            await messages.aclose()
+    
+    async def _run(self, pdf_data, analyze_options):
+        """Run one document on a worker, yielding its messages without the job id
+        
+        Yields ``('page', page_number, page_images, page_count)`` messages, then
+        either ``('done', result)`` or ``('stopped', reason, timed_out)``. The worker is
+        released before the last message; if the generator is closed or cancelled
+        before that, the worker is killed.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        
+        async with self._slots:
+            worker = await self._checkout_worker()
+            released = False
+            segment = share_document(pdf_data)
+            job = (document_ref(segment, pdf_data), analyze_options)
+            decoder = PlacementDecoder()
+            try:
+                while True:
+                    try:
+                        message = await self._receive(worker, job)
+                        job = None
+                    except asyncio.TimeoutError:
+                        reason, timed_out = worker.timeout_reason(self.wall_timeout), True
+                    except (EOFError, OSError):
+                        await asyncio.get_running_loop().run_in_executor(None, worker.process.join, 1)
+                        reason, timed_out = _exit_reason(worker.process.exitcode, self.cpu_timeout)
+                    else:
+                        if message[0] == 'started':
+                            worker.acknowledge()
+                            continue
+                        if message[0] == 'page':
+                            _, _, page_number, frame, page_count = message
+                            yield ('page', page_number, worker.unpack(decoder, frame), page_count)
+                            continue
+                        worker.finish_job()
+                        self._idle_workers.append(worker)
+                        released = True
+                        yield ('done', message[2])
+                        return
+                    
+                    logger.warning(f"{reason}, replacing worker")
+                    released = True
+                    await self._kill(worker)
+                    yield ('stopped', reason, timed_out)
+                    return
+            finally:
+                release_document(segment)
+                if not released:
+                    await self._kill(worker)
+    
+    async def _checkout_worker(self):
+        """Take an idle worker that still answers a ping, or start a new one
+        
+        Idle workers can die or hang between documents; those are killed and
+        skipped. Pings and kills run off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        while self._idle_workers:
+            worker = self._idle_workers.pop()
+            try:
+                healthy = worker.process.is_alive() and await loop.run_in_executor(None, worker.ping)
+            except asyncio.CancelledError:
+                await self._kill(worker)
+                raise
+            if healthy:
+                return worker
+            logger.warning(f"Idle worker failed its health check (exit code {worker.process.exitcode}), replacing it")
+            await self._kill(worker)
+        return _Worker(self._context, self.analyzer_options)
+    
+    async def _kill(self, worker):
+        """Kill a worker without blocking the event loop on its exit"""
+        # The kill is submitted at once, so it completes even if this await is cancelled
+        await asyncio.get_running_loop().run_in_executor(None, worker.kill)
+    
+    async def _receive(self, worker, job=None):
+        """Send ``job`` if given, then wait for the worker's next message, off the event loop"""
+        def exchange():
+            if job:
+                worker.send_job('async', *job, self.cpu_timeout)
+            return worker.conn.recv()
+        
+        timeout = None
+        if self.wall_timeout:
+            # A job's first message is the acknowledgement, which has the startup allowance
+            deadline = time.monotonic() + HEALTH_CHECK_TIMEOUT if job else worker.deadline(self.wall_timeout)
+            timeout = max(0.0, deadline - time.monotonic())
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._receivers, exchange), timeout)
+    
+    async def close(self):
+        """Stop the idle workers; documents still running are not waited for"""
+        receivers, self._receivers = self._receivers, None
+        workers, self._idle_workers = self._idle_workers, []
+        loop = asyncio.get_running_loop()
+        for worker in workers:
+            await loop.run_in_executor(None, worker.stop)
+        receivers.shutdown(wait=False)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()